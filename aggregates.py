@@ -0,0 +1,187 @@
+import json
+
+import numpy as np
+
+DR_STAGE_COUNT = 5
+HIGH_RISK_STAGE = 3
+
+# Numeric patient columns whose covariance is tracked, the union of every correlation heatmap's columns
+RISK_FACTOR_COLUMNS = ['age', 'diabetes_duration', 'hba1c', 'bp_systolic', 'dr_stage', 'risk_score']
+
+
+class CovarianceAccumulator:
+    """Streaming, mergeable means and co-moment matrix over a fixed list of columns
+
+    Single patients are folded in with Welford's update and taken out with
+    its inverse. Chunks and partial accumulators from other workers are
+    combined with the pairwise merge of Chan et al., so a cohort larger
+    than memory can be processed one chunk at a time. Reading a covariance
+    or correlation matrix is O(k²) in the number of columns and never
+    touches patient rows.
+    """
+
+    def __init__(self, columns=RISK_FACTOR_COLUMNS, count=0, mean=None, comoment=None):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.count = count
+        self.mean = np.zeros(size) if mean is None else np.array(mean, dtype=float)
+        self.comoment = np.zeros((size, size)) if comoment is None else np.array(comoment, dtype=float)
+
+    @classmethod
+    def from_columns(cls, columns, names=RISK_FACTOR_COLUMNS):
+        """Build an accumulator from a mapping of column arrays, such as a DataFrame or one chunk"""
+        data = np.column_stack([np.asarray(columns[name], dtype=float) for name in names])
+        if not len(data):
+            return cls(names)
+
+        mean = data.mean(axis=0)
+        centered = data - mean
+        return cls(names, len(data), mean, centered.T @ centered)
+
+    @classmethod
+    def from_chunks(cls, chunks, names=RISK_FACTOR_COLUMNS):
+        """Accumulate an iterable of column mappings, holding one chunk in memory at a time"""
+        accumulator = cls(names)
+        for chunk in chunks:
+            accumulator.merge(cls.from_columns(chunk, names))
+        return accumulator
+
+    def _vector(self, patient):
+        return np.array([float(patient[column]) for column in self.columns])
+
+    def add(self, patient):
+        values = self._vector(patient)
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.comoment += np.outer(delta, values - self.mean)
+
+    def remove(self, patient):
+        if self.count <= 1:
+            self.__init__(self.columns)
+            return
+
+        values = self._vector(patient)
+        previous_mean = (self.count * self.mean - values) / (self.count - 1)
+        self.comoment -= np.outer(values - previous_mean, values - self.mean)
+        self.mean = previous_mean
+        self.count -= 1
+
+    def replace(self, old_patient, new_patient):
+        self.remove(old_patient)
+        self.add(new_patient)
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError(f"cannot merge accumulators over {other.columns} into {self.columns}")
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.comoment = other.count, other.mean.copy(), other.comoment.copy()
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * (self.count * other.count / count)
+        self.count = count
+
+    def covariance(self, columns=None, ddof=1):
+        """Covariance matrix of `columns` (all tracked columns by default), matching `DataFrame.cov`"""
+        index = [self.columns.index(column) for column in columns or self.columns]
+        if self.count <= ddof:
+            return np.full((len(index), len(index)), np.nan)
+        return self.comoment[np.ix_(index, index)] / (self.count - ddof)
+
+    def correlation(self, columns=None):
+        """Pearson correlation matrix of `columns`, matching `DataFrame.corr`"""
+        covariance = self.covariance(columns)
+        std = np.sqrt(np.diag(covariance))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = covariance / np.outer(std, std)
+        return np.clip(correlation, -1.0, 1.0)
+
+    def to_dict(self):
+        return {"columns": self.columns, "count": self.count, "mean": self.mean.tolist(),
+                "comoment": self.comoment.tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state["columns"], state["count"], state["mean"], state["comoment"])
+
+
+class CohortAggregates:
+    """Running totals behind the sidebar Quick Stats
+
+    Counts, the HbA1c sum and the DR stage histogram are kept as plain
+    numbers, so adding, removing or changing a patient is O(1) and reading
+    the stats never touches patient rows. The risk-factor covariance behind
+    the correlation heatmaps is maintained alongside them.
+    """
+
+    def __init__(self, count=0, hba1c_sum=0.0, stage_counts=None, covariance=None):
+        self.count = count
+        self.hba1c_sum = hba1c_sum
+        self.stage_counts = list(stage_counts) if stage_counts is not None else [0] * DR_STAGE_COUNT
+        self.covariance = covariance if covariance is not None else CovarianceAccumulator()
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build aggregates from a mapping of column arrays in one vectorized pass"""
+        hba1c = np.asarray(columns['hba1c'], dtype=float)
+        dr_stage = np.asarray(columns['dr_stage'], dtype=np.int64)
+        return cls(len(hba1c), float(hba1c.sum()),
+                   np.bincount(dr_stage, minlength=DR_STAGE_COUNT).tolist(),
+                   CovarianceAccumulator.from_columns(columns))
+
+    def add(self, patient):
+        self.count += 1
+        self.hba1c_sum += patient['hba1c']
+        self.stage_counts[int(patient['dr_stage'])] += 1
+        self.covariance.add(patient)
+
+    def remove(self, patient):
+        self.count -= 1
+        self.hba1c_sum -= patient['hba1c']
+        self.stage_counts[int(patient['dr_stage'])] -= 1
+        self.covariance.remove(patient)
+
+    def replace(self, old_patient, new_patient):
+        self.remove(old_patient)
+        self.add(new_patient)
+
+    def merge(self, other):
+        self.count += other.count
+        self.hba1c_sum += other.hba1c_sum
+        self.stage_counts = [a + b for a, b in zip(self.stage_counts, other.stage_counts)]
+        self.covariance.merge(other.covariance)
+
+    @property
+    def high_risk(self):
+        return sum(self.stage_counts[HIGH_RISK_STAGE:])
+
+    @property
+    def avg_hba1c(self):
+        return self.hba1c_sum / self.count if self.count else 0.0
+
+    def quick_stats(self):
+        return {
+            "total_patients": self.count,
+            "high_risk": self.high_risk,
+            "avg_hba1c": self.avg_hba1c,
+            "stage_counts": list(self.stage_counts)
+        }
+
+    def to_json(self):
+        return json.dumps({"count": self.count, "hba1c_sum": self.hba1c_sum, "stage_counts": self.stage_counts,
+                           "covariance": self.covariance.to_dict()})
+
+    @classmethod
+    def from_json(cls, payload):
+        """Load saved aggregates; `covariance` is `None` for states saved before it was tracked"""
+        state = json.loads(payload)
+        covariance = state.pop("covariance", None)
+        aggregates = cls(**state)
+        aggregates.covariance = CovarianceAccumulator.from_dict(covariance) if covariance else None
+        return aggregates
+
@@ -0,0 +1,190 @@
+import io
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.image_io import decode_fundus_image
+
+# Pipeline stages in order, with the measured fraction of a 2048 px upload's
+# analysis time already spent when each one starts. An image decoded at
+# upload time skips straight to `quality`.
+STAGE_PROGRESS = OrderedDict([
+    ("queued", 0.0),
+    ("decode", 0.0),
+    ("quality", 0.35),
+    ("detection", 0.4),
+    ("scoring", 0.98),
+    ("done", 1.0)
+])
+
+DEFAULT_JOB_WORKERS = int(os.environ.get("DR_ANALYSIS_WORKERS", str(os.cpu_count() or 1)))
+# Finished jobs kept for polling; older ones are forgotten first
+MAX_FINISHED_JOBS = 1024
+
+
+class AnalysisJob:
+    """State of one submitted analysis, updated by the worker thread"""
+
+    def __init__(self, job_id, key):
+        self.id = job_id
+        self.key = key
+        self.status = "queued"
+        self.stage = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Bumped on every stage or status change, so waiters can tell a snapshot is stale
+        self.version = 0
+
+    @property
+    def progress(self):
+        return STAGE_PROGRESS[self.stage]
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def snapshot(self):
+        return {
+            "id": self.id,
+            "version": self.version,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "queued_s": (self.started_at or time.time()) - self.submitted_at,
+            "elapsed_s": ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        }
+
+
+class AnalysisJobManager:
+    """Runs analyses on a thread pool so Streamlit sessions only submit and poll
+
+    `submit` returns a job id immediately. Results already in `cache` finish
+    without touching the pool, and a key that is already being analyzed is
+    attached to the running job instead of being computed twice. The heavy
+    OpenCV and NumPy work releases the GIL, so worker threads run in
+    parallel while the script threads stay responsive.
+    """
+
+    def __init__(self, analyze, cache=None, workers=DEFAULT_JOB_WORKERS):
+        self.analyze = analyze
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dr-analysis")
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._counter = itertools.count()
+
+    def submit(self, source, key=None):
+        """Queue an analysis of `source` and return its job id
+
+        `source` is raw image bytes, a path, or an already decoded image;
+        `key` is its `analysis_key`, or `None` to bypass the cache.
+        """
+        cached = self.cache.get(key) if self.cache is not None and key is not None else None
+
+        with self._lock:
+            if key is not None and key in self._inflight:
+                return self._inflight[key]
+
+            job = AnalysisJob(f"{next(self._counter)}-{uuid.uuid4().hex[:8]}", key)
+            self._jobs[job.id] = job
+            self._forget_finished()
+
+            if cached is not None:
+                self._finish(job, result=cached)
+                return job.id
+
+            if key is not None:
+                self._inflight[key] = job.id
+
+        self._pool.submit(self._run, job, source)
+        return job.id
+
+    def get(self, job_id):
+        """Snapshot of a job's state, or `None` if it is unknown or was forgotten"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job is not None else None
+
+    def wait(self, job_id, since, timeout=None):
+        """Block until the job moves past snapshot version `since` or `timeout` passes, and return a fresh snapshot
+
+        Returns `None` if the job is unknown or was forgotten.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: job_id not in self._jobs or self._jobs[job_id].version != since,
+                                   timeout)
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def _run(self, job, source):
+        with self._changed:
+            job.started_at = time.time()
+            job.status = "running"
+            self._changed_locked(job)
+
+        def report(stage):
+            with self._changed:
+                job.stage = stage
+                self._changed_locked(job)
+
+        def compute():
+            image = source
+            if isinstance(source, (bytes, str)):
+                report("decode")
+                image, _ = decode_fundus_image(io.BytesIO(source) if isinstance(source, bytes) else source)
+            return self.analyze(image, progress=report)
+
+        try:
+            if self.cache is not None and job.key is not None:
+                result = self.cache.get_or_compute(job.key, compute)
+            else:
+                result = compute()
+        except Exception as exc:
+            with self._lock:
+                self._finish(job, error=str(exc))
+            return
+
+        with self._lock:
+            self._finish(job, result=result)
+
+    def _finish(self, job, result=None, error=None):
+        job.result = result
+        job.error = error
+        job.status = "failed" if error is not None else "done"
+        if error is None:
+            job.stage = "done"
+        job.finished_at = time.time()
+        if job.started_at is None:
+            job.started_at = job.finished_at
+        if job.key is not None and self._inflight.get(job.key) == job.id:
+            del self._inflight[job.key]
+        self._changed_locked(job)
+
+    def _changed_locked(self, job):
+        # Callers hold the lock
+        job.version += 1
+        self._changed.notify_all()
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
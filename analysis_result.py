@@ -0,0 +1,199 @@
+import struct
+
+import numpy as np
+
+from utils.dr_engine import DR_STAGES, LESION_TYPES, recommendations_for, risk_assessment_from_flags
+
+# One record per lesion: centroid in analysis-image pixels plus its index into LESION_TYPES
+LOCATION_DTYPE = np.dtype([("x", "<u2"), ("y", "<u2"), ("lesion", "u1")])
+
+QUALITY_FACTORS = ("focus", "illumination", "contrast", "artifact_level")
+QUALITY_GRADES = ("Excellent", "Good", "Acceptable")
+DISTRIBUTIONS = ("focal", "clustered", "scattered")
+# Stages timed by `detect_lesions`, stored in this order
+TIMING_STAGES = ("green_channel", "fov_mask", "denoise", "dark_tophat", "bright_tophat", "components",
+                 "classification")
+
+FORMAT_MAGIC = b"DRA1"
+# magic, severity, risk flags, macular involvement, quality grade, distribution, location count,
+# then confidence, processing time, progression risk, quality score, the quality factors,
+# microaneurysm density, hemorrhage size variance, exudate intensity and the stage timings as doubles
+_HEADER = struct.Struct(f"<4sBBBBBI{7 + len(QUALITY_FACTORS) + len(TIMING_STAGES)}d")
+
+
+class AnalysisResult:
+    """Compact, typed form of one fundus analysis
+
+    Lesion centroids of every type share one structured array of
+    `LOCATION_DTYPE` records, and everything else is a scalar slot.
+    Stage information, the risk list and recommendations are derived on
+    access rather than stored. `to_bytes` packs a result into a fixed
+    header followed by the raw location records; pickling goes through
+    the same format, so the analysis cache stores it too.
+    """
+
+    __slots__ = ("severity_score", "confidence", "processing_time", "progression_risk", "risk_flags",
+                 "quality_score", "quality_factors", "quality_grade", "locations", "microaneurysm_density",
+                 "hemorrhage_size_variance", "exudate_intensity", "macular_involvement",
+                 "cotton_wool_distribution", "stage_timings")
+
+    def __init__(self, severity_score, confidence, processing_time, progression_risk, risk_flags,
+                 quality_score, quality_factors, quality_grade, locations, microaneurysm_density,
+                 hemorrhage_size_variance, exudate_intensity, macular_involvement, cotton_wool_distribution,
+                 stage_timings):
+        self.severity_score = severity_score
+        self.confidence = confidence
+        self.processing_time = processing_time
+        self.progression_risk = progression_risk
+        self.risk_flags = risk_flags
+        self.quality_score = quality_score
+        self.quality_factors = quality_factors
+        self.quality_grade = quality_grade
+        self.locations = locations
+        self.microaneurysm_density = microaneurysm_density
+        self.hemorrhage_size_variance = hemorrhage_size_variance
+        self.exudate_intensity = exudate_intensity
+        self.macular_involvement = macular_involvement
+        self.cotton_wool_distribution = cotton_wool_distribution
+        self.stage_timings = stage_timings
+
+    @classmethod
+    def from_analysis(cls, features, severity_score, risk_flags, confidence, processing_time, progression_risk,
+                      image_quality, stage_timings):
+        """Build a result from the `features` and quality dicts the detection pipeline produces"""
+        locations = np.concatenate([
+            _location_records(features[lesion]["locations"], code) for code, lesion in enumerate(LESION_TYPES)
+        ])
+        return cls(
+            severity_score=int(severity_score),
+            confidence=float(confidence),
+            processing_time=float(processing_time),
+            progression_risk=float(progression_risk),
+            risk_flags=int(risk_flags),
+            quality_score=float(image_quality["score"]),
+            quality_factors=tuple(float(image_quality["factors"][factor]) for factor in QUALITY_FACTORS),
+            quality_grade=image_quality["grade"],
+            locations=locations,
+            microaneurysm_density=float(features["microaneurysms"]["density"]),
+            hemorrhage_size_variance=float(features["hemorrhages"]["size_variance"]),
+            exudate_intensity=float(features["exudates"]["intensity"]),
+            macular_involvement=bool(features["exudates"]["macular_involvement"]),
+            cotton_wool_distribution=features["cotton_wool_spots"]["distribution"],
+            stage_timings=tuple(float(stage_timings.get(stage, np.nan)) for stage in TIMING_STAGES)
+        )
+
+    @property
+    def lesion_counts(self):
+        counts = np.bincount(self.locations["lesion"], minlength=len(LESION_TYPES))
+        return dict(zip(LESION_TYPES, counts.tolist()))
+
+    def lesion_locations(self, lesion):
+        """Structured `(x, y)` centroids of one lesion type"""
+        return self.locations[["x", "y"]][self.locations["lesion"] == LESION_TYPES.index(lesion)]
+
+    @property
+    def stage_info(self):
+        return DR_STAGES[self.severity_score]
+
+    @property
+    def risk_assessment(self):
+        return risk_assessment_from_flags(self.risk_flags)
+
+    @property
+    def recommendations(self):
+        return recommendations_for(self.severity_score, self.macular_involvement,
+                                   self.lesion_counts["hemorrhages"])
+
+    @property
+    def image_quality(self):
+        return {
+            "score": self.quality_score,
+            "factors": dict(zip(QUALITY_FACTORS, self.quality_factors)),
+            "grade": self.quality_grade
+        }
+
+    @property
+    def features(self):
+        """The nested `features` dict of the original analysis format"""
+        counts = self.lesion_counts
+
+        def locations(lesion):
+            return [tuple(point) for point in self.lesion_locations(lesion).tolist()]
+
+        return {
+            "microaneurysms": {
+                "count": counts["microaneurysms"],
+                "density": self.microaneurysm_density,
+                "locations": locations("microaneurysms")
+            },
+            "hemorrhages": {
+                "count": counts["hemorrhages"],
+                "size_variance": self.hemorrhage_size_variance,
+                "locations": locations("hemorrhages")
+            },
+            "exudates": {
+                "count": counts["exudates"],
+                "intensity": self.exudate_intensity,
+                "macular_involvement": self.macular_involvement,
+                "locations": locations("exudates")
+            },
+            "cotton_wool_spots": {
+                "count": counts["cotton_wool_spots"],
+                "distribution": self.cotton_wool_distribution,
+                "locations": locations("cotton_wool_spots")
+            }
+        }
+
+    def to_dict(self):
+        """Expand into the nested dict `generate_comprehensive_analysis` used to return"""
+        return {
+            "features": self.features,
+            "severity_score": self.severity_score,
+            "stage_info": self.stage_info,
+            "risk_assessment": self.risk_assessment,
+            "confidence": self.confidence,
+            "processing_time": self.processing_time,
+            "stage_timings": {stage: seconds for stage, seconds in zip(TIMING_STAGES, self.stage_timings)
+                              if not np.isnan(seconds)},
+            "image_quality": self.image_quality,
+            "recommendations": self.recommendations,
+            "progression_risk": self.progression_risk
+        }
+
+    def to_bytes(self):
+        header = _HEADER.pack(
+            FORMAT_MAGIC, self.severity_score, self.risk_flags, self.macular_involvement,
+            QUALITY_GRADES.index(self.quality_grade), DISTRIBUTIONS.index(self.cotton_wool_distribution),
+            len(self.locations), self.confidence, self.processing_time, self.progression_risk, self.quality_score,
+            *self.quality_factors, self.microaneurysm_density, self.hemorrhage_size_variance,
+            self.exudate_intensity, *self.stage_timings
+        )
+        return header + self.locations.tobytes()
+
+    @classmethod
+    def from_bytes(cls, payload):
+        fields = _HEADER.unpack_from(payload)
+        if fields[0] != FORMAT_MAGIC:
+            raise ValueError("not a serialized AnalysisResult")
+
+        severity, risk_flags, macular, grade, distribution, location_count = fields[1:7]
+        confidence, processing_time, progression_risk, quality_score = fields[7:11]
+        factors_end = 11 + len(QUALITY_FACTORS)
+        density, size_variance, intensity = fields[factors_end:factors_end + 3]
+
+        return cls(severity, confidence, processing_time, progression_risk, risk_flags, quality_score,
+                   fields[11:factors_end], QUALITY_GRADES[grade],
+                   np.frombuffer(payload, dtype=LOCATION_DTYPE, count=location_count, offset=_HEADER.size),
+                   density, size_variance, intensity, bool(macular), DISTRIBUTIONS[distribution],
+                   fields[factors_end + 3:])
+
+    def __reduce__(self):
+        return AnalysisResult.from_bytes, (self.to_bytes(),)
+
+
+def _location_records(points, code):
+    records = np.empty(len(points), dtype=LOCATION_DTYPE)
+    if len(points):
+        records["x"], records["y"] = np.asarray(points, dtype=np.uint16).T
+    records["lesion"] = code
+    return records
@@ -1,16 +1,15 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from PIL import Image
-import io
-import base64
-from utils.helpers import EnhancedDRHelper, generate_sample_patients
+import os
+import time
 from utils.chatbot import initialize_chat_session, display_chat_interface
 from utils.styles import inject_custom_css, create_feature_card
-from components.charts import create_patient_demographics_chart, create_treatment_effectiveness_chart, \
-    create_progression_timeline
+from utils.patient_store import PatientStore
+from utils.dr_engine import DR_STAGES, TREATMENT_OPTIONS
+from utils.metrics import ANALYSIS_SECONDS, SECTION_RENDER_SECONDS, metrics
+from utils.profiling import RerunProfiler, profiling_enabled
+
+# plotly, cv2, Faker and the analysis modules are imported inside the
+# sections that use them, so a cold start only pays for the page it renders
 
 # Page configuration
 st.set_page_config(
@@ -34,13 +33,83 @@ if 'current_view' not in st.session_state:
 # Initialize helper classes
 @st.cache_resource
 def get_dr_helper():
+    from utils.helpers import EnhancedDRHelper
     return EnhancedDRHelper()
 
 
-dr_helper = get_dr_helper()
+@st.cache_resource
+def get_patient_store():
+    store = PatientStore()
+    store.ensure_cohort()
+    return store
+
+
+@st.cache_resource
+def get_analysis_cache():
+    from utils.result_cache import AnalysisCache
+    return AnalysisCache()
+
+
+@st.cache_resource
+def get_analysis_jobs():
+    # One pool for the whole server, so concurrent sessions queue instead of oversubscribing the CPU
+    from utils.analysis_jobs import AnalysisJobManager
+    return AnalysisJobManager(get_dr_helper().generate_comprehensive_analysis, cache=get_analysis_cache())
+
+
+@st.cache_resource(max_entries=1)
+def get_demographics_charts(store_version):
+    # Built once per store version from an indexed GROUP BY, the running aggregates
+    # and a bounded sample, so no step reads every row, and shared by every session
+    from components.charts import CORRELATION_COLUMNS, SCATTER_COLUMNS, SCATTER_MAX_POINTS, \
+        create_demographics_summary_charts
+    store = get_patient_store()
+    quick_stats = store.quick_stats()
+    return create_demographics_summary_charts(store.value_counts('age'), quick_stats['stage_counts'],
+                                              store.sample(SCATTER_MAX_POINTS, columns=SCATTER_COLUMNS, seed=0),
+                                              quick_stats['total_patients'], store.correlation(CORRELATION_COLUMNS))
+
+
+@st.cache_resource
+def get_patient_filter_index():
+    # Built once with a chunked scan; later writes are applied to it as each session reads it
+    from utils.patient_filters import SharedPatientFilterIndex
+    return SharedPatientFilterIndex(get_patient_store())
+
+
+patient_store = get_patient_store()
+
+# Patient Management shows at most this many rows; the match count is always exact
+PATIENT_TABLE_LIMIT = 500
+# Appointments listed on the Dashboard
+UPCOMING_APPOINTMENTS = 10
+
+# Longest a DR Analysis run waits for a job update before rerunning to refresh its status,
+# which bounds how long a running job holds the script thread per rerun
+ANALYSIS_WAIT_TIMEOUT = 0.5
+ANALYTICS_CORRELATION_COLUMNS = ['age', 'diabetes_duration', 'hba1c', 'bp_systolic', 'risk_score']
+
+
+def profiling_requested():
+    # DR_PROFILE profiles every rerun; ?profile=1 profiles one browser tab
+    if profiling_enabled():
+        return True
+    if hasattr(st, "query_params"):
+        return st.query_params.get("profile") == "1"
+    return st.experimental_get_query_params().get("profile", [""])[0] == "1"
 
 
 def main():
+    if not profiling_requested():
+        render_app()
+        return
+
+    # Each rerun is written as a flame graph named after the section it rendered
+    with RerunProfiler(root_file=__file__) as profiler:
+        render_app(profiler)
+
+
+def render_app(profiler=None):
     # Header with navigation
     col1, col2, col3 = st.columns([1, 2, 1])
 
@@ -52,35 +121,47 @@ def main():
 
     app_mode = st.sidebar.radio(
         "Choose Section",
-        ["🏠 Dashboard", "🔍 DR Analysis", "👥 Patient Management", "💬 AI Assistant", "📚 Knowledge Base", "📊 Analytics"]
+        ["🏠 Dashboard", "🔍 DR Analysis", "👥 Patient Management", "💬 AI Assistant", "📚 Knowledge Base", "📊 Analytics",
+         "📈 Metrics"]
     )
 
+    render_quick_stats()
+
+    # Route to appropriate section, timing each render
+    section = app_mode.split(" ", 1)[1]
+    if profiler is not None:
+        # Labelled before routing, so reruns a section triggers are still named after it
+        profiler.label = section
+    try:
+        with metrics.timer(SECTION_RENDER_SECONDS, section=section):
+            if "Dashboard" in app_mode:
+                show_dashboard()
+            elif "DR Analysis" in app_mode:
+                show_dr_analysis()
+            elif "Patient Management" in app_mode:
+                show_patient_management()
+            elif "AI Assistant" in app_mode:
+                show_ai_assistant()
+            elif "Knowledge Base" in app_mode:
+                show_knowledge_base()
+            elif "Analytics" in app_mode:
+                show_analytics()
+            elif "Metrics" in app_mode:
+                show_metrics()
+    finally:
+        metrics.maybe_write_prometheus()
+
+
+def render_quick_stats():
     # Quick stats in sidebar
     st.sidebar.markdown("---")
     st.sidebar.markdown("## 📈 Quick Stats")
 
-    sample_patients = generate_sample_patients(100)
-    total_patients = len(sample_patients)
-    high_risk = len(sample_patients[sample_patients['dr_stage'] >= 3])
-    avg_hba1c = sample_patients['hba1c'].mean()
-
-    st.sidebar.metric("Total Patients", f"{total_patients:,}")
-    st.sidebar.metric("High Risk Cases", f"{high_risk}")
-    st.sidebar.metric("Avg HbA1c", f"{avg_hba1c:.1f}%")
-
-    # Route to appropriate section
-    if "Dashboard" in app_mode:
-        show_dashboard()
-    elif "DR Analysis" in app_mode:
-        show_dr_analysis()
-    elif "Patient Management" in app_mode:
-        show_patient_management()
-    elif "AI Assistant" in app_mode:
-        show_ai_assistant()
-    elif "Knowledge Base" in app_mode:
-        show_knowledge_base()
-    elif "Analytics" in app_mode:
-        show_analytics()
+    quick_stats = patient_store.quick_stats()
+
+    st.sidebar.metric("Total Patients", f"{quick_stats['total_patients']:,}")
+    st.sidebar.metric("High Risk Cases", f"{quick_stats['high_risk']}")
+    st.sidebar.metric("Avg HbA1c", f"{quick_stats['avg_hba1c']:.1f}%")
 
 
 def show_dashboard():
@@ -108,11 +189,17 @@ def show_dashboard():
         """, unsafe_allow_html=True)
 
     with col3:
-        st.markdown("""
+        # Measured analysis wall time; cache hits are not analyses and are not counted
+        processing = metrics.summary(ANALYSIS_SECONDS)
+        if processing is None:
+            value, detail = "—", "No analyses yet"
+        else:
+            value, detail = f"{processing['mean']:.2f}s", f"p95 {processing['p95']:.2f}s over {processing['count']:,} runs"
+        st.markdown(f"""
         <div class="metric-card">
             <h3>⚡ Avg Processing</h3>
-            <h2>2.3s</h2>
-            <p>-0.5s faster</p>
+            <h2>{value}</h2>
+            <p>{detail}</p>
         </div>
         """, unsafe_allow_html=True)
 
@@ -159,8 +246,7 @@ def show_dashboard():
     # Recent activity and charts
     st.markdown("## 📊 Recent Activity Overview")
 
-    sample_data = generate_sample_patients(50)
-    fig1, fig2, fig3, fig4 = create_patient_demographics_chart(sample_data)
+    fig1, fig2, fig3, fig4 = get_demographics_charts(patient_store.version)
 
     col1, col2 = st.columns(2)
 
@@ -172,11 +258,23 @@ def show_dashboard():
         st.plotly_chart(fig2, use_container_width=True)
         st.plotly_chart(fig4, use_container_width=True)
 
+    # Soonest appointments, read in order from the next_appointment index
+    st.markdown("## 📅 Upcoming Appointments")
+    upcoming = patient_store.upcoming_appointments(UPCOMING_APPOINTMENTS)
+    upcoming['dr_stage'] = upcoming['dr_stage'].map(lambda stage: DR_STAGES[stage]['name'])
+    st.dataframe(upcoming, use_container_width=True, hide_index=True)
+
 
 def show_dr_analysis():
     st.markdown('<h2 class="section-header">🔍 Advanced DR Analysis</h2>', unsafe_allow_html=True)
 
+    analysis_mode = st.radio("Analysis Mode", ["Single Image", "Batch Screening"], horizontal=True)
+    if analysis_mode == "Batch Screening":
+        show_batch_analysis()
+        return
+
     col1, col2 = st.columns([1, 2])
+    analysis_running = False
 
     with col1:
         st.markdown("### 📤 Image Upload")
@@ -188,7 +286,9 @@ def show_dr_analysis():
         )
 
         if uploaded_file is not None:
-            image = Image.open(uploaded_file)
+            image, cache_key = load_uploaded_image(uploaded_file)
+            if image is None:
+                return
             st.image(image, caption="Uploaded Retinal Image", use_column_width=True)
 
             # Analysis options
@@ -203,47 +303,145 @@ def show_dr_analysis():
                 treatment_recommendations = st.checkbox("Treatment Recommendations", value=True)
 
             if st.button("🚀 Start Comprehensive Analysis", type="primary", use_container_width=True):
-                with st.spinner("🔬 Analyzing retinal image with AI..."):
-                    # Simulate processing time
-                    import time
-                    progress_bar = st.progress(0)
-
-                    for i in range(100):
-                        time.sleep(0.02)
-                        progress_bar.progress(i + 1)
+                # Identical images, from this or any other session, are served from the cache
+                st.session_state.analysis_job = get_analysis_jobs().submit(image, cache_key)
 
-                    # Perform analysis
-                    analysis_results = dr_helper.generate_comprehensive_analysis(image)
-                    st.session_state.analysis_results = analysis_results
+            job = current_analysis_job()
+            analysis_running = show_analysis_job_status(job)
 
-                    st.success("✅ Analysis completed successfully!")
+            cache_stats = get_analysis_cache().stats()
+            st.caption(f"Analysis cache: {cache_stats['hit_rate']:.0%} hit rate, "
+                       f"{cache_stats['avg_miss_latency_s']:.2f}s average miss latency")
 
         else:
             # Demo option
             st.markdown("### 🎯 Quick Demo")
             if st.button("Use Sample Image for Demonstration", use_container_width=True):
                 # Create sample image
+                from PIL import Image
+
                 sample_image = Image.new('RGB', (512, 512), color='darkred')
-                analysis_results = dr_helper.generate_comprehensive_analysis(sample_image)
+                analysis_results = get_dr_helper().generate_comprehensive_analysis(sample_image)
                 st.session_state.analysis_results = analysis_results
                 st.rerun()
 
     with col2:
-        if st.session_state.analysis_results:
-            display_comprehensive_results(st.session_state.analysis_results)
-        else:
-            show_analysis_guidelines()
+        show_analysis_results()
+
+    if analysis_running:
+        # The job runs on the shared pool. Wait once, briefly, for its next stage
+        # change and rerun to show it, so the script thread is never held until it finishes
+        get_analysis_jobs().wait(job['id'], since=job['version'], timeout=ANALYSIS_WAIT_TIMEOUT)
+        st.rerun()
+
+
+def show_analysis_results():
+    if st.session_state.analysis_results is not None:
+        display_comprehensive_results(st.session_state.analysis_results)
+    else:
+        show_analysis_guidelines()
+
+
+def current_analysis_job():
+    """Snapshot of this session's analysis job, or `None` if there is none"""
+    job_id = st.session_state.get("analysis_job")
+    return get_analysis_jobs().get(job_id) if job_id is not None else None
+
+
+def show_analysis_job_status(job):
+    """Show the progress of an analysis job snapshot, returning True while it is still running"""
+    if job is None:
+        st.session_state.analysis_job = None
+        return False
+
+    if job['status'] in ("queued", "running"):
+        label = "Waiting for a free analysis worker..." if job['status'] == "queued" \
+            else f"🔬 Analyzing retinal image: {job['stage']}..."
+        st.progress(job['progress'], text=label)
+        return True
+
+    st.session_state.analysis_job = None
+    if job['status'] == "failed":
+        st.error(f"❌ Analysis failed: {job['error']}")
+    else:
+        st.session_state.analysis_results = job['result']
+        st.success(f"✅ Analysis completed successfully in {job['elapsed_s']:.2f}s!")
+    return False
+
+
+def load_uploaded_image(uploaded_file):
+    """Decode an upload once per session into the buffer shared by the preview and the analyzer
+
+    Returns the image and its analysis cache key, or `(None, None)` if the
+    file cannot be decoded.
+    """
+    cached = st.session_state.get("decoded_upload")
+    if cached is not None and cached[0] == uploaded_file.file_id:
+        return cached[1], cached[2]
+
+    from utils.image_io import decode_fundus_image
+    from utils.result_cache import analysis_key
+
+    try:
+        image, _ = decode_fundus_image(uploaded_file)
+    except (OSError, ValueError) as exc:
+        st.error(f"❌ Could not read this image: {exc}")
+        return None, None
+
+    # Only the current upload is kept, so a session holds at most one decoded image
+    cache_key = analysis_key(uploaded_file.getvalue())
+    st.session_state.decoded_upload = (uploaded_file.file_id, image, cache_key)
+    return image, cache_key
+
+
+def show_batch_analysis():
+    """Analyze many uploaded images in a process pool, streaming rows into a results table"""
+    import pandas as pd
+    from utils.batch_analysis import run_batch
+
+    uploaded_files = st.file_uploader(
+        "Upload Retinal Fundus Images",
+        type=['png', 'jpg', 'jpeg', 'tiff'],
+        accept_multiple_files=True,
+        help="Select a whole screening session at once"
+    )
+
+    max_workers = os.cpu_count() or 1
+    workers = st.number_input("Worker Processes", min_value=1, max_value=max_workers, value=max_workers)
+
+    if uploaded_files and st.button("🚀 Start Batch Analysis", type="primary", use_container_width=True):
+        progress_bar = st.progress(0)
+        table = st.empty()
+        rows = []
+        start = time.perf_counter()
+
+        for row in run_batch([(f.name, f.getvalue()) for f in uploaded_files], workers):
+            rows.append(row)
+            progress_bar.progress(len(rows) / len(uploaded_files))
+            table.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+        elapsed = time.perf_counter() - start
+        st.session_state.batch_results = pd.DataFrame(rows).sort_values("image")
+        st.success(f"✅ Analyzed {len(rows)} images in {elapsed:.1f}s ({len(rows) / elapsed:.1f} images/s)")
+        table.empty()
+
+    if st.session_state.get("batch_results") is not None:
+        batch_results = st.session_state.batch_results
+        st.markdown(f"### 📋 Batch Results ({len(batch_results)} images)")
+        st.dataframe(batch_results, use_container_width=True, height=400)
+        st.download_button("📥 Download Results (CSV)", batch_results.to_csv(index=False),
+                           file_name="batch_results.csv", mime="text/csv")
 
 
 def display_comprehensive_results(results):
-    """Display comprehensive analysis results"""
+    """Display an `AnalysisResult`"""
     st.markdown("## 📋 Comprehensive Analysis Report")
 
     # Severity Overview
     col1, col2 = st.columns([1, 2])
 
     with col1:
-        st.plotly_chart(dr_helper.create_enhanced_severity_gauge(results['severity_score']),
+        st.plotly_chart(get_dr_helper().create_enhanced_severity_gauge(results.severity_score),
                         use_container_width=True)
 
         # Key metrics
@@ -251,15 +449,15 @@ def display_comprehensive_results(results):
         col_a, col_b = st.columns(2)
 
         with col_a:
-            st.metric("Confidence Score", f"{results['confidence']:.1%}")
-            st.metric("Processing Time", f"{results['processing_time']:.2f}s")
+            st.metric("Confidence Score", f"{results.confidence:.1%}")
+            st.metric("Processing Time", f"{results.processing_time:.2f}s")
 
         with col_b:
-            st.metric("Image Quality", results['image_quality']['grade'])
-            st.metric("Progression Risk", f"{results['progression_risk']:.1%}")
+            st.metric("Image Quality", results.quality_grade)
+            st.metric("Progression Risk", f"{results.progression_risk:.1%}")
 
     with col2:
-        stage_info = results['stage_info']
+        stage_info = results.stage_info
         st.markdown(f"### 🎯 Current Stage: **{stage_info['name']}**")
         st.markdown(f"**Description:** {stage_info['description']}")
         st.markdown(
@@ -270,22 +468,22 @@ def display_comprehensive_results(results):
     # Detailed Features
     st.markdown("## 🔍 Detailed Feature Analysis")
 
-    features = results['features']
+    counts = results.lesion_counts
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        st.metric("Microaneurysms", features['microaneurysms']['count'])
+        st.metric("Microaneurysms", counts['microaneurysms'])
     with col2:
-        st.metric("Hemorrhages", features['hemorrhages']['count'])
+        st.metric("Hemorrhages", counts['hemorrhages'])
     with col3:
-        st.metric("Exudates", features['exudates']['count'])
+        st.metric("Exudates", counts['exudates'])
     with col4:
-        st.metric("Cotton Wool Spots", features['cotton_wool_spots']['count'])
+        st.metric("Cotton Wool Spots", counts['cotton_wool_spots'])
 
     # Risk Assessment
     st.markdown("## ⚠️ Comprehensive Risk Assessment")
 
-    for risk in results['risk_assessment']:
+    for risk in results.risk_assessment:
         risk_class = f"risk-{risk['level'].replace(' ', '-').lower()}"
         st.markdown(f"- <span class='{risk_class}'>{risk['type']}</span>",
                     unsafe_allow_html=True)
@@ -293,7 +491,7 @@ def display_comprehensive_results(results):
     # Recommendations
     st.markdown("## 💡 Treatment & Management Recommendations")
 
-    for i, recommendation in enumerate(results['recommendations'], 1):
+    for i, recommendation in enumerate(results.recommendations, 1):
         st.markdown(f"{i}. **{recommendation}**")
 
     # Action Buttons
@@ -354,9 +552,6 @@ def show_analysis_guidelines():
 def show_patient_management():
     st.markdown('<h2 class="section-header">👥 Advanced Patient Management</h2>', unsafe_allow_html=True)
 
-    # Generate sample patient data
-    patients_df = generate_sample_patients(100)
-
     # Filters
     col1, col2, col3, col4 = st.columns(4)
 
@@ -369,21 +564,30 @@ def show_patient_management():
     with col4:
         risk_level = st.selectbox("Risk Level", ["All", "Low", "Moderate", "High", "Very High"])
 
-    # Filter data
-    filtered_df = patients_df[
-        (patients_df['age'] >= age_range[0]) &
-        (patients_df['age'] <= age_range[1]) &
-        (patients_df['dr_stage'].isin(dr_stages)) &
-        (patients_df['hba1c'] >= hba1c_range[0]) &
-        (patients_df['hba1c'] <= hba1c_range[1])
-        ]
+    filter_index = get_patient_filter_index().current()
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        genders = st.multiselect("Gender", filter_index.values('gender'), default=filter_index.values('gender'))
+    with col2:
+        diabetes_types = st.multiselect("Diabetes Type", filter_index.values('diabetes_type'),
+                                        default=filter_index.values('diabetes_type'))
 
     if risk_level != "All":
         risk_mapping = {"Low": [0, 1], "Moderate": [2], "High": [3], "Very High": [4]}
-        filtered_df = filtered_df[filtered_df['dr_stage'].isin(risk_mapping[risk_level])]
+        dr_stages = [stage for stage in dr_stages if stage in risk_mapping[risk_level]]
+
+    # Filter data
+    row_positions = filter_index.filter(age_range=age_range, hba1c_range=hba1c_range, dr_stage=dr_stages,
+                                        gender=genders, diabetes_type=diabetes_types)
+    total_found = len(row_positions)
+    filtered_df = patient_store.fetch_rowids(filter_index.rowids[row_positions[:PATIENT_TABLE_LIMIT]])
 
     # Display patient data
-    st.markdown(f"### 📋 Patient Records ({len(filtered_df)} found)")
+    st.markdown(f"### 📋 Patient Records ({total_found:,} found)")
+    if total_found > len(filtered_df):
+        st.caption(f"Showing the first {len(filtered_df):,} records. Narrow the filters to see the rest.")
     st.dataframe(filtered_df, use_container_width=True, height=400)
 
     # Patient details
@@ -392,7 +596,7 @@ def show_patient_management():
         selected_patient = st.selectbox("Select Patient", filtered_df['patient_id'].tolist())
 
         if selected_patient:
-            patient_data = filtered_df[filtered_df['patient_id'] == selected_patient].iloc[0]
+            patient_data = patient_store.get_patient(selected_patient)
 
             col1, col2, col3 = st.columns(3)
 
@@ -410,11 +614,48 @@ def show_patient_management():
 
             with col3:
                 st.markdown("**DR Status**")
-                stage_info = dr_helper.stages[patient_data['dr_stage']]
+                stage_info = DR_STAGES[patient_data['dr_stage']]
                 st.write(f"DR Stage: {stage_info['name']}")
                 st.write(f"Risk Score: {patient_data['risk_score']}%")
                 st.write(f"Last Screening: {patient_data['last_screening']}")
 
+            show_screening_form(patient_data)
+
+
+def show_screening_form(patient_data):
+    """Record a new screening for one patient, updating the store and its running aggregates in O(1)"""
+    # Shown after the rerun that refreshes the table and sidebar with the saved values
+    saved = st.session_state.pop("screening_saved", None)
+    if saved is not None:
+        st.success(f"✅ Screening recorded for {saved}")
+
+    with st.expander("✏️ Record Screening Result"):
+        with st.form(f"screening_{patient_data['patient_id']}"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                hba1c = st.number_input("HbA1c (%)", 4.0, 15.0, float(patient_data['hba1c']), step=0.1)
+            with col2:
+                bp_systolic = st.number_input("Systolic BP (mmHg)", 80, 220, int(patient_data['bp_systolic']))
+            with col3:
+                dr_stage = st.selectbox("DR Stage", list(DR_STAGES), index=int(patient_data['dr_stage']),
+                                        format_func=lambda stage: DR_STAGES[stage]['name'])
+
+            if st.form_submit_button("💾 Save Screening", type="primary"):
+                from datetime import date
+                from utils.helpers import patient_base_risk
+
+                patient = patient_data.copy()
+                patient['hba1c'] = round(hba1c, 1)
+                patient['bp_systolic'] = bp_systolic
+                patient['dr_stage'] = dr_stage
+                patient['last_screening'] = date.today()
+                patient['risk_score'] = round(float(patient_base_risk(
+                    patient['age'], patient['diabetes_duration'], patient['hba1c'], bp_systolic)) * 100, 1)
+
+                patient_store.upsert_patient(patient)
+                st.session_state.screening_saved = patient['name']
+                st.rerun()
+
 
 def show_ai_assistant():
     st.markdown('<h2 class="section-header">💬 AI Chat Assistant</h2>', unsafe_allow_html=True)
@@ -427,6 +668,9 @@ def show_ai_assistant():
 
 
 def show_knowledge_base():
+    from components.charts import create_treatment_effectiveness_chart
+    from utils.knowledge_base import CLINICAL_GUIDELINES, PREVENTION_METHODS, SYMPTOMS_BY_STAGE
+
     st.markdown('<h2 class="section-header">📚 Diabetic Retinopathy Knowledge Base</h2>', unsafe_allow_html=True)
 
     tab1, tab2, tab3, tab4, tab5 = st.tabs(
@@ -435,7 +679,7 @@ def show_knowledge_base():
     with tab1:
         st.markdown("## Diabetic Retinopathy Stages")
 
-        for stage_num, stage_info in dr_helper.stages.items():
+        for stage_num, stage_info in DR_STAGES.items():
             with st.expander(f"Stage {stage_num}: {stage_info['name']}", expanded=stage_num == 0):
                 col1, col2 = st.columns([3, 1])
 
@@ -452,16 +696,7 @@ def show_knowledge_base():
     with tab2:
         st.markdown("## Symptoms and Clinical Findings")
 
-        symptoms_data = {
-            "Early Stage": ["Often asymptomatic", "Mild vision fluctuations", "Microaneurysms visible on imaging"],
-            "Moderate Stage": ["Blurred vision", "Difficulty reading", "Retinal hemorrhages", "Cotton wool spots"],
-            "Advanced Stage": ["Significant vision loss", "Floaters", "Dark spots", "Impaired color vision",
-                               "Macular edema"],
-            "Proliferative Stage": ["Severe vision loss", "Vitreous hemorrhage", "Retinal detachment",
-                                    "Neovascularization"]
-        }
-
-        for stage, symptoms in symptoms_data.items():
+        for stage, symptoms in SYMPTOMS_BY_STAGE.items():
             st.markdown(f"### {stage}")
             for symptom in symptoms:
                 st.markdown(f"- {symptom}")
@@ -471,7 +706,7 @@ def show_knowledge_base():
 
         st.plotly_chart(create_treatment_effectiveness_chart(), use_container_width=True)
 
-        for severity, treatments in dr_helper.treatment_options.items():
+        for severity, treatments in TREATMENT_OPTIONS.items():
             st.markdown(f"### {severity} DR")
             for treatment in treatments:
                 st.markdown(f"- **{treatment}**")
@@ -479,17 +714,8 @@ def show_knowledge_base():
     with tab4:
         st.markdown("## Prevention Strategies")
 
-        prevention_methods = {
-            "🎯 Blood Sugar Control": "Maintain HbA1c below 7% through medication, diet, and exercise",
-            "🩺 Regular Screening": "Annual eye exams for all diabetic patients, more frequent if DR detected",
-            "💊 Blood Pressure Management": "Keep BP below 130/80 mmHg with medication and lifestyle changes",
-            "🥗 Healthy Lifestyle": "Balanced diet, regular exercise, weight management, smoking cessation",
-            "📊 Cholesterol Control": "Manage lipid levels through diet and medication if needed",
-            "👁️ Early Detection": "Use AI screening tools for regular monitoring and early intervention"
-        }
-
         cols = st.columns(2)
-        for i, (method, description) in enumerate(prevention_methods.items()):
+        for i, (method, description) in enumerate(PREVENTION_METHODS.items()):
             with cols[i % 2]:
                 st.markdown(f"**{method}**")
                 st.markdown(f"<div style='color: #7f8c8d;'>{description}</div>", unsafe_allow_html=True)
@@ -498,55 +724,37 @@ def show_knowledge_base():
     with tab5:
         st.markdown("## Clinical Guidelines")
 
-        guidelines = {
-            "Screening Frequency": {
-                "Type 1 Diabetes": "Annual screening starting 5 years after diagnosis",
-                "Type 2 Diabetes": "Annual screening from time of diagnosis",
-                "Pregnancy": "First trimester and close monitoring throughout pregnancy",
-                "Established DR": "3-12 months based on severity"
-            },
-            "Referral Criteria": {
-                "Urgent Referral": "PDR, vitreous hemorrhage, retinal detachment",
-                "Early Referral": "Severe NPDR, clinically significant macular edema",
-                "Routine Referral": "Moderate NPDR with poor risk factor control"
-            },
-            "Monitoring Parameters": {
-                "Metabolic": "HbA1c every 3-6 months, target <7%",
-                "Ocular": "Visual acuity, retinal imaging, OCT when indicated",
-                "Systemic": "Blood pressure, lipid profile, renal function"
-            }
-        }
-
-        for category, items in guidelines.items():
+        for category, items in CLINICAL_GUIDELINES.items():
             st.markdown(f"### {category}")
             for item, description in items.items():
                 st.markdown(f"- **{item}:** {description}")
 
 
 def show_analytics():
+    import plotly.express as px
+    from components.charts import (create_correlation_heatmap, create_treatment_effectiveness_chart,
+                                   create_progression_timeline)
+
     st.markdown('<h2 class="section-header">📊 Advanced Analytics</h2>', unsafe_allow_html=True)
 
-    # Generate comprehensive analytics
-    patients_df = generate_sample_patients(200)
+    # Cohort-wide aggregates come from the store; charts use a bounded sample
+    summary = patient_store.summary()
+    patients_df = patient_store.sample(200)
 
     # Overview metrics
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        avg_hba1c = patients_df['hba1c'].mean()
-        st.metric("Average HbA1c", f"{avg_hba1c:.1f}%")
+        st.metric("Average HbA1c", f"{summary['avg_hba1c']:.1f}%")
 
     with col2:
-        progression_cases = len(patients_df[patients_df['dr_stage'] >= 2])
-        st.metric("Progression Cases", f"{progression_cases}")
+        st.metric("Progression Cases", f"{summary['progression_cases']}")
 
     with col3:
-        avg_duration = patients_df['diabetes_duration'].mean()
-        st.metric("Avg Diabetes Duration", f"{avg_duration:.1f} years")
+        st.metric("Avg Diabetes Duration", f"{summary['avg_duration']:.1f} years")
 
     with col4:
-        high_risk_patients = len(patients_df[patients_df['risk_score'] > 70])
-        st.metric("High Risk Patients", f"{high_risk_patients}")
+        st.metric("High Risk Patients", f"{summary['high_risk_patients']}")
 
     # Advanced charts
     col1, col2 = st.columns(2)
@@ -555,11 +763,9 @@ def show_analytics():
         # Treatment effectiveness
         st.plotly_chart(create_treatment_effectiveness_chart(), use_container_width=True)
 
-        # Risk factor correlation
-        corr_data = patients_df[['age', 'diabetes_duration', 'hba1c', 'bp_systolic', 'risk_score']].corr()
-        fig_corr = px.imshow(corr_data, title='Risk Factors Correlation Matrix',
-                             color_continuous_scale='RdBu_r', aspect="auto")
-        st.plotly_chart(fig_corr, use_container_width=True)
+        # Risk factor correlation across the whole cohort, from the store's running covariance
+        st.plotly_chart(create_correlation_heatmap(patient_store.correlation(ANALYTICS_CORRELATION_COLUMNS),
+                                                   ANALYTICS_CORRELATION_COLUMNS), use_container_width=True)
 
     with col2:
         # Progression timeline
@@ -571,6 +777,12 @@ def show_analytics():
                                color='dr_stage')
         st.plotly_chart(fig_age_stage, use_container_width=True)
 
+    from utils.figure_cache import figure_cache
+
+    figure_stats = figure_cache.stats()
+    st.caption(f"Figure cache: {figure_stats['hits']:,} hits, {figure_stats['misses']} builds "
+               f"({figure_stats['hit_rate']:.0%} hit rate, {figure_stats['figures']} figures)")
+
     # Predictive analytics section
     st.markdown("## 🔮 Predictive Analytics")
 
@@ -611,5 +823,51 @@ def show_analytics():
             st.metric("Predicted Success Rate", f"{success_rate:.1f}%")
 
 
+def show_metrics():
+    import pandas as pd
+    from utils.analysis_result import TIMING_STAGES
+    from utils.metrics import ANALYSIS_STAGE_SECONDS, DEFAULT_METRICS_FILE, DEFAULT_WINDOW
+
+    st.markdown('<h2 class="section-header">📈 Performance Metrics</h2>', unsafe_allow_html=True)
+    st.caption(f"Percentiles over the last {DEFAULT_WINDOW:,} observations of each series in this server process; "
+               f"counts and means cover its whole lifetime. Exported to `{DEFAULT_METRICS_FILE}` in Prometheus "
+               f"text format.")
+
+    rows = metrics.snapshot()
+    if not rows:
+        st.info("No timings recorded yet. Render a section or analyze an image to collect some.")
+        return
+
+    # Pipeline stages in the order they run, with detection's sub-stages under it
+    stage_order = ["quality", "detection", *TIMING_STAGES, "scoring"]
+    stage_labels = {stage: f"detection › {stage}" for stage in TIMING_STAGES}
+    pipeline_rows = sorted((row for row in rows if row["name"] in (ANALYSIS_SECONDS, ANALYSIS_STAGE_SECONDS)),
+                           key=lambda row: stage_order.index(row["labels"]["stage"]) + 1 if row["labels"] else 0)
+    tables = {
+        "🔍 Analysis Pipeline": [dict(row, series=stage_labels.get(row["labels"].get("stage"),
+                                                                  row["labels"].get("stage", "total")))
+                                for row in pipeline_rows],
+        "🧭 Section Renders": [dict(row, series=row["labels"]["section"])
+                              for row in rows if row["name"] == SECTION_RENDER_SECONDS],
+    }
+    for title, table_rows in tables.items():
+        st.markdown(f"### {title}")
+        if not table_rows:
+            st.info("No observations yet.")
+            continue
+
+        st.dataframe(pd.DataFrame([{
+            "Series": row["series"],
+            "Count": row["count"],
+            "Mean (ms)": row["mean"] * 1000,
+            "p50 (ms)": row["p50"] * 1000,
+            "p95 (ms)": row["p95"] * 1000,
+            "p99 (ms)": row["p99"] * 1000
+        } for row in table_rows]).style.format(precision=1), use_container_width=True, hide_index=True)
+
+    with st.expander("Prometheus export"):
+        st.code(metrics.to_prometheus(), language="text")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""Batch fundus analysis over a folder of images or a set of uploads
+
+Images are decoded and analyzed in a process pool and results are yielded
+as soon as each image finishes. Nothing here imports Streamlit or plotly,
+so it runs headless from the project root:
+
+    python -m utils.batch_analysis IMAGE_DIR --workers 4 --output results.json
+    python -m utils.batch_analysis IMAGE_DIR --output results.parquet
+    python -m utils.batch_analysis IMAGE_DIR --bench-workers 1,2,4,8
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.dr_engine import DRAnalysisEngine
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+
+_worker_engine = None
+
+
+def _init_worker():
+    global _worker_engine
+    _worker_engine = DRAnalysisEngine()
+    random.seed()
+
+
+def _analyze_source(name, source):
+    """Decode and analyze one image inside a worker; `source` is a path or raw bytes"""
+    start = time.perf_counter()
+    try:
+        results = _worker_engine.analyze_file(io.BytesIO(source) if isinstance(source, bytes) else source)
+    except Exception as exc:
+        return {"image": name, "error": str(exc), "elapsed_s": time.perf_counter() - start}
+
+    row = summarize_results(name, results)
+    row["elapsed_s"] = time.perf_counter() - start
+    return row
+
+
+def summarize_results(name, results):
+    """Flatten one `AnalysisResult` into a results-table row"""
+    counts = results.lesion_counts
+    return {
+        "image": name,
+        "error": None,
+        "severity_score": results.severity_score,
+        "stage": results.stage_info['name'],
+        "microaneurysms": counts['microaneurysms'],
+        "hemorrhages": counts['hemorrhages'],
+        "exudates": counts['exudates'],
+        "cotton_wool_spots": counts['cotton_wool_spots'],
+        "macular_involvement": results.macular_involvement,
+        "progression_risk": results.progression_risk,
+        "image_quality": results.quality_score,
+        "confidence": results.confidence,
+        "risk_flags": "; ".join(risk['type'] for risk in results.risk_assessment)
+    }
+
+
+def find_images(directory):
+    """Return `(name, path)` pairs for every image under `directory`"""
+    sources = []
+    for root, _, files in os.walk(directory):
+        for filename in sorted(files):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, filename)
+                sources.append((os.path.relpath(path, directory), path))
+    return sorted(sources)
+
+
+def run_batch(sources, workers=None):
+    """Analyze `(name, path_or_bytes)` sources in a process pool, yielding rows as they finish
+
+    Workers are spawned rather than forked, so this is safe to call from
+    the multi-threaded Streamlit server.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        futures = [pool.submit(_analyze_source, name, source) for name, source in sources]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_results(rows, output):
+    """Write result rows to JSON, Parquet or CSV, chosen by the output extension"""
+    rows = sorted(rows, key=lambda row: row["image"])
+    if output.endswith(".json"):
+        with open(output, "w") as results_file:
+            json.dump(rows, results_file, indent=2)
+        return rows
+
+    # pandas is only needed for the tabular formats, so JSON runs never pay for importing it
+    import pandas as pd
+
+    results_df = pd.DataFrame(rows)
+    if output.endswith(".parquet"):
+        results_df.to_parquet(output, index=False)
+    else:
+        results_df.to_csv(output, index=False)
+    return rows
+
+
+def measure_throughput(sources, worker_counts):
+    """Return images per second for each worker count, including pool start-up"""
+    throughput = {}
+    for workers in worker_counts:
+        start = time.perf_counter()
+        completed = sum(1 for _ in run_batch(sources, workers))
+        throughput[workers] = completed / (time.perf_counter() - start)
+    return throughput
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch diabetic retinopathy analysis over a directory of images")
+    parser.add_argument("directory", help="Directory searched recursively for fundus images")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
+    parser.add_argument("--output", default="batch_results.csv", help="Results file, .json, .parquet or .csv")
+    parser.add_argument("--bench-workers", help="Comma-separated worker counts to report throughput for")
+    args = parser.parse_args(argv)
+
+    sources = find_images(args.directory)
+    if not sources:
+        parser.error(f"no images found under {args.directory}")
+
+    if args.bench_workers:
+        worker_counts = [int(count) for count in args.bench_workers.split(",")]
+        for workers, images_per_s in measure_throughput(sources, worker_counts).items():
+            print(f"workers={workers:<3} {images_per_s:8.1f} images/s")
+        return
+
+    rows = []
+    start = time.perf_counter()
+    for done, row in enumerate(run_batch(sources, args.workers), 1):
+        rows.append(row)
+        status = row['error'] or f"stage {row['severity_score']}"
+        print(f"[{done}/{len(sources)}] {row['image']}: {status}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    write_results(rows, args.output)
+    print(f"Analyzed {len(rows)} images in {elapsed:.1f}s ({len(rows) / elapsed:.1f} images/s) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,909 @@
+"""Benchmarks for the hot paths of the DR app.
+
+Run from the project root, optionally naming the benchmarks to run:
+
+    python benchmarks.py
+    python benchmarks.py sample_patients
+    python benchmarks.py --list
+
+Every run is seeded, so the same commit measures the same inputs. `--save`
+writes the timings with the commit and environment to
+`.benchmarks/<commit>.json` (or a given path), and `--compare` reports each
+timing against a saved run, exiting non-zero when any slowed down by more
+than `--threshold`:
+
+    python benchmarks.py --save
+    python benchmarks.py --compare .benchmarks/1a2b3c4.json
+    python benchmarks.py --compare .benchmarks/1a2b3c4.json .benchmarks/5d6e7f8.json
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+import numpy as np
+import plotly.io as pio
+import plotly.tools as tools
+from PIL import Image
+
+from components.charts import CORRELATION_COLUMNS, DEMOGRAPHIC_COLUMNS, SCATTER_COLUMNS, SCATTER_MAX_POINTS, \
+    create_correlation_heatmap, create_demographics_summary_charts, create_patient_demographics_chart, \
+    create_progression_timeline, create_treatment_effectiveness_chart
+from utils.analysis_jobs import AnalysisJobManager, DEFAULT_JOB_WORKERS
+from utils.cohort_generator import generate_cohort
+from utils.aggregates import RISK_FACTOR_COLUMNS, CovarianceAccumulator
+from utils.analysis_result import AnalysisResult
+from utils.chat_history import ChatHistory
+from utils.chatbot import CHAT_PAGE_SIZE, DRChatbot, IntentMatcher, _chat_message_html, get_chatbot
+from utils.knowledge_base import KnowledgeIndex, knowledge_documents
+from utils.dr_engine import DRAnalysisEngine, LESION_TYPES, score_batch
+from utils.figure_cache import figure_cache as shared_figure_cache
+from utils.helpers import EnhancedDRHelper, generate_sample_patients
+from utils.image_analysis import assess_quality, detect_lesions
+from utils.metrics import ANALYSIS_SECONDS, MetricsRegistry, metrics as shared_metrics
+from utils.patient_filters import PatientFilterIndex, RANGE_COLUMNS, BITMAP_COLUMNS
+from utils.patient_store import PatientStore
+from utils.profiling import RerunProfiler
+from utils.result_cache import AnalysisCache, analysis_key
+
+BENCHMARKS = {}
+# Every `report` call of the current run, for `--save` and `--compare`
+RESULTS = []
+RESULTS_DIR = ".benchmarks"
+# A timing this many times slower than the baseline counts as a regression
+REGRESSION_THRESHOLD = 1.25
+SEED = 0
+
+
+def benchmark(func):
+    """Register a benchmark under its function name"""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def best_of(func, repeat=3):
+    """Return the fastest wall-clock time of `repeat` calls, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def synthetic_fundus(size, seed=0, lesions=40):
+    """Draw a reproducible RGB fundus-like image with vessels, dark spots and bright exudates"""
+    rng = np.random.default_rng(seed)
+    scale = size / 1024
+    image = np.zeros((size, size, 3), dtype=np.uint8)
+    center = (size // 2, size // 2)
+    cv2.circle(image, center, int(size * 0.47), (40, 90, 170), -1)
+
+    for _ in range(12):
+        points = (center + np.cumsum(rng.normal(0, 40 * scale, (8, 2)), axis=0)).astype(np.int32)
+        cv2.polylines(image, [points], False, (20, 45, 110), max(1, int(4 * scale)))
+    for x, y in rng.integers(int(size * 0.2), int(size * 0.8), (lesions, 2)):
+        cv2.circle(image, (int(x), int(y)), max(1, int(rng.integers(2, 7) * scale)), (15, 30, 80), -1)
+    for x, y in rng.integers(int(size * 0.3), int(size * 0.7), (lesions // 2, 2)):
+        cv2.circle(image, (int(x), int(y)), max(1, int(rng.integers(3, 8) * scale)), (150, 215, 230), -1)
+
+    noise = rng.normal(0, 4, image.shape)
+    return np.clip(cv2.GaussianBlur(image, (0, 0), 1.2 * scale) + noise, 0, 255).astype(np.uint8)
+
+
+def report(name, label, seconds, **extra):
+    RESULTS.append({"benchmark": name, "label": label, "seconds": seconds,
+                    "extra": {key: str(value) for key, value in extra.items()}})
+    details = "".join(f"  {key}={value}" for key, value in extra.items())
+    print(f"{name:<28} {label:<32} {seconds * 1000:>10.2f} ms{details}")
+
+
+@benchmark
+def sample_patients():
+    """Synthetic cohort generation at increasing sizes"""
+    for count in (10_000, 100_000, 1_000_000):
+        seconds = best_of(lambda: generate_sample_patients(count, seed=0))
+        report("sample_patients", f"n={count:,}", seconds, rows_per_s=f"{count / seconds:,.0f}")
+
+
+@benchmark
+def patient_store_rerun():
+    """Store reads done on a typical rerun, which should not grow with the cohort"""
+    for count in (10_000, 1_000_000):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = PatientStore(os.path.join(tmp, "patients.db"))
+            store.load_patients(generate_sample_patients(count, seed=0))
+
+            report("patient_store_rerun", f"n={count:,} sample", best_of(lambda: store.sample(200, seed=0)))
+            report("patient_store_rerun", f"n={count:,} upcoming appointments",
+                   best_of(lambda: store.upcoming_appointments(10)))
+            report("patient_store_rerun", f"n={count:,} age value counts", best_of(lambda: store.value_counts('age')))
+            report("patient_store_rerun", f"n={count:,} lookup", best_of(lambda: store.get_patient("P10042")))
+            report("patient_store_rerun", f"n={count:,} quick_stats", best_of(store.quick_stats))
+
+            # The Patient Management filter index after one screening edit: full rescan versus applying the edit
+            index = PatientFilterIndex.from_store(store)
+            store.upsert_patient(store.get_patient("P10042"))
+            report("patient_store_rerun", f"n={count:,} filter index rescan after an edit",
+                   best_of(lambda: PatientFilterIndex.from_store(store), repeat=1))
+            report("patient_store_rerun", f"n={count:,} filter index refresh after an edit",
+                   best_of(lambda: index.refreshed(store)))
+
+
+def mask_filter(patients_df, age_range, dr_stages, hba1c_range, risk_stages):
+    """The chained boolean-mask filter Patient Management used before the index"""
+    filtered_df = patients_df[
+        (patients_df['age'] >= age_range[0]) &
+        (patients_df['age'] <= age_range[1]) &
+        (patients_df['dr_stage'].isin(dr_stages)) &
+        (patients_df['hba1c'] >= hba1c_range[0]) &
+        (patients_df['hba1c'] <= hba1c_range[1])
+        ]
+    return filtered_df[filtered_df['dr_stage'].isin(risk_stages)]
+
+
+@benchmark
+def patient_filters():
+    """Patient Management filters on 10M rows, chained boolean masks versus the filter index"""
+    patients_df = generate_sample_patients(10_000_000, seed=0)
+    start = time.perf_counter()
+    index = PatientFilterIndex({column: patients_df[column].to_numpy() for column in RANGE_COLUMNS + BITMAP_COLUMNS})
+    report("patient_filters", "build n=10M", time.perf_counter() - start)
+
+    cases = {
+        "default sliders": ((30, 70), [0, 1, 2, 3, 4], (6.0, 9.0), [2]),
+        "narrow": ((60, 62), [3, 4], (11.0, 12.0), [3]),
+    }
+    for label, (age_range, dr_stages, hba1c_range, risk_stages) in cases.items():
+        stages = [stage for stage in dr_stages if stage in risk_stages]
+        matches = len(index.filter(age_range=age_range, hba1c_range=hba1c_range, dr_stage=stages))
+        report("patient_filters", f"{label} mask", best_of(
+            lambda: mask_filter(patients_df, age_range, dr_stages, hba1c_range, risk_stages)), matches=matches)
+        report("patient_filters", f"{label} index", best_of(
+            lambda: index.filter(age_range=age_range, hba1c_range=hba1c_range, dr_stage=stages)), matches=matches)
+
+
+@benchmark
+def image_quality():
+    """Image quality assessment at increasing image sizes"""
+    for size in (512, 2048, 4096):
+        image = synthetic_fundus(size)
+        report("image_quality", f"{size}x{size}", best_of(lambda: assess_quality(image), repeat=10))
+
+
+@benchmark
+def lesion_detection():
+    """Lesion detection at increasing image sizes, with per-stage timings"""
+    for size in (1024, 2048, 4096):
+        image = synthetic_fundus(size)
+        report("lesion_detection", f"{size}x{size}", best_of(lambda: detect_lesions(image)))
+        _, timings = detect_lesions(image)
+        print("    " + "  ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items()))
+
+
+@benchmark
+def comprehensive_analysis():
+    """End-to-end EnhancedDRHelper.generate_comprehensive_analysis at increasing image sizes"""
+    helper = EnhancedDRHelper()
+    for size in (512, 1024, 2048, 4096):
+        image = synthetic_fundus(size)
+        result = helper.generate_comprehensive_analysis(image)
+        report("comprehensive_analysis", f"{size}x{size}",
+               best_of(lambda: helper.generate_comprehensive_analysis(image)),
+               severity=result.severity_score, lesions=len(result.locations))
+
+
+@benchmark
+def metrics_overhead():
+    """Cost of recording a timing, exporting the registry, and the real processing_time the engine now reports"""
+    registry = MetricsRegistry()
+    report("metrics_overhead", "observe x10000",
+           best_of(lambda: [registry.observe("bench_seconds", 0.001, stage="scoring") for _ in range(10_000)]))
+
+    def timed_block():
+        with registry.timer("bench_seconds", stage="timer"):
+            pass
+
+    report("metrics_overhead", "timer block x10000", best_of(lambda: [timed_block() for _ in range(10_000)]))
+
+    # A registry shaped like a busy server: every stage and section with a full window of samples
+    for series in range(24):
+        for _ in range(registry.window):
+            registry.observe("bench_seconds", random.random(), stage=f"stage_{series}")
+    report("metrics_overhead", "snapshot 26 series", best_of(registry.snapshot, repeat=20))
+    report("metrics_overhead", "to_prometheus 26 series", best_of(registry.to_prometheus, repeat=20),
+           bytes=len(registry.to_prometheus()))
+
+    engine = DRAnalysisEngine()
+    image = synthetic_fundus(2048)
+    start = time.perf_counter()
+    result = engine.generate_comprehensive_analysis(image)
+    report("metrics_overhead", "2048x2048 analysis wall time", time.perf_counter() - start,
+           processing_time_ms=f"{result.processing_time * 1000:.1f}",
+           recorded=shared_metrics.summary(ANALYSIS_SECONDS)["count"])
+
+
+@benchmark
+def profiler_overhead():
+    """A 1024x1024 analysis bare and under the rerun profiler, plus the cost of writing its flame graphs"""
+    engine = DRAnalysisEngine()
+    image = synthetic_fundus(1024)
+    bare = best_of(lambda: engine.generate_comprehensive_analysis(image))
+    report("profiler_overhead", "1024x1024 analysis, no profiler", bare)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for interval in (0.005, 0.001):
+            profilers = []
+
+            def profiled():
+                with RerunProfiler("bench", root_file=__file__, interval=interval, output_dir=output_dir) as profiler:
+                    engine.generate_comprehensive_analysis(image)
+                profilers.append(profiler)
+
+            seconds = best_of(profiled)
+            profiler = profilers[-1]
+            report("profiler_overhead", f"1024x1024 analysis, {interval * 1000:g} ms samples", seconds,
+                   overhead=f"{(seconds / bare - 1) * 100:+.1f}%", samples=sum(profiler.stacks.values()),
+                   stacks=len(profiler.stacks))
+        report("profiler_overhead", "write folded + speedscope", best_of(profiler.write),
+               bytes=sum(os.path.getsize(path) for path in profiler.paths))
+
+
+# ru_maxrss survives exec from the benchmark process, so the probe reads the
+# kernel's per-process high-water mark instead
+DECODE_PROBE = """
+import sys, time
+import numpy as np
+from PIL import Image
+from utils.image_io import decode_fundus_image
+
+def peak_rss_kb():
+    with open("/proc/self/status") as status:
+        return next(int(line.split()[1]) for line in status if line.startswith("VmHWM"))
+
+baseline = peak_rss_kb()
+start = time.perf_counter()
+if sys.argv[2] == "decode_fundus_image":
+    decode_fundus_image(sys.argv[1])
+else:
+    np.asarray(Image.open(sys.argv[1]).convert("RGB"))
+elapsed = time.perf_counter() - start
+print(elapsed, (peak_rss_kb() - baseline) / 1024)
+"""
+
+
+# Peak RSS of the largest worker process, read after the pool has exited;
+# "memory" instead builds the whole cohort in this process
+COHORT_PROBE = """
+import resource, sys, time
+from datetime import date
+
+def peak_rss_kb():
+    with open("/proc/self/status") as status:
+        return next(int(line.split()[1]) for line in status if line.startswith("VmHWM"))
+
+rows, chunk_rows, mode, output_dir = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3], sys.argv[4]
+start = time.perf_counter()
+if mode == "memory":
+    from utils.helpers import generate_sample_patients
+    generate_sample_patients(rows, seed=0, reference_date=date(2026, 1, 1)).to_parquet(output_dir + ".parquet")
+    peak_kb = peak_rss_kb()
+else:
+    from utils.cohort_generator import generate_cohort
+    for _ in generate_cohort(output_dir, rows, seed=0, chunk_rows=chunk_rows, workers=1,
+                             reference_date=date(2026, 1, 1)):
+        pass
+    peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+print(time.perf_counter() - start, peak_kb / 1024)
+"""
+
+
+@benchmark
+def cohort_generation():
+    """Chunked Parquet cohort generation: throughput per worker count, and peak memory"""
+    reference_date = datetime(2026, 1, 1).date()
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in sorted({1, os.cpu_count() or 1, 2}):
+            output_dir = os.path.join(tmp, f"workers_{workers}")
+            start = time.perf_counter()
+            written = sum(rows for _, rows in generate_cohort(output_dir, 1_000_000, seed=SEED, chunk_rows=250_000,
+                                                              workers=workers, reference_date=reference_date))
+            seconds = time.perf_counter() - start
+            report("cohort_generation", f"1M rows, 250k chunks, {workers} workers", seconds,
+                   rows_per_s=f"{written / seconds:,.0f}")
+
+        start = time.perf_counter()
+        sum(1 for _ in generate_cohort(os.path.join(tmp, "workers_1"), 1_000_000, seed=SEED, chunk_rows=250_000,
+                                       workers=1, reference_date=reference_date))
+        report("cohort_generation", "1M rows, unchanged manifest", time.perf_counter() - start)
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        for rows, mode in ((500_000, "chunked"), (2_000_000, "chunked"), (500_000, "memory"), (2_000_000, "memory")):
+            output = subprocess.run([sys.executable, "-c", COHORT_PROBE, str(rows), "250000", mode,
+                                     os.path.join(tmp, f"{mode}_{rows}")],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            seconds, peak_mb = map(float, output.split())
+            report("cohort_generation", f"{rows:,} rows {mode}, fresh process", seconds,
+                   peak_rss_mb=f"{peak_mb:.0f}")
+
+
+@benchmark
+def image_decode():
+    """Decode time and peak RSS growth for a 4000x4000 upload, each in a fresh process"""
+    image = Image.fromarray(synthetic_fundus(4000))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for filename, options in (("fundus.jpg", {"quality": 92}), ("fundus.tif", {}), ("fundus.png", {})):
+            path = os.path.join(tmp, filename)
+            image.save(path, **options)
+            for loader in ("full decode", "decode_fundus_image"):
+                output = subprocess.run([sys.executable, "-c", DECODE_PROBE, path, loader], env=env,
+                                        capture_output=True, text=True, check=True).stdout
+                seconds, peak_mb = map(float, output.split())
+                report("image_decode", f"{filename} {loader}", seconds, peak_rss_mb=f"{peak_mb:.0f}")
+
+
+@benchmark
+def cold_start():
+    """Fresh-process wall time to import each entry point, and to run the headless CLI on one image"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    def run(*args):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], env=env, capture_output=True, check=True)
+        return time.perf_counter() - start
+
+    report("cold_start", "interpreter only", min(run("-c", "pass") for _ in range(3)))
+    for module in ("utils.dr_engine", "utils.batch_analysis", "utils.helpers"):
+        report("cold_start", f"import {module}", min(run("-c", f"import {module}") for _ in range(3)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Image.fromarray(synthetic_fundus(2048)).save(os.path.join(tmp, "fundus.jpg"), quality=92)
+        output = os.path.join(tmp, "results.json")
+        report("cold_start", "batch CLI, 1 image to JSON",
+               run("-m", "utils.batch_analysis", tmp, "--workers", "1", "--output", output))
+
+
+def synthetic_feature_table(count, seed=0):
+    """Lesion counts and macular flags spanning every severity and risk flag"""
+    rng = np.random.default_rng(seed)
+    table = {lesion: rng.poisson(rng.uniform(0, high, count)) for lesion, high in
+             zip(LESION_TYPES, (40, 30, 20, 12))}
+    table["macular_involvement"] = rng.random(count) < 0.2
+    return table
+
+
+def scalar_scores(engine, table):
+    """Score a feature table one record at a time through the engine's dict-based methods"""
+    severity, progression, flags = [], [], []
+    for i in range(len(table["macular_involvement"])):
+        features = {lesion: {"count": int(table[lesion][i])} for lesion in LESION_TYPES}
+        features["exudates"]["macular_involvement"] = bool(table["macular_involvement"][i])
+        score = engine.calculate_enhanced_severity(features)
+        severity.append(score)
+        progression.append(engine.calculate_progression_risk(score, features))
+        flags.append(engine.assess_comprehensive_risk(features, score))
+    return severity, progression, flags
+
+
+@benchmark
+def batch_scoring():
+    """Records per second for the scalar and vectorized scoring paths"""
+    engine = DRAnalysisEngine()
+    table = synthetic_feature_table(100_000)
+
+    start = time.perf_counter()
+    scalar_scores(engine, table)
+    scalar_seconds = time.perf_counter() - start
+    report("batch_scoring", "scalar 100k", scalar_seconds, records_per_s=f"{100_000 / scalar_seconds:,.0f}")
+
+    for count in (100_000, 1_000_000, 10_000_000):
+        table = synthetic_feature_table(count)
+        seconds = best_of(lambda: score_batch(table))
+        report("batch_scoring", f"score_batch {count:,}", seconds, records_per_s=f"{count / seconds:,.0f}")
+
+
+def retained_bytes(factory, count=1000):
+    """Average bytes still allocated per object after building `count` of them with `factory`"""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    objects = [factory() for _ in range(count)]
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del objects
+    return retained // count
+
+
+@benchmark
+def analysis_result():
+    """Per-result memory and serialization cost of an AnalysisResult versus the nested dict form"""
+    engine = DRAnalysisEngine()
+    for lesions in (40, 400):
+        result = engine.generate_comprehensive_analysis(synthetic_fundus(2048, lesions=lesions))
+        as_dict = result.to_dict()
+        label = f"{sum(result.lesion_counts.values())} lesions"
+
+        # Objects rebuilt from their serialized form, as a cache or session store would hold them
+        payload = pickle.dumps(as_dict, protocol=pickle.HIGHEST_PROTOCOL)
+        report("analysis_result", f"dict pickle x1000, {label}",
+               best_of(lambda: [pickle.dumps(as_dict) for _ in range(1000)]),
+               retained_bytes=retained_bytes(lambda: pickle.loads(payload)), serialized_bytes=len(payload))
+        report("analysis_result", f"dict unpickle x1000, {label}",
+               best_of(lambda: [pickle.loads(payload) for _ in range(1000)]))
+
+        packed = result.to_bytes()
+        report("analysis_result", f"to_bytes x1000, {label}",
+               best_of(lambda: [result.to_bytes() for _ in range(1000)]),
+               retained_bytes=retained_bytes(lambda: AnalysisResult.from_bytes(bytes(bytearray(packed)))),
+               serialized_bytes=len(packed))
+        report("analysis_result", f"from_bytes x1000, {label}",
+               best_of(lambda: [AnalysisResult.from_bytes(packed) for _ in range(1000)]))
+
+
+@benchmark
+def figure_cache():
+    """Per-rerun cost of building a figure and the conversion st.plotly_chart does, uncached and cached"""
+    def render(build):
+        figure = tools.return_figure_from_figure_or_data(build(), validate_figure=True)
+        return pio.to_json(figure, validate=False)
+
+    helper = EnhancedDRHelper()
+    charts = {
+        "treatment_effectiveness": (create_treatment_effectiveness_chart.__wrapped__,
+                                    create_treatment_effectiveness_chart),
+        "progression_timeline": (create_progression_timeline.__wrapped__, create_progression_timeline),
+        "severity_gauge": (lambda: helper._build_severity_gauge(2), lambda: helper.create_enhanced_severity_gauge(2))
+    }
+    for name, (uncached, cached) in charts.items():
+        report("figure_cache", f"{name} rebuilt", best_of(lambda: render(uncached), repeat=20))
+        report("figure_cache", f"{name} cached", best_of(lambda: render(cached), repeat=20))
+    stats = shared_figure_cache.stats()
+    print(f"{'':<28}   hits={stats['hits']} misses={stats['misses']} spec_bytes={stats['spec_bytes']}")
+
+
+@benchmark
+def chart_builders():
+    """Every chart builder uncached, from construction through the JSON sent to the browser"""
+    helper = EnhancedDRHelper()
+    patients_df = generate_sample_patients(1_000, seed=SEED)
+    columns = {column: patients_df[column].to_numpy() for column in DEMOGRAPHIC_COLUMNS}
+    correlation = CovarianceAccumulator.from_columns(patients_df, CORRELATION_COLUMNS).correlation()
+
+    builders = {
+        "demographics raw": lambda: create_patient_demographics_chart(patients_df),
+        "demographics aggregate": lambda: create_patient_demographics_chart(columns, aggregate=True,
+                                                                           correlation=correlation),
+        "correlation heatmap": lambda: [create_correlation_heatmap(correlation, CORRELATION_COLUMNS)],
+        "treatment effectiveness": lambda: [create_treatment_effectiveness_chart.__wrapped__()],
+        "progression timeline": lambda: [create_progression_timeline.__wrapped__()],
+        "severity gauge": lambda: [helper._build_severity_gauge(2)],
+    }
+    for label, build in builders.items():
+        report("chart_builders", f"{label} build", best_of(build, repeat=5))
+        report("chart_builders", f"{label} build + json",
+               best_of(lambda: [pio.to_json(figure, validate=False) for figure in build()], repeat=5),
+               payload_bytes=f"{sum(len(pio.to_json(figure, validate=False)) for figure in build()):,}")
+
+
+@benchmark
+def demographics_charts():
+    """Build-plus-serialize time and JSON payload of the four dashboard figures: raw rows, in-memory and store aggregates"""
+    for count in (1_000, 1_000_000):
+        patients_df = generate_sample_patients(count, seed=0)
+        columns = {column: patients_df[column].to_numpy() for column in DEMOGRAPHIC_COLUMNS}
+        store = PatientStore(":memory:")
+        store.load_patients(patients_df)
+
+        def from_store():
+            # What the dashboard builds once per store version
+            quick_stats = store.quick_stats()
+            return create_demographics_summary_charts(
+                store.value_counts('age'), quick_stats['stage_counts'],
+                store.sample(SCATTER_MAX_POINTS, columns=SCATTER_COLUMNS, seed=0), quick_stats['total_patients'],
+                store.correlation(CORRELATION_COLUMNS))
+
+        for mode, build in (("raw", lambda: create_patient_demographics_chart(patients_df)),
+                            ("aggregate", lambda: create_patient_demographics_chart(columns, aggregate=True)),
+                            ("store summary", from_store)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            payload = sum(len(pio.to_json(figure, validate=False)) for figure in build())
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report("demographics_charts", f"{mode} {count:,} rows", seconds,
+                   payload_bytes=f"{payload:,}", peak_mb=f"{peak / 2 ** 20:.1f}")
+
+
+@benchmark
+def risk_correlation():
+    """Per-render correlation cost, DataFrame.corr versus the running covariance, and chunked and merged agreement"""
+    count = 1_000_000
+    patients_df = generate_sample_patients(count, seed=0)
+    expected = patients_df[RISK_FACTOR_COLUMNS].astype(float).corr().to_numpy()
+    accumulator = CovarianceAccumulator.from_columns(patients_df)
+
+    report("risk_correlation", f"DataFrame.corr {count:,} rows",
+           best_of(lambda: patients_df[RISK_FACTOR_COLUMNS].corr()))
+    report("risk_correlation", "accumulator.correlation", best_of(accumulator.correlation, repeat=100))
+
+    patient = patients_df.iloc[0]
+    report("risk_correlation", "add + remove one patient",
+           best_of(lambda: (accumulator.add(patient), accumulator.remove(patient)), repeat=100))
+
+    chunk_rows = 50_000
+    start = time.perf_counter()
+    chunked = CovarianceAccumulator.from_chunks(patients_df.iloc[offset:offset + chunk_rows]
+                                                for offset in range(0, count, chunk_rows))
+    report("risk_correlation", f"from_chunks {chunk_rows:,}-row chunks", time.perf_counter() - start,
+           max_abs_error=f"{np.abs(chunked.correlation() - expected).max():.1e}")
+
+    # Partials as eight workers would return them, each over its own slice
+    partials = [CovarianceAccumulator.from_columns(patients_df.iloc[offset:offset + count // 8])
+                for offset in range(0, count, count // 8)]
+
+    def merge_partials():
+        merged = CovarianceAccumulator()
+        for partial in partials:
+            merged.merge(partial)
+        return merged
+
+    report("risk_correlation", "merge 8 worker partials", best_of(merge_partials, repeat=100),
+           max_abs_error=f"{np.abs(merge_partials().correlation() - expected).max():.1e}")
+
+
+# Questions the chat benchmarks ask, from full sentences to short and keyword-free inputs;
+# tests/test_chatbot.py checks the intent each one matches
+SAMPLE_QUESTIONS = (
+    "What are the early symptoms of diabetic retinopathy?",
+    "How often should I get screened for DR?",
+    "What are the different stages of diabetic retinopathy?",
+    "How can I prevent diabetic retinopathy?",
+    "What treatments are available for severe DR?",
+    "What are the main risk factors for developing DR?",
+    "Hi, what are the symptoms?",
+    "hello",
+    "Is this serious?",
+    "My stopwatch broke",
+    "Is it curable?",
+    "My eyes are blurry",
+    "What causes it?",
+    "What therapies exist?",
+)
+
+
+def substring_intent(keywords, text):
+    """The linear `keyword in text` scan DRChatbot used before the compiled matcher"""
+    text = text.lower()
+    for keyword, intent in keywords.items():
+        if keyword in text:
+            return intent
+    return None
+
+
+@benchmark
+def intent_matching():
+    """Per-message matching time as the keyword vocabulary grows"""
+    chatbot = DRChatbot()
+    rng = np.random.default_rng(0)
+    # Matches no keyword, so the substring scan reads the whole vocabulary, as it does for every default reply
+    message = "Can diabetic retinopathy come back years after surgery in type 2 patients?"
+    intents = list(chatbot.responses)
+    for size in (21, 1_000, 10_000):
+        keywords = dict(chatbot.context_keywords)
+        while len(keywords) < size:
+            word = "".join(rng.choice(list("bcdfghjklmnpqrstvwxz"), 7))
+            keywords[word] = intents[len(keywords) % len(intents)]
+
+        start = time.perf_counter()
+        matcher = IntentMatcher(keywords)
+        build = time.perf_counter() - start
+        report("intent_matching", f"substring scan {size:,} keywords x1000",
+               best_of(lambda: [substring_intent(keywords, message) for _ in range(1000)]))
+        report("intent_matching", f"compiled match {size:,} keywords x1000",
+               best_of(lambda: [matcher.match(message) for _ in range(1000)]), build_ms=f"{build * 1000:.1f}")
+
+
+@benchmark
+def knowledge_retrieval():
+    """Knowledge base index build, memory-mapped load, and per-query latency"""
+    chatbot = DRChatbot()
+    documents = knowledge_documents(chatbot.responses)
+    queries = chatbot.get_suggested_questions() + list(SAMPLE_QUESTIONS) + [
+        "What is the HbA1c target?", "When is urgent referral needed?", "Is vitrectomy used for PDR?"]
+
+    start = time.perf_counter()
+    built = KnowledgeIndex.build(documents)
+    report("knowledge_retrieval", f"build {len(documents)} passages", time.perf_counter() - start,
+           terms=len(built.vocabulary))
+
+    with tempfile.TemporaryDirectory() as path:
+        built.save(path)
+        start = time.perf_counter()
+        index = KnowledgeIndex.load(built.fingerprint, path)
+        report("knowledge_retrieval", "load memory-mapped", time.perf_counter() - start)
+
+        latencies = sorted(best_of(lambda: index.answer(query), repeat=20) for query in queries)
+        report("knowledge_retrieval", f"answer p50 of {len(queries)} queries", latencies[len(latencies) // 2])
+        report("knowledge_retrieval", "answer slowest query", latencies[-1])
+
+
+@benchmark
+def chat_history():
+    """Per-rerun render cost and session memory of the chat log, unbounded list versus ChatHistory"""
+    chatbot = DRChatbot()
+    questions = chatbot.get_suggested_questions()
+    for turns in (50, 500, 5_000):
+        messages = []
+        for turn in range(turns):
+            question = questions[turn % len(questions)]
+            messages.append(("user", question))
+            messages.append(("assistant", chatbot.responses["symptoms"][turn % 3]))
+
+        def unbounded():
+            history = []
+            for role, message in messages:
+                history.append({"role": role, "message": message, "timestamp": datetime.now()})
+            return history
+
+        def bounded():
+            history = ChatHistory()
+            for role, message in messages:
+                history.append(role, message)
+            return history
+
+        history_list, history = unbounded(), bounded()
+        label = f"{len(messages):,} messages"
+        report("chat_history", f"list, render all {label}",
+               best_of(lambda: "".join(_chat_message_html(chat) for chat in history_list)),
+               retained_kb=f"{retained_bytes(unbounded, count=1) / 1024:.0f}")
+        report("chat_history", f"bounded, newest page {label}",
+               best_of(lambda: "".join(_chat_message_html(chat) for chat in history.page(0, CHAT_PAGE_SIZE)),
+                       repeat=20),
+               retained_kb=f"{retained_bytes(bounded, count=1) / 1024:.0f}")
+        report("chat_history", f"bounded, oldest page {label}",
+               best_of(lambda: history.page(history.page_count(CHAT_PAGE_SIZE) - 1, CHAT_PAGE_SIZE), repeat=20))
+
+
+@benchmark
+def chatbot_response():
+    """DRChatbot.get_response on the shared engine, per question and over the suggested and regression questions"""
+    chatbot = get_chatbot()
+    questions = chatbot.get_suggested_questions() + list(SAMPLE_QUESTIONS)
+    chatbot.get_response(questions[0])
+
+    for question in chatbot.get_suggested_questions()[:3]:
+        report("chatbot_response", question[:32], best_of(lambda: chatbot.get_response(question), repeat=50))
+    report("chatbot_response", f"{len(questions)} questions",
+           best_of(lambda: [chatbot.get_response(question) for question in questions], repeat=20))
+
+
+@benchmark
+def chat_sessions():
+    """Memory per 1,000 chat sessions with a per-session engine versus the shared one, and concurrent answers"""
+    shared = get_chatbot()
+    shared.get_response("warm up the knowledge index")
+
+    def session(chatbot):
+        history = ChatHistory()
+        history.append("assistant", chatbot.responses["greeting"][0])
+        return {"chat_history": history, "chat_page": 0}
+
+    # What initialize_chat_session used to store: an engine per session next to its history
+    for label, factory in (("per-session engine", lambda: dict(session(shared), chatbot=DRChatbot())),
+                           ("shared engine", lambda: session(get_chatbot()))):
+        report("chat_sessions", f"start 1,000 sessions, {label}", best_of(lambda: [factory() for _ in range(1000)]),
+               retained_kb=f"{retained_bytes(factory, count=1000) * 1000 / 1024:,.0f}")
+
+    questions = list(SAMPLE_QUESTIONS) * 50
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        start = time.perf_counter()
+        list(pool.map(shared.get_response, questions))
+    report("chat_sessions", f"{len(questions)} answers on 8 threads", time.perf_counter() - start)
+
+
+IMPORT_PROBE = """
+import runpy, sys, time
+
+start = time.perf_counter()
+if sys.argv[1].endswith(".py"):
+    runpy.run_path(sys.argv[1], run_name="import_probe")
+else:
+    __import__(sys.argv[1])
+elapsed = time.perf_counter() - start
+
+with open("/proc/self/status") as status:
+    rss_kb = next(int(line.split()[1]) for line in status if line.startswith("VmRSS"))
+print(elapsed, rss_kb / 1024, " ".join(sorted(name for name in sys.modules if "." not in name)))
+"""
+
+
+def import_breakdown(stderr, top=8):
+    """Sum `-X importtime` cumulative microseconds by top-level package"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Only outermost imports are counted, so nested time is not added twice
+        if name.startswith("  "):
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(cumulative)
+    return [(package, micros) for package, micros in sorted(totals.items(), key=lambda item: -item[1])[:top]
+            if micros >= 1000]
+
+
+@benchmark
+def import_time():
+    """Cold import of the app (without rendering a page) and of a batch worker, with `-X importtime` totals"""
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), DR_PATIENT_DB=os.path.join(tmp, "patients.db"))
+        for target in (app_path, "utils.batch_analysis"):
+            # The first app import seeds the patient database; time the second, like a server restart
+            for _ in range(2):
+                completed = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_PROBE, target],
+                                           env=env, capture_output=True, text=True, check=True)
+            seconds, rss_mb, modules = completed.stdout.split(maxsplit=2)
+            heavy = [name for name in ("pandas", "plotly", "cv2", "faker", "sklearn") if name in modules.split()]
+            label = os.path.basename(target) if target.endswith(".py") else target
+            report("import_time", label, float(seconds), rss_mb=f"{float(rss_mb):.0f}",
+                   loaded=",".join(heavy) or "-")
+            for package, micros in import_breakdown(completed.stderr):
+                print(f"{'':<28}   {package:<30} {micros / 1000:>10.2f} ms")
+
+
+@benchmark
+def analysis_cache():
+    """Analysis cache miss, memory and disk hits, and key hashing for a 2048x2048 image"""
+    image = synthetic_fundus(2048)
+    key = analysis_key(image.tobytes())
+    helper = DRAnalysisEngine()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AnalysisCache(tmp)
+        start = time.perf_counter()
+        cache.get_or_compute(key, lambda: helper.generate_comprehensive_analysis(image))
+        report("analysis_cache", "miss 2048x2048", time.perf_counter() - start)
+        report("analysis_cache", "memory hit", best_of(lambda: cache.get(key), repeat=100))
+        report("analysis_cache", "disk hit", best_of(lambda: AnalysisCache(tmp).get(key), repeat=20))
+        report("analysis_cache", "key 2048x2048", best_of(lambda: analysis_key(image.tobytes()), repeat=10))
+
+
+@benchmark
+def analysis_jobs():
+    """Script-thread time to submit and poll, and end-to-end latency for concurrent submissions"""
+    helper = DRAnalysisEngine()
+    images = [synthetic_fundus(2048, seed=seed) for seed in range(8)]
+    manager = AnalysisJobManager(helper.generate_comprehensive_analysis)
+
+    start = time.perf_counter()
+    job_ids = [manager.submit(image) for image in images]
+    report("analysis_jobs", "submit 8 jobs", time.perf_counter() - start)
+    report("analysis_jobs", "poll one job", best_of(lambda: manager.get(job_ids[-1]), repeat=100))
+
+    while not all(manager.get(job_id)['status'] == "done" for job_id in job_ids):
+        time.sleep(0.005)
+    latency = max(manager.get(job_id)['queued_s'] + manager.get(job_id)['elapsed_s'] for job_id in job_ids)
+    report("analysis_jobs", "8 x 2048x2048 end to end", latency, workers=DEFAULT_JOB_WORKERS)
+    manager.shutdown()
+
+
+def seed_everything(seed=SEED):
+    """Fix the global RNGs the engine and generators fall back on, so every run sees the same inputs"""
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(path=None):
+    commit = git_commit()
+    path = path or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    run = {
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": RESULTS
+    }
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(run, handle, indent=1)
+    print(f"saved {len(RESULTS)} results to {path}")
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as handle:
+        run = json.load(handle)
+    return run["commit"], {(result["benchmark"], result["label"]): result["seconds"] for result in run["results"]}
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Print each timing's ratio to the baseline, returning the number of regressions"""
+    regressions = 0
+    for key in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[key], current[key]
+        # Sub-microsecond timings are noise, not a signal
+        ratio = after / before if before > 1e-6 else 1.0
+        flag = ""
+        if ratio > threshold:
+            flag, regressions = "  REGRESSION", regressions + 1
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        print(f"{key[0]:<28} {key[1]:<32} {before * 1000:>10.2f} -> {after * 1000:>10.2f} ms"
+              f"  x{ratio:.2f}{flag}")
+    for key in sorted(baseline.keys() ^ current.keys()):
+        print(f"{key[0]:<28} {key[1]:<32} only in {'baseline' if key in baseline else 'current run'}")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks for the hot paths of the DR app")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--save", nargs="?", const="", metavar="PATH",
+                        help=f"save results (default: {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS",
+                        help="compare against a saved run, or compare two saved runs without running anything")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown ratio reported as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, func in BENCHMARKS.items():
+            summary = (func.__doc__ or "").strip().splitlines()
+            print(f"{name:<28} {summary[0] if summary else ''}")
+        return 0
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a baseline, or a baseline and a second saved run")
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    if args.compare and len(args.compare) == 2:
+        (base_commit, baseline), (head_commit, current) = map(load_results, args.compare)
+    else:
+        for name in args.names or BENCHMARKS:
+            seed_everything()
+            BENCHMARKS[name]()
+        if args.save is not None:
+            save_results(args.save or None)
+        if not args.compare:
+            return 0
+        (base_commit, baseline), head_commit = load_results(args.compare[0]), git_commit()
+        current = {(result["benchmark"], result["label"]): result["seconds"] for result in RESULTS}
+        # Only benchmarks that ran in this invocation are compared
+        ran = {name for name, _ in current} | set(args.names)
+        baseline = {key: seconds for key, seconds in baseline.items() if key[0] in ran}
+
+    print(f"\n{base_commit} -> {head_commit}")
+    regressions = compare_results(baseline, current, args.threshold)
+    print(f"{regressions} regression(s) over x{args.threshold}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,11 +1,36 @@
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import streamlit as st
 
-
-def create_patient_demographics_chart(patients_df):
-    """Create comprehensive patient demographics dashboard"""
+from utils.aggregates import CovarianceAccumulator
+from utils.figure_cache import cached_figure
+
+# Columns the aggregated demographics charts read
+DEMOGRAPHIC_COLUMNS = ['patient_id', 'age', 'diabetes_duration', 'hba1c', 'bp_systolic', 'dr_stage']
+CORRELATION_COLUMNS = ['age', 'diabetes_duration', 'hba1c', 'bp_systolic', 'dr_stage']
+AGE_BINS = 15
+# The aggregated scatter draws at most this many points, sampled uniformly
+SCATTER_MAX_POINTS = 2000
+# Columns the aggregated scatter reads for each sampled patient
+SCATTER_COLUMNS = ['patient_id', 'age', 'diabetes_duration', 'hba1c', 'dr_stage']
+
+
+def create_patient_demographics_chart(patients_df, aggregate=False, max_points=SCATTER_MAX_POINTS, seed=0,
+                                      correlation=None):
+    """Create comprehensive patient demographics dashboard
+
+    With `aggregate=True` the figures are built from server-side
+    aggregates instead of raw rows, so their size no longer grows with the
+    cohort; `patients_df` may then be any mapping of `DEMOGRAPHIC_COLUMNS`
+    arrays. `correlation` is an optional precomputed `CORRELATION_COLUMNS`
+    matrix, such as `PatientStore.correlation`, used instead of a pass
+    over the rows. Use `create_demographics_summary_charts` when the
+    aggregates come from the store and no rows are loaded at all.
+    """
+    if aggregate:
+        return _aggregated_demographics_charts(patients_df, max_points, seed, correlation)
 
     # Age distribution
     fig_age = px.histogram(patients_df, x='age', nbins=15,
@@ -33,6 +58,73 @@ def create_patient_demographics_chart(patients_df):
     return fig_age, fig_stages, fig_scatter, fig_corr
 
 
+def create_correlation_heatmap(correlation, columns):
+    """Heatmap of a k x k correlation matrix, such as one read from a `CovarianceAccumulator`"""
+    corr_data = pd.DataFrame(correlation, index=columns, columns=columns)
+    return px.imshow(corr_data, title='Risk Factors Correlation Matrix',
+                     color_continuous_scale='RdBu_r', aspect="auto")
+
+
+def create_demographics_summary_charts(age_counts, stage_counts, sample, total, correlation):
+    """The four demographics figures from pre-aggregated inputs, none of which grows with the cohort
+
+    `age_counts` is a `(values, counts)` pair such as
+    `PatientStore.value_counts('age')`, `stage_counts` the number of
+    patients per DR stage, `sample` at most a few thousand rows of
+    `SCATTER_COLUMNS` such as `PatientStore.sample`, `total` the cohort
+    size, and `correlation` a `CORRELATION_COLUMNS` matrix such as
+    `PatientStore.correlation`.
+    """
+    # Age distribution, binned exactly as np.histogram would bin the raw ages
+    values, counts = age_counts
+    counts, edges = np.histogram(np.asarray(values, dtype=float), bins=AGE_BINS, weights=counts)
+    fig_age = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts.astype(np.int64), width=np.diff(edges),
+                               marker_color='#667eea'))
+    fig_age.update_layout(title='Age Distribution of Patients', xaxis_title='age', yaxis_title='count',
+                          bargap=0, showlegend=False)
+
+    # DR Stage distribution
+    stage_counts = np.asarray(stage_counts)
+    stages = np.flatnonzero(stage_counts)
+    fig_stages = px.pie(values=stage_counts[stages], names=stages,
+                        title='Distribution of DR Stages',
+                        color_discrete_sequence=px.colors.sequential.RdBu)
+
+    # HbA1c vs DR Stage, on a uniform sample once the cohort outgrows what a browser should draw
+    title = 'HbA1c vs Age colored by DR Stage'
+    if total > len(sample):
+        title += f' ({len(sample):,} of {total:,} patients sampled)'
+    fig_scatter = px.scatter(sample, x='hba1c', y='age', color='dr_stage',
+                             size='diabetes_duration', hover_data=['patient_id'],
+                             title=title,
+                             color_continuous_scale='viridis')
+
+    # Risk factors correlation
+    fig_corr = create_correlation_heatmap(correlation, CORRELATION_COLUMNS)
+
+    return fig_age, fig_stages, fig_scatter, fig_corr
+
+
+def _aggregated_demographics_charts(patients, max_points, seed, correlation=None):
+    """Reduce in-memory columns to the summary inputs: age counts, stage counts, a bounded sample, a 5x5 correlation"""
+    age = np.asarray(patients['age'])
+    total = len(age)
+
+    if total > max_points:
+        rows = np.sort(np.random.default_rng(seed).choice(total, max_points, replace=False))
+    else:
+        rows = np.arange(total)
+    sample = pd.DataFrame({column: np.asarray(patients[column])[rows] for column in SCATTER_COLUMNS})
+
+    if correlation is None:
+        correlation = CovarianceAccumulator.from_columns(patients, CORRELATION_COLUMNS).correlation()
+
+    return create_demographics_summary_charts(np.unique(age, return_counts=True),
+                                              np.bincount(np.asarray(patients['dr_stage'], dtype=np.int64)),
+                                              sample, total, correlation)
+
+
+@cached_figure
 def create_treatment_effectiveness_chart():
     """Create treatment effectiveness visualization"""
     treatments = ['Laser Therapy', 'Anti-VEGF', 'Vitrectomy', 'Combination']
@@ -65,6 +157,7 @@ def create_treatment_effectiveness_chart():
     return fig
 
 
+@cached_figure
 def create_progression_timeline():
     """Create disease progression timeline"""
     stages = ['No DR', 'Mild NPDR', 'Moderate NPDR', 'Severe NPDR', 'PDR']
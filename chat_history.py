@@ -0,0 +1,93 @@
+import json
+import os
+import zlib
+from collections import deque
+from datetime import datetime
+from itertools import islice
+
+# Most recent messages kept as plain dicts; older ones are compressed in pages
+DEFAULT_HISTORY_CAPACITY = int(os.environ.get("DR_CHAT_HISTORY_CAPACITY", "50"))
+SPILL_PAGE_SIZE = 50
+# Compressed pages kept per session; the oldest is dropped when another is added
+DEFAULT_ARCHIVE_PAGES = int(os.environ.get("DR_CHAT_ARCHIVE_PAGES", "200"))
+
+
+class ChatHistory:
+    """One session's chat log with a bounded live window and a compressed archive
+
+    The newest `capacity` messages sit in a ring buffer. Each message
+    pushed out of it is appended to an open page, and every
+    `SPILL_PAGE_SIZE` messages the page is stored as zlib-compressed JSON,
+    so session memory grows by a few hundred bytes per page rather than
+    a dict per message. At most `max_pages` pages are kept (`None` keeps
+    them all); beyond that the oldest page is dropped and its messages
+    are counted in `discarded`. Appending is O(1) amortized and reading a
+    window only decompresses the pages it overlaps. Positions count from
+    the oldest message still kept.
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY_CAPACITY, max_pages=DEFAULT_ARCHIVE_PAGES):
+        self.capacity = capacity
+        self.discarded = 0
+        self._recent = deque()
+        self._open_page = []
+        self._pages = deque(maxlen=max_pages)
+
+    def __len__(self):
+        return len(self._pages) * SPILL_PAGE_SIZE + len(self._open_page) + len(self._recent)
+
+    def append(self, role, message, timestamp=None):
+        self._recent.append({"role": role, "message": message, "timestamp": timestamp or datetime.now()})
+        if len(self._recent) > self.capacity:
+            self._spill(self._recent.popleft())
+
+    def window(self, start, stop):
+        """Messages `start` to `stop` (oldest first), reading archived pages only where the window needs them"""
+        start, stop = max(start, 0), min(stop, len(self))
+        if start >= stop:
+            return []
+        archived = len(self._pages) * SPILL_PAGE_SIZE
+        live_start = archived + len(self._open_page)
+        messages = []
+
+        for page in range(start // SPILL_PAGE_SIZE, -(-min(stop, archived) // SPILL_PAGE_SIZE)):
+            offset = page * SPILL_PAGE_SIZE
+            records = json.loads(zlib.decompress(self._pages[page]))
+            messages.extend(_from_record(record) for record in records[max(start - offset, 0):stop - offset])
+        if start < live_start and stop > archived:
+            messages.extend(_from_record(record) for record in
+                            self._open_page[max(start - archived, 0):stop - archived])
+        if stop > live_start:
+            messages.extend(islice(self._recent, max(start - live_start, 0), stop - live_start))
+
+        return messages
+
+    def page(self, number, page_size):
+        """Page `number` of `page_size` messages counted back from the newest, oldest first within the page"""
+        stop = len(self) - number * page_size
+        return self.window(stop - page_size, stop)
+
+    def page_count(self, page_size):
+        return max(1, -(-len(self) // page_size))
+
+    @property
+    def archived_bytes(self):
+        return sum(len(page) for page in self._pages)
+
+    def _spill(self, message):
+        self._open_page.append(_to_record(message))
+        if len(self._open_page) == SPILL_PAGE_SIZE:
+            if len(self._pages) == self._pages.maxlen:
+                # The deque drops its oldest page on append
+                self.discarded += SPILL_PAGE_SIZE
+            self._pages.append(zlib.compress(json.dumps(self._open_page, separators=(",", ":")).encode("utf-8")))
+            self._open_page = []
+
+
+def _to_record(message):
+    return [message["role"], message["message"], message["timestamp"].timestamp()]
+
+
+def _from_record(record):
+    role, message, timestamp = record
+    return {"role": role, "message": message, "timestamp": datetime.fromtimestamp(timestamp)}
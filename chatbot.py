@@ -1,173 +1,301 @@
 import streamlit as st
 import random
-from datetime import datetime
+import re
+import threading
+from functools import cached_property
+from types import MappingProxyType
+
+from utils.chat_history import ChatHistory
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Chat messages rendered per page; older pages are reached with the Older/Newer buttons
+CHAT_PAGE_SIZE = 20
+# Keywords shorter than this only match the whole word, so "hi" never matches inside "this"
+MIN_STEM_LENGTH = 4
+# Endings a keyword may take and still match, e.g. "treat" -> "treatments", "screen" -> "screening"
+INFLECTION_SUFFIXES = ("", "s", "es", "ed", "ing", "er", "ers", "ion", "ions", "ment", "ments", "ive", "able", "y",
+                       "al")
+# Endings that turn a final consonant + "y" into "i", e.g. "therapy" -> "therapies"
+Y_TO_I_SUFFIXES = ("es", "ed", "er", "ers")
+# Intents earlier in this list win ties, so a greeting never hides a real question
+INTENT_PRIORITY = ("risk_factors", "treatment", "prevention", "screening", "stages", "symptoms", "greeting")
+
+
+def keyword_inflections(keyword):
+    """Word forms a single-word keyword matches: itself, plus suffixed forms for stems of `MIN_STEM_LENGTH`+"""
+    if len(keyword) < MIN_STEM_LENGTH:
+        return {keyword}
+
+    forms = {keyword + suffix for suffix in INFLECTION_SUFFIXES}
+    vowel_suffixes = [suffix for suffix in INFLECTION_SUFFIXES if suffix[:1] in "aeiouy" and suffix]
+    if keyword.endswith("e"):
+        # cure -> curing, stage -> staging
+        forms.update(keyword[:-1] + suffix for suffix in vowel_suffixes)
+    if keyword[-1] not in "aeiouwxy" and keyword[-2] in "aeiou" and keyword[-3] not in "aeiou":
+        # blur -> blurred, stop -> stopping
+        forms.update(keyword + keyword[-1] + suffix for suffix in vowel_suffixes)
+    if keyword.endswith("y") and keyword[-2] not in "aeiou":
+        # therapy -> therapies, not therapys
+        forms.difference_update(keyword + suffix for suffix in ("s", "y") + Y_TO_I_SUFFIXES)
+        forms.update(keyword[:-1] + "i" + suffix for suffix in Y_TO_I_SUFFIXES)
+    return forms
+
+
+class IntentMatcher:
+    """Keyword-to-intent matcher compiled once into a token lookup table
+
+    Input is split into lowercase word tokens in one linear pass, and each
+    token, or run of tokens for multi-word keywords, is a single dict
+    lookup, so matching costs the same per input character however large
+    the vocabulary grows. Keywords match whole words only, in any of the
+    forms `keyword_inflections` generates. Every matched word adds one
+    point to its intent, and the highest score wins, ties going to the
+    intent listed first in `priority`.
+    """
+
+    def __init__(self, keywords, priority=INTENT_PRIORITY):
+        table = {}
+        self._rank = MappingProxyType({intent: rank for rank, intent in enumerate(priority)})
+
+        # Keywords exactly as written go in first, so they win over another keyword's generated form
+        entries = [(tuple(TOKEN_PATTERN.findall(keyword.lower())), intent) for keyword, intent in keywords.items()]
+        for words, intent in entries:
+            table.setdefault(words, intent)
+        for words, intent in entries:
+            for form in keyword_inflections(words[-1]):
+                table.setdefault(words[:-1] + (form,), intent)
+
+        # Read-only once built, so one matcher can be shared across threads
+        self.table = MappingProxyType(table)
+        self.max_words = max(len(words) for words, _ in entries) if entries else 1
+
+    def scores(self, text):
+        """Points per intent for every keyword found in `text`"""
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        scores = {}
+        for start in range(len(tokens)):
+            for length in range(1, min(self.max_words, len(tokens) - start) + 1):
+                intent = self.table.get(tuple(tokens[start:start + length]))
+                if intent is not None:
+                    scores[intent] = scores.get(intent, 0) + 1
+        return scores
+
+    def match(self, text):
+        """The best-scoring intent for `text`, or `None` if no keyword matches"""
+        scores = self.scores(text)
+        if not scores:
+            return None
+        return min(scores, key=lambda intent: (-scores[intent], self._rank.get(intent, len(self._rank))))
+
+
+_knowledge_indexes = {}
+_knowledge_index_lock = threading.Lock()
+
+
+def get_knowledge_index(responses):
+    """The process-wide retrieval index over the knowledge base and `responses`, opened on first use
+
+    Indexes are kept per documents fingerprint, so chatbots built with
+    different `responses` each answer from their own replies.
+    """
+    from utils.knowledge_base import KnowledgeIndex, documents_fingerprint, knowledge_documents
+
+    documents = knowledge_documents(responses)
+    fingerprint = documents_fingerprint(documents)
+    with _knowledge_index_lock:
+        if fingerprint not in _knowledge_indexes:
+            _knowledge_indexes[fingerprint] = KnowledgeIndex.open(documents)
+        return _knowledge_indexes[fingerprint]
+
+
+RESPONSES = MappingProxyType({
+    "greeting": (
+        "Hello! I'm your Diabetic Retinopathy AI Assistant. How can I help you today? 👁️",
+        "Hi there! I'm here to assist with diabetic retinopathy questions. What would you like to know? 🩺",
+        "Welcome! I'm your AI consultant for diabetic retinopathy screening and information. How can I assist? 🔍"
+    ),
+    "symptoms": (
+        "Common symptoms include blurred vision, floaters, dark areas in vision, difficulty perceiving colors, and vision loss.",
+        "Watch for: blurred vision, spots or dark strings floating, vision fluctuations, impaired color vision, and dark spots.",
+        "Symptoms progress from mild (microaneurysms) to severe (neovascularization). Early stages often show no symptoms."
+    ),
+    "stages": (
+        "Diabetic retinopathy has 4 stages: 1) Mild NPDR, 2) Moderate NPDR, 3) Severe NPDR, 4) Proliferative DR.",
+        "Stages progress from mild non-proliferative to proliferative DR. Early detection at mild stage is crucial.",
+        "The stages are: No DR → Mild → Moderate → Severe NPDR → Proliferative DR with increasing vision risk."
+    ),
+    "prevention": (
+        "Control blood sugar, maintain healthy BP/cholesterol, regular eye exams, quit smoking, and exercise regularly.",
+        "Key prevention: Annual eye exams, HbA1c <7%, BP <130/80, healthy diet, and no smoking.",
+        "Prevent progression with: Regular screening, glucose control, blood pressure management, and lifestyle changes."
+    ),
+    "treatment": (
+        "Treatments include laser surgery, anti-VEGF injections, vitrectomy, and corticosteroids based on severity.",
+        "Options: Laser photocoagulation, intravitreal injections, vitrectomy surgery, and proper diabetes management.",
+        "Treatment depends on stage: Mild - monitoring; Moderate - laser; Severe - injections/surgery."
+    ),
+    "screening": (
+        "Diabetics should have annual eye exams. More frequent if DR detected. Use AI screening for early detection.",
+        "Screen annually for Type 2 diabetes, 5 years after diagnosis for Type 1, and more often if retinopathy present.",
+        "Regular screening includes: Visual acuity test, dilated eye exam, tonometry, and retinal imaging."
+    ),
+    "risk_factors": (
+        "Risk factors: Diabetes duration, poor glucose control, high blood pressure, high cholesterol, pregnancy, smoking.",
+        "Higher risk with: Long diabetes history, high HbA1c, hypertension, nephropathy, and tobacco use.",
+        "Key risks: Duration of diabetes, blood sugar levels, blood pressure, cholesterol, and genetic factors."
+    ),
+    "default": (
+        "I specialize in diabetic retinopathy. Could you ask about symptoms, stages, prevention, treatment, or screening?",
+        "I'm here to help with diabetic retinopathy questions. Try asking about stages, symptoms, or prevention methods.",
+        "As a DR specialist, I can discuss screening, symptoms, treatments, or risk factors. What interests you?"
+    )
+})
+
+CONTEXT_KEYWORDS = MappingProxyType({
+    "hello": "greeting", "hi": "greeting", "hey": "greeting",
+    "symptom": "symptoms", "vision": "symptoms", "blur": "symptoms",
+    "stage": "stages", "level": "stages", "grade": "stages",
+    "prevent": "prevention", "avoid": "prevention", "stop": "prevention",
+    "treat": "treatment", "cure": "treatment", "therapy": "treatment",
+    "screen": "screening", "test": "screening", "exam": "screening",
+    "risk": "risk_factors", "factor": "risk_factors", "cause": "risk_factors"
+})
+
+SUGGESTED_QUESTIONS = (
+    "What are the early symptoms of diabetic retinopathy?",
+    "How often should I get screened for DR?",
+    "What are the different stages of diabetic retinopathy?",
+    "How can I prevent diabetic retinopathy?",
+    "What treatments are available for severe DR?",
+    "What are the main risk factors for developing DR?"
+)
 
 
 class DRChatbot:
-    def __init__(self):
-        self.responses = {
-            "greeting": [
-                "Hello! I'm your Diabetic Retinopathy AI Assistant. How can I help you today? 👁️",
-                "Hi there! I'm here to assist with diabetic retinopathy questions. What would you like to know? 🩺",
-                "Welcome! I'm your AI consultant for diabetic retinopathy screening and information. How can I assist? 🔍"
-            ],
-            "symptoms": [
-                "Common symptoms include blurred vision, floaters, dark areas in vision, difficulty perceiving colors, and vision loss.",
-                "Watch for: blurred vision, spots or dark strings floating, vision fluctuations, impaired color vision, and dark spots.",
-                "Symptoms progress from mild (microaneurysms) to severe (neovascularization). Early stages often show no symptoms."
-            ],
-            "stages": [
-                "Diabetic retinopathy has 4 stages: 1) Mild NPDR, 2) Moderate NPDR, 3) Severe NPDR, 4) Proliferative DR.",
-                "Stages progress from mild non-proliferative to proliferative DR. Early detection at mild stage is crucial.",
-                "The stages are: No DR → Mild → Moderate → Severe NPDR → Proliferative DR with increasing vision risk."
-            ],
-            "prevention": [
-                "Control blood sugar, maintain healthy BP/cholesterol, regular eye exams, quit smoking, and exercise regularly.",
-                "Key prevention: Annual eye exams, HbA1c <7%, BP <130/80, healthy diet, and no smoking.",
-                "Prevent progression with: Regular screening, glucose control, blood pressure management, and lifestyle changes."
-            ],
-            "treatment": [
-                "Treatments include laser surgery, anti-VEGF injections, vitrectomy, and corticosteroids based on severity.",
-                "Options: Laser photocoagulation, intravitreal injections, vitrectomy surgery, and proper diabetes management.",
-                "Treatment depends on stage: Mild - monitoring; Moderate - laser; Severe - injections/surgery."
-            ],
-            "screening": [
-                "Diabetics should have annual eye exams. More frequent if DR detected. Use AI screening for early detection.",
-                "Screen annually for Type 2 diabetes, 5 years after diagnosis for Type 1, and more often if retinopathy present.",
-                "Regular screening includes: Visual acuity test, dilated eye exam, tonometry, and retinal imaging."
-            ],
-            "risk_factors": [
-                "Risk factors: Diabetes duration, poor glucose control, high blood pressure, high cholesterol, pregnancy, smoking.",
-                "Higher risk with: Long diabetes history, high HbA1c, hypertension, nephropathy, and tobacco use.",
-                "Key risks: Duration of diabetes, blood sugar levels, blood pressure, cholesterol, and genetic factors."
-            ],
-            "default": [
-                "I specialize in diabetic retinopathy. Could you ask about symptoms, stages, prevention, treatment, or screening?",
-                "I'm here to help with diabetic retinopathy questions. Try asking about stages, symptoms, or prevention methods.",
-                "As a DR specialist, I can discuss screening, symptoms, treatments, or risk factors. What interests you?"
-            ]
-        }
-
-        self.context_keywords = {
-            "hello": "greeting", "hi": "greeting", "hey": "greeting",
-            "symptom": "symptoms", "vision": "symptoms", "blur": "symptoms",
-            "stage": "stages", "level": "stages", "grade": "stages",
-            "prevent": "prevention", "avoid": "prevention", "stop": "prevention",
-            "treat": "treatment", "cure": "treatment", "therapy": "treatment",
-            "screen": "screening", "test": "screening", "exam": "screening",
-            "risk": "risk_factors", "factor": "risk_factors", "cause": "risk_factors"
-        }
+    """Intent and response engine, immutable once built and shared by every session
+
+    All tables are read-only mappings of tuples and the compiled matcher is
+    never modified after construction, so one instance can serve
+    concurrent reruns from any number of sessions; conversation state lives
+    in each session's `ChatHistory`. The knowledge index is looked up
+    once, on the first answer. Use `get_chatbot()` for the process-wide
+    instance.
+    """
+
+    def __init__(self, responses=RESPONSES, context_keywords=CONTEXT_KEYWORDS):
+        self.responses = responses
+        self.context_keywords = context_keywords
+        self.intent_matcher = IntentMatcher(context_keywords)
 
     def get_response(self, user_input):
-        user_input = user_input.lower()
+        context = self.intent_matcher.match(user_input)
 
-        # Check for context keywords
-        for keyword, context in self.context_keywords.items():
-            if keyword in user_input:
-                return random.choice(self.responses[context])
+        # Answer from the knowledge base when a passage matches well enough
+        answer = self.knowledge_index.answer(user_input, intent=context)
+        if answer is not None:
+            return answer
+
+        # Fall back to a canned reply for the matched keywords
+        if context is not None:
+            return random.choice(self.responses[context])
 
         # Default response
         return random.choice(self.responses["default"])
 
+    @cached_property
+    def knowledge_index(self):
+        return get_knowledge_index(self.responses)
+
     def get_suggested_questions(self):
-        return [
-            "What are the early symptoms of diabetic retinopathy?",
-            "How often should I get screened for DR?",
-            "What are the different stages of diabetic retinopathy?",
-            "How can I prevent diabetic retinopathy?",
-            "What treatments are available for severe DR?",
-            "What are the main risk factors for developing DR?"
-        ]
+        return list(SUGGESTED_QUESTIONS)
+
+
+@st.cache_resource
+def get_chatbot():
+    # Built once per process; sessions only keep their own ChatHistory
+    return DRChatbot()
 
 
 def initialize_chat_session():
+    # The engine is shared by every session, so only the conversation is stored per session
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
-
-    if "chatbot" not in st.session_state:
-        st.session_state.chatbot = DRChatbot()
+        st.session_state.chat_history = ChatHistory()
+        st.session_state.chat_page = 0
 
         # Add welcome message
-        welcome_msg = random.choice(st.session_state.chatbot.responses["greeting"])
-        st.session_state.chat_history.append({
-            "role": "assistant",
-            "message": welcome_msg,
-            "timestamp": datetime.now()
-        })
+        welcome_msg = random.choice(get_chatbot().responses["greeting"])
+        st.session_state.chat_history.append("assistant", welcome_msg)
+
+
+def ask_chatbot(question):
+    """Add a question and the bot's answer to the history, and jump back to the newest page"""
+    st.session_state.chat_history.append("user", question)
+    st.session_state.chat_history.append("assistant", get_chatbot().get_response(question))
+    st.session_state.chat_page = 0
+
+
+def _submit_chat_input():
+    # Runs before the rerun, so clearing the field here keeps the question from being asked again
+    question = st.session_state.chat_input.strip()
+    st.session_state.chat_input = ""
+    if question:
+        ask_chatbot(question)
+
+
+def _chat_message_html(chat):
+    if chat["role"] == "user":
+        css_class, speaker = "user-message", "You"
+    else:
+        css_class, speaker = "assistant-message", "👁️ DR Assistant"
+    return f"""
+    <div class="chat-message {css_class}">
+        <strong>{speaker}:</strong> {chat["message"]}
+        <div style="font-size: 0.8rem; opacity: 0.7; text-align: right;">
+            {chat["timestamp"].strftime("%H:%M")}
+        </div>
+    </div>
+    """
 
 
 def display_chat_interface():
     st.markdown("### 💬 AI Chat Assistant")
 
-    # Chat container
-    chat_container = st.container()
-
-    # Display chat history
-    with chat_container:
-        for chat in st.session_state.chat_history:
-            if chat["role"] == "user":
-                st.markdown(f"""
-                <div class="chat-message user-message">
-                    <strong>You:</strong> {chat["message"]}
-                    <div style="font-size: 0.8rem; opacity: 0.7; text-align: right;">
-                        {chat["timestamp"].strftime("%H:%M")}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="chat-message assistant-message">
-                    <strong>👁️ DR Assistant:</strong> {chat["message"]}
-                    <div style="font-size: 0.8rem; opacity: 0.7; text-align: right;">
-                        {chat["timestamp"].strftime("%H:%M")}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+    history = st.session_state.chat_history
+    page_count = history.page_count(CHAT_PAGE_SIZE)
+    page = min(st.session_state.chat_page, page_count - 1)
+
+    # Older/newer paging, shown once the conversation outgrows one page
+    if page_count > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("⬅️ Older", disabled=page == page_count - 1):
+                st.session_state.chat_page = page + 1
+                st.rerun()
+        with col2:
+            last = len(history) - page * CHAT_PAGE_SIZE
+            st.caption(f"Messages {max(last - CHAT_PAGE_SIZE, 0) + 1}–{last} of {len(history)}")
+        with col3:
+            if st.button("Newer ➡️", disabled=page == 0):
+                st.session_state.chat_page = page - 1
+                st.rerun()
+
+    if history.discarded and page == page_count - 1:
+        st.caption(f"The {history.discarded:,} earliest messages of this conversation are no longer kept.")
+
+    # Only the visible page is rendered, as one block, however long the conversation gets
+    st.markdown("".join(_chat_message_html(chat) for chat in history.page(page, CHAT_PAGE_SIZE)),
+                unsafe_allow_html=True)
 
     # Suggested questions
     st.markdown("### 💡 Suggested Questions")
-    suggested_questions = st.session_state.chatbot.get_suggested_questions()
+    suggested_questions = get_chatbot().get_suggested_questions()
 
     cols = st.columns(2)
     for i, question in enumerate(suggested_questions):
         with cols[i % 2]:
-            if st.button(question, key=f"suggest_{i}"):
-                # Add user question to chat
-                st.session_state.chat_history.append({
-                    "role": "user",
-                    "message": question,
-                    "timestamp": datetime.now()
-                })
-
-                # Get and add bot response
-                response = st.session_state.chatbot.get_response(question)
-                st.session_state.chat_history.append({
-                    "role": "assistant",
-                    "message": response,
-                    "timestamp": datetime.now()
-                })
-
-                st.rerun()
+            st.button(question, key=f"suggest_{i}", on_click=ask_chatbot, args=(question,))
 
     # User input
     st.markdown("---")
-    user_input = st.text_input("💭 Ask me anything about diabetic retinopathy:",
-                               placeholder="Type your question here...")
-
-    if user_input:
-        # Add user message to chat
-        st.session_state.chat_history.append({
-            "role": "user",
-            "message": user_input,
-            "timestamp": datetime.now()
-        })
-
-        # Get bot response
-        response = st.session_state.chatbot.get_response(user_input)
-        st.session_state.chat_history.append({
-            "role": "assistant",
-            "message": response,
-            "timestamp": datetime.now()
-        })
-
-        st.rerun()
\ No newline at end of file
+    st.text_input("💭 Ask me anything about diabetic retinopathy:", key="chat_input",
+                  placeholder="Type your question here...", on_change=_submit_chat_input)
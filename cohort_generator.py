@@ -0,0 +1,163 @@
+"""Reproducible synthetic cohorts of any size, streamed to Parquet
+
+The cohort is split into fixed-size chunks. Each chunk is generated by
+`generate_sample_patients` from its own child of one
+`numpy.random.SeedSequence`, and written by a worker process to its own
+`part-NNNNN.parquet` file. So:
+
+- a worker only ever holds one chunk, and memory stays flat however many
+  rows are asked for
+- the output depends on the seed, chunk size and reference date only,
+  never on the worker count or the order chunks finish in
+
+The directory reads back as one table with `pandas.read_parquet(directory)`.
+A `_manifest.json` records the parameters and part files, and a rerun
+with the same parameters returns the existing files without generating
+anything. A rerun with other parameters only removes the part files the
+old manifest lists, so other files in the directory are left alone.
+
+    python -m utils.cohort_generator COHORT_DIR --rows 50000000 --seed 42
+    python -m utils.cohort_generator COHORT_DIR --rows 1000000 --chunk-rows 250000 --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import numpy as np
+
+from utils.helpers import generate_sample_patients
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+# Bump whenever generated columns or their distributions change, so cached cohorts are regenerated
+COHORT_FORMAT = "1"
+# Underscore-prefixed, so Parquet dataset readers skip it
+MANIFEST_FILE = "_manifest.json"
+
+
+def _write_chunk(output_dir, index, start, rows, seed_sequence, reference_date):
+    """Generate rows `start` to `start + rows` inside a worker and write them as one part file"""
+    patients_df = generate_sample_patients(rows, seed=seed_sequence, reference_date=reference_date,
+                                           start_index=start)
+    path = os.path.join(output_dir, f"part-{index:05d}.parquet")
+    tmp_path = f"{path}.tmp"
+    patients_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path, rows
+
+
+def chunk_plan(rows, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """`(index, start, rows)` for each chunk of a `rows`-row cohort"""
+    return [(index, start, min(chunk_rows, rows - start))
+            for index, start in enumerate(range(0, rows, chunk_rows))]
+
+
+def read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def generate_cohort(output_dir, rows, seed=None, chunk_rows=DEFAULT_CHUNK_ROWS, workers=None, reference_date=None):
+    """Write a `rows`-row cohort to `output_dir`, yielding `(path, rows)` as each part file is finished
+
+    Without a `seed` fresh entropy is drawn and recorded in the manifest,
+    so any cohort can be regenerated exactly. Workers are spawned rather
+    than forked, so this is safe to call from the multi-threaded Streamlit
+    server.
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    manifest = {
+        "format": COHORT_FORMAT,
+        "rows": rows,
+        "chunk_rows": chunk_rows,
+        "seed": seed_sequence.entropy,
+        "reference_date": (reference_date or date.today()).isoformat()
+    }
+    plan = chunk_plan(rows, chunk_rows)
+
+    manifest["files"] = [f"part-{index:05d}.parquet" for index, _, _ in plan]
+
+    existing = read_manifest(output_dir)
+    if existing is not None and existing.get("complete") and \
+            {key: existing.get(key) for key in manifest} == manifest and \
+            all(os.path.exists(os.path.join(output_dir, name)) for name in existing["files"]):
+        for (_, _, chunk_rows_written), name in zip(plan, existing["files"]):
+            yield os.path.join(output_dir, name), chunk_rows_written
+        return
+
+    # Only parts an earlier run recorded are removed. The new plan is recorded before any
+    # part is written and marked complete last, so an interrupted run can still be cleaned up
+    os.makedirs(output_dir, exist_ok=True)
+    for name in _recorded_files(existing):
+        for path in (os.path.join(output_dir, name), os.path.join(output_dir, f"{name}.tmp")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    _write_manifest(output_dir, manifest)
+
+    reference = date.fromisoformat(manifest["reference_date"])
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(_write_chunk, output_dir, index, start, chunk_rows_planned, child, reference)
+                   for (index, start, chunk_rows_planned), child in zip(plan, seed_sequence.spawn(len(plan)))]
+        for future in as_completed(futures):
+            yield future.result()
+
+    _write_manifest(output_dir, dict(manifest, complete=True))
+
+
+def _recorded_files(manifest):
+    """Part file names listed in a manifest, ignoring anything that is not a plain part file name"""
+    files = manifest.get("files") if isinstance(manifest, dict) else None
+    if not isinstance(files, list):
+        return []
+    return [name for name in files if isinstance(name, str) and name.startswith("part-")
+            and os.path.basename(name) == name]
+
+
+def _write_manifest(output_dir, manifest):
+    tmp_path = os.path.join(output_dir, f"{MANIFEST_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST_FILE))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic patient cohort as Parquet files")
+    parser.add_argument("output_dir", help="Directory the part files and manifest are written to")
+    parser.add_argument("--rows", type=int, required=True, help="Patients to generate")
+    parser.add_argument("--seed", type=int, help="Root seed (default: fresh entropy, recorded in the manifest)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Patients per part file (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
+    parser.add_argument("--reference-date", type=date.fromisoformat,
+                        help="Date screenings and appointments are relative to, YYYY-MM-DD (default: today)")
+    args = parser.parse_args(argv)
+
+    if args.rows < 1 or args.chunk_rows < 1:
+        parser.error("--rows and --chunk-rows must be positive")
+
+    chunks = len(chunk_plan(args.rows, args.chunk_rows))
+    written = 0
+    start = time.perf_counter()
+    for done, (path, rows) in enumerate(generate_cohort(args.output_dir, args.rows, args.seed, args.chunk_rows,
+                                                        args.workers, args.reference_date), 1):
+        written += rows
+        print(f"[{done}/{chunks}] {os.path.basename(path)}: {rows:,} rows", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    manifest = read_manifest(args.output_dir)
+    print(f"Wrote {written:,} patients in {elapsed:.1f}s ({written / elapsed:,.0f} rows/s), "
+          f"seed {manifest['seed']} -> {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Lets `pytest` from the project root import the app's `utils` and `components` packages
+
+The app imports its modules as `utils.<module>` and `components.charts`,
+but this tree keeps them flat at the root. Where those package
+directories do not exist, a temporary directory holding `utils` and
+`components` links to the root is put on `sys.path` and `PYTHONPATH`, so
+`utils.chatbot` loads `chatbot.py` here and in worker processes alike.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PACKAGES = ("utils", "components")
+
+if not all(os.path.isdir(os.path.join(ROOT, package)) for package in PACKAGES):
+    shim_dir = tempfile.mkdtemp(prefix="dr-packages-")
+    atexit.register(shutil.rmtree, shim_dir, ignore_errors=True)
+    for package in PACKAGES:
+        os.symlink(ROOT, os.path.join(shim_dir, package), target_is_directory=True)
+
+    sys.path.insert(0, shim_dir)
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [shim_dir, os.environ.get("PYTHONPATH")]))
@@ -0,0 +1,73 @@
+import functools
+import json
+import threading
+import time
+
+import plotly.graph_objects as go
+
+
+class FigureCache:
+    """Process-wide cache of plotly figures that depend only on a small hashable key
+
+    Each figure is built once and kept as its JSON spec. Every `get` hands
+    out a new figure parsed from that spec, so callers may update or add
+    traces to theirs without affecting anyone else. The spec was produced
+    by a validated figure, so it is not validated again, which makes a
+    hit a fraction of the cost of building the figure.
+    """
+
+    def __init__(self):
+        self._specs = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+
+    def get(self, key, build):
+        """Return the cached figure for `key`, calling `build()` on the first request"""
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is not None:
+                self.hits += 1
+                return _figure(spec)
+
+        start = time.perf_counter()
+        spec = build().to_json()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.misses += 1
+            self.build_seconds += elapsed
+            return _figure(self._specs.setdefault(key, spec))
+
+    def spec(self, key):
+        """Serialized JSON of a cached figure, or `None` if it has not been built"""
+        return self._specs.get(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "figures": len(self._specs),
+                "spec_bytes": sum(len(spec) for spec in self._specs.values()),
+                "build_seconds": self.build_seconds
+            }
+
+
+def _figure(spec):
+    return go.Figure(json.loads(spec), _validate=False)
+
+
+figure_cache = FigureCache()
+
+
+def cached_figure(builder):
+    """Cache a figure builder's result in `figure_cache`, keyed on its name and hashable arguments"""
+    @functools.wraps(builder)
+    def wrapper(*args):
+        return figure_cache.get((builder.__name__,) + args, lambda: builder(*args))
+
+    return wrapper
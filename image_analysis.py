@@ -0,0 +1,340 @@
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Quality is judged on a downsampled green channel, where retinal contrast is highest
+QUALITY_MAX_SIDE = 512
+
+# Pixels darker than this are outside the circular field of view
+FOV_THRESHOLD = 15
+SATURATION_LEVEL = 250
+
+# Laplacian variance at which focus reaches ~63%, for a 512px green channel
+FOCUS_SCALE = 60.0
+# Mean green intensity of a well exposed fundus, and the 5-95% spread of a high-contrast one
+ILLUMINATION_TARGET = 110.0
+CONTRAST_FULL_SPREAD = 128.0
+# A circle inscribed in the frame leaves ~21% black; more than this is vignetting or misalignment
+EXPECTED_BORDER_FRACTION = 0.35
+
+
+def green_channel(image):
+    """Return the green channel of a PIL image or RGB/grayscale array as a uint8 array"""
+    if isinstance(image, Image.Image):
+        if image.mode == "L":
+            return np.asarray(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        return np.asarray(image.getchannel("G"))
+
+    array = np.asarray(image)
+    if array.ndim == 3:
+        array = array[:, :, 1]
+    return array if array.dtype == np.uint8 else cv2.normalize(array, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+
+
+def downsample(channel, max_side):
+    """Shrink a single channel so its longest side is at most `max_side`"""
+    height, width = channel.shape
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return np.ascontiguousarray(channel)
+    return cv2.resize(channel, (max(1, round(width * scale)), max(1, round(height * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def _percentile(cumulative, fraction):
+    return float(np.searchsorted(cumulative, fraction * cumulative[-1]))
+
+
+def assess_quality(image):
+    """Measure focus, illumination, contrast and artifacts of a fundus image
+
+    Every factor is computed with whole-array cv2/NumPy operations on a
+    green channel downsampled to `QUALITY_MAX_SIDE`, so the cost is nearly
+    independent of the input resolution.
+    """
+    green = downsample(green_channel(image), QUALITY_MAX_SIDE)
+    fov = green > FOV_THRESHOLD
+    fov_pixels = int(np.count_nonzero(fov))
+
+    if fov_pixels == 0:
+        quality_factors = {"focus": 0.0, "illumination": 0.0, "contrast": 0.0, "artifact_level": 1.0}
+    else:
+        mask = fov.view(np.uint8)
+        histogram = cv2.calcHist([green], [0], mask, [256], [0, 256]).ravel()
+        cumulative = np.cumsum(histogram)
+        mean = float(np.dot(histogram, np.arange(256)) / fov_pixels)
+
+        laplacian = cv2.Laplacian(green, cv2.CV_32F, ksize=3)
+        # Erode the mask so the field-of-view edge does not count as sharp detail
+        interior = cv2.erode(mask, np.ones((5, 5), np.uint8)).astype(bool)
+        focus_variance = float(laplacian[interior].var()) if interior.any() else 0.0
+
+        spread = _percentile(cumulative, 0.95) - _percentile(cumulative, 0.05)
+        saturated_fraction = float(histogram[SATURATION_LEVEL:].sum() / fov_pixels)
+        border_fraction = 1 - fov_pixels / green.size
+
+        quality_factors = {
+            "focus": float(1 - np.exp(-focus_variance / FOCUS_SCALE)),
+            "illumination": float(np.clip(1 - abs(mean - ILLUMINATION_TARGET) / ILLUMINATION_TARGET, 0, 1)),
+            "contrast": float(np.clip(spread / CONTRAST_FULL_SPREAD, 0, 1)),
+            "artifact_level": float(np.clip(saturated_fraction * 10 +
+                                            max(0.0, border_fraction - EXPECTED_BORDER_FRACTION) * 2, 0, 1))
+        }
+
+    overall_quality = (quality_factors["focus"] + quality_factors["illumination"] +
+                       quality_factors["contrast"] + (1 - quality_factors["artifact_level"])) / 4
+
+    return {
+        "score": overall_quality,
+        "factors": quality_factors,
+        "grade": "Excellent" if overall_quality > 0.8 else "Good" if overall_quality > 0.6 else "Acceptable"
+    }
+
+
+# Lesion sizes below are in pixels of a 1024px-wide reference image and
+# are scaled to the input resolution
+REFERENCE_SIDE = 1024
+TILE_SIZE = 1024
+
+# Gaussian sigma that suppresses sensor and JPEG noise before the top-hats
+DENOISE_SIGMA = 1.0
+DARK_KERNEL = 15
+BRIGHT_KERNEL = 25
+DARK_TOPHAT_THRESHOLD = 12
+BRIGHT_TOPHAT_THRESHOLD = 20
+# Bright candidates must also stand this far above the tile's median field-of-view intensity
+BRIGHT_REGION_OFFSET = 25
+
+MIN_LESION_AREA = 5
+MICROANEURYSM_MAX_AREA = 40
+DARK_LESION_MAX_AREA = 1500
+BRIGHT_LESION_MAX_AREA = 2000
+COTTON_WOOL_MIN_AREA = 250
+# Cotton wool spots are soft; exudates have a stronger top-hat response
+EXUDATE_MIN_MEAN_TOPHAT = 40
+# Vessel fragments are elongated and sparse inside their bounding box
+MAX_ASPECT_RATIO = 3.0
+MIN_EXTENT = 0.35
+
+# Candidates this close to the field-of-view rim are edge artifacts, not lesions
+FOV_RIM_FRACTION = 0.04
+# Exudates this close to the field-of-view centre, taken to be the macula, count as macular involvement
+MACULA_RADIUS_FRACTION = 0.15
+CLUSTERED_SPREAD = 0.2
+
+
+def _odd(size):
+    size = max(3, int(round(size)))
+    return size if size % 2 else size + 1
+
+
+def _no_components():
+    return np.empty((0, 2)), np.empty(0), np.empty(0), np.empty(0), np.empty(0)
+
+
+def _components(mask, response, offset, core):
+    """Connected components of `mask` whose centroid lies inside the tile core
+
+    Returns full-image centroids, areas, extents, aspect ratios and mean
+    `response` per component, each as an array.
+    """
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask.view(np.uint8), connectivity=8)
+    if count <= 1:
+        return _no_components()
+
+    stats, centroids = stats[1:], centroids[1:]
+    inside = ((centroids[:, 0] >= core[0]) & (centroids[:, 0] < core[2]) &
+              (centroids[:, 1] >= core[1]) & (centroids[:, 1] < core[3]))
+
+    areas = stats[:, cv2.CC_STAT_AREA].astype(float)
+    widths, heights = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    extents = areas / (widths * heights)
+    aspects = np.maximum(widths, heights) / np.minimum(widths, heights)
+    means = np.bincount(labels[mask], weights=response[mask], minlength=count)[1:] / areas
+
+    return (centroids[inside] + offset, areas[inside], extents[inside], aspects[inside], means[inside])
+
+
+def detect_lesions(image, tile_size=TILE_SIZE):
+    """Find lesion candidates in a fundus image at full resolution
+
+    Dark lesions (microaneurysms, hemorrhages) come from a black top-hat of
+    the green channel and bright lesions (exudates, cotton wool spots) from
+    a white top-hat combined with a bright-region threshold. The image is
+    processed in overlapping tiles so memory stays bounded, and each
+    component is counted by the one tile whose core holds its centroid.
+
+    Returns `(lesions, timings)`: per-type centroid/area/intensity arrays
+    plus field-of-view geometry, and seconds spent in each stage.
+    """
+    timings = {}
+    start = time.perf_counter()
+    green = green_channel(image)
+    height, width = green.shape
+    timings["green_channel"] = time.perf_counter() - start
+
+    scale = max(height, width) / REFERENCE_SIDE
+    area_scale = scale * scale
+    dark_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (_odd(DARK_KERNEL * scale),) * 2)
+    bright_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (_odd(BRIGHT_KERNEL * scale),) * 2)
+    margin = _odd(BRIGHT_KERNEL * scale) * 2
+
+    # Field-of-view geometry only needs a coarse mask
+    start = time.perf_counter()
+    small = downsample(green, QUALITY_MAX_SIDE)
+    fov_rows, fov_cols = np.nonzero(small > FOV_THRESHOLD)
+    fov_scale = width / small.shape[1]
+    if len(fov_rows):
+        fov_center = (fov_cols.mean() * fov_scale, fov_rows.mean() * fov_scale)
+        fov_radius = np.sqrt(len(fov_rows) / np.pi) * fov_scale
+    else:
+        fov_center, fov_radius = (width / 2, height / 2), 0.0
+    timings["fov_mask"] = time.perf_counter() - start
+
+    found = {"dark": [_no_components()], "bright": [_no_components()]}
+    for stage in ("denoise", "dark_tophat", "bright_tophat", "components"):
+        timings[stage] = 0.0
+
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            top, left = max(0, y0 - margin), max(0, x0 - margin)
+            tile = green[top:min(height, y0 + tile_size + margin), left:min(width, x0 + tile_size + margin)]
+            core = (x0 - left, y0 - top, min(tile_size, width - x0) + x0 - left,
+                    min(tile_size, height - y0) + y0 - top)
+
+            fov = (tile > FOV_THRESHOLD).view(np.uint8)
+            if not fov.any():
+                continue
+
+            start = time.perf_counter()
+            tile = cv2.GaussianBlur(tile, (0, 0), DENOISE_SIGMA * scale)
+            timings["denoise"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            dark_response = cv2.morphologyEx(tile, cv2.MORPH_BLACKHAT, dark_kernel)
+            dark_mask = (dark_response > DARK_TOPHAT_THRESHOLD) & fov.view(bool)
+            timings["dark_tophat"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            bright_response = cv2.morphologyEx(tile, cv2.MORPH_TOPHAT, bright_kernel)
+            cumulative = np.cumsum(cv2.calcHist([tile], [0], fov, [256], [0, 256]).ravel())
+            background = _percentile(cumulative, 0.5)
+            bright_mask = ((bright_response > BRIGHT_TOPHAT_THRESHOLD) &
+                           (tile > background + BRIGHT_REGION_OFFSET) & fov.view(bool))
+            timings["bright_tophat"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            found["dark"].append(_components(dark_mask, dark_response, (left, top), core))
+            found["bright"].append(_components(bright_mask, bright_response, (left, top), core))
+            timings["components"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    dark_centroids, dark_areas, dark_extents, dark_aspects, dark_means = map(np.concatenate, zip(*found["dark"]))
+    bright_centroids, bright_areas, bright_extents, bright_aspects, bright_means = map(np.concatenate,
+                                                                                      zip(*found["bright"]))
+
+    inner_radius = fov_radius * (1 - FOV_RIM_FRACTION)
+    dark_inside = np.hypot(*(dark_centroids - fov_center).T) <= inner_radius
+    bright_inside = np.hypot(*(bright_centroids - fov_center).T) <= inner_radius
+
+    blob_like = (dark_inside & (dark_extents >= MIN_EXTENT) & (dark_aspects <= MAX_ASPECT_RATIO) &
+                 (dark_areas >= MIN_LESION_AREA * area_scale))
+    microaneurysms = blob_like & (dark_areas <= MICROANEURYSM_MAX_AREA * area_scale)
+    hemorrhages = (blob_like & (dark_areas > MICROANEURYSM_MAX_AREA * area_scale) &
+                   (dark_areas <= DARK_LESION_MAX_AREA * area_scale))
+
+    bright_blobs = (bright_inside & (bright_extents >= MIN_EXTENT) & (bright_aspects <= MAX_ASPECT_RATIO) &
+                    (bright_areas >= MIN_LESION_AREA * area_scale) &
+                    (bright_areas <= BRIGHT_LESION_MAX_AREA * area_scale))
+    cotton_wool = (bright_blobs & (bright_areas >= COTTON_WOOL_MIN_AREA * area_scale) &
+                   (bright_means < EXUDATE_MIN_MEAN_TOPHAT))
+    exudates = bright_blobs & ~cotton_wool
+
+    def select(centroids, areas, means, keep):
+        return {"centroids": centroids[keep], "areas": areas[keep], "intensities": means[keep]}
+
+    lesions = {
+        "microaneurysms": select(dark_centroids, dark_areas, dark_means, microaneurysms),
+        "hemorrhages": select(dark_centroids, dark_areas, dark_means, hemorrhages),
+        "exudates": select(bright_centroids, bright_areas, bright_means, exudates),
+        "cotton_wool_spots": select(bright_centroids, bright_areas, bright_means, cotton_wool),
+        "fov_center": fov_center,
+        "fov_radius": fov_radius,
+        "scale": scale
+    }
+    timings["classification"] = time.perf_counter() - start
+
+    return lesions, timings
+
+
+def _locations(centroids):
+    return [(int(round(x)), int(round(y))) for x, y in centroids]
+
+
+def extract_features(image):
+    """Build the analysis `features` dict from detected lesion candidates
+
+    Returns `(features, timings)` with the same keys the mock analysis
+    produced, filled from real counts and centroids.
+
+    The fovea is not located: `macular_involvement` takes the macula to be
+    the disc of `MACULA_RADIUS_FRACTION` of the field-of-view radius
+    around the field-of-view centre. That holds for macula-centred
+    photographs, the usual DR screening view, but on disc-centred or
+    wide-field images the macula sits off centre, so exudates near it can
+    be missed and exudates near the optic disc reported as macular.
+    """
+    lesions, timings = detect_lesions(image)
+    fov_center = np.asarray(lesions["fov_center"])
+    fov_radius = lesions["fov_radius"]
+    fov_area_reference = np.pi * fov_radius ** 2 / lesions["scale"] ** 2
+
+    microaneurysms = lesions["microaneurysms"]
+    hemorrhages = lesions["hemorrhages"]
+    exudates = lesions["exudates"]
+    cotton_wool = lesions["cotton_wool_spots"]
+
+    # Size variance is the coefficient of variation of hemorrhage areas
+    hemorrhage_areas = hemorrhages["areas"]
+    size_variance = float(hemorrhage_areas.std() / hemorrhage_areas.mean()) if len(hemorrhage_areas) > 1 else 0.0
+
+    macular_distance = np.hypot(*(exudates["centroids"] - fov_center).T)
+    macular_involvement = bool(fov_radius and (macular_distance <= fov_radius * MACULA_RADIUS_FRACTION).any())
+
+    if len(cotton_wool["areas"]) <= 1 or not fov_radius:
+        distribution = "focal"
+    else:
+        spread = np.hypot(*(cotton_wool["centroids"] - cotton_wool["centroids"].mean(axis=0)).T).mean()
+        distribution = "clustered" if spread / fov_radius < CLUSTERED_SPREAD else "scattered"
+
+    features = {
+        "microaneurysms": {
+            "count": len(microaneurysms["areas"]),
+            # Microaneurysms per 10,000 reference-scale field-of-view pixels, capped at 1
+            "density": float(min(len(microaneurysms["areas"]) * 10_000 / fov_area_reference, 1))
+            if fov_area_reference else 0.0,
+            "locations": _locations(microaneurysms["centroids"])
+        },
+        "hemorrhages": {
+            "count": len(hemorrhage_areas),
+            "size_variance": size_variance,
+            "locations": _locations(hemorrhages["centroids"])
+        },
+        "exudates": {
+            "count": len(exudates["areas"]),
+            "intensity": float(exudates["intensities"].mean() / 255) if len(exudates["areas"]) else 0.0,
+            "macular_involvement": macular_involvement,
+            "locations": _locations(exudates["centroids"])
+        },
+        "cotton_wool_spots": {
+            "count": len(cotton_wool["areas"]),
+            "distribution": distribution,
+            "locations": _locations(cotton_wool["centroids"])
+        }
+    }
+
+    return features, timings
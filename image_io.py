@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+# Longest side of the buffer shared by the preview and the analysis pipeline
+ANALYSIS_MAX_SIDE = int(os.environ.get("DR_ANALYSIS_MAX_SIDE", "2048"))
+# Sources larger than this are rejected before any pixel data is decoded
+MAX_SOURCE_PIXELS = int(os.environ.get("DR_MAX_SOURCE_PIXELS", str(64_000_000)))
+
+
+def decode_fundus_image(source, max_side=ANALYSIS_MAX_SIDE):
+    """Decode an image file or upload into one read-only RGB array of at most `max_side` pixels a side
+
+    Only the header is read before the size is checked. JPEGs are decoded
+    straight at a reduced DCT scale through `draft`, and other formats are
+    shrunk with an integer `reduce`. Uncompressed TIFFs opened from a path
+    are memory-mapped by Pillow, so the full-resolution pixels never land
+    on the heap. The returned array is the only copy kept: pass it to both
+    `st.image` and the analyzer.
+
+    Returns `(array, info)` where `info` holds the original size and the
+    analysis-to-original scale factor.
+    """
+    with Image.open(source) as image:
+        original_size = image.size
+        if original_size[0] * original_size[1] > MAX_SOURCE_PIXELS:
+            raise ValueError(f"image is {original_size[0]}x{original_size[1]}, "
+                             f"larger than the {MAX_SOURCE_PIXELS:,} pixel limit")
+
+        factor = max(1, -(-max(original_size) // max_side))
+        if image.format == "JPEG" and factor > 1:
+            image.draft("RGB", (original_size[0] // factor, original_size[1] // factor))
+
+        # draft() may already have shrunk the image; reduce() finishes the job on the decoded pixels
+        factor = max(1, -(-max(image.size) // max_side))
+        reduced = image.reduce(factor) if factor > 1 else image
+        rgb = reduced if reduced.mode == "RGB" else reduced.convert("RGB")
+
+        array = np.asarray(rgb)
+
+    array.flags.writeable = False
+    return array, {
+        "original_size": original_size,
+        "analysis_size": (array.shape[1], array.shape[0]),
+        "scale": array.shape[1] / original_size[0]
+    }
@@ -0,0 +1,311 @@
+"""Diabetic retinopathy reference content and a persisted TF-IDF index over it
+
+The content shown on the Knowledge Base page lives here, so the page and
+the chatbot's retrieval answer from the same text. The index is built
+once with scikit-learn, saved as plain NumPy arrays plus a JSON sidecar,
+and memory-mapped on later starts; queries are scored against term
+postings with NumPy alone, so answering never imports scikit-learn.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+
+import numpy as np
+
+from utils.dr_engine import DR_STAGES, TREATMENT_OPTIONS
+
+DEFAULT_INDEX_DIR = os.environ.get("DR_KB_INDEX", os.path.join("data", "kb_index"))
+# Bump whenever the analyzer or weighting changes so saved indexes are rebuilt
+INDEX_FORMAT = "1"
+# Each index is saved in a subdirectory named by this many leading characters of its fingerprint
+FINGERPRINT_DIR_LENGTH = 16
+# Saved indexes kept per index directory, counting the one just saved; older ones are pruned
+KEEP_INDEXES = 3
+INDEX_FILES = ("idf.npy", "indptr.npy", "doc_ids.npy", "weights.npy", "index.json")
+# Cosine similarity below which a retrieved passage is not considered an answer
+MIN_ANSWER_SCORE = 0.2
+# Added to passages of the intent the keyword matcher picked, to break near ties toward the question's topic
+INTENT_BOOST = 0.1
+
+SYMPTOMS_BY_STAGE = {
+    "Early Stage": ["Often asymptomatic", "Mild vision fluctuations", "Microaneurysms visible on imaging"],
+    "Moderate Stage": ["Blurred vision", "Difficulty reading", "Retinal hemorrhages", "Cotton wool spots"],
+    "Advanced Stage": ["Significant vision loss", "Floaters", "Dark spots", "Impaired color vision",
+                       "Macular edema"],
+    "Proliferative Stage": ["Severe vision loss", "Vitreous hemorrhage", "Retinal detachment",
+                            "Neovascularization"]
+}
+
+PREVENTION_METHODS = {
+    "🎯 Blood Sugar Control": "Maintain HbA1c below 7% through medication, diet, and exercise",
+    "🩺 Regular Screening": "Annual eye exams for all diabetic patients, more frequent if DR detected",
+    "💊 Blood Pressure Management": "Keep BP below 130/80 mmHg with medication and lifestyle changes",
+    "🥗 Healthy Lifestyle": "Balanced diet, regular exercise, weight management, smoking cessation",
+    "📊 Cholesterol Control": "Manage lipid levels through diet and medication if needed",
+    "👁️ Early Detection": "Use AI screening tools for regular monitoring and early intervention"
+}
+
+CLINICAL_GUIDELINES = {
+    "Screening Frequency": {
+        "Type 1 Diabetes": "Annual screening starting 5 years after diagnosis",
+        "Type 2 Diabetes": "Annual screening from time of diagnosis",
+        "Pregnancy": "First trimester and close monitoring throughout pregnancy",
+        "Established DR": "3-12 months based on severity"
+    },
+    "Referral Criteria": {
+        "Urgent Referral": "PDR, vitreous hemorrhage, retinal detachment",
+        "Early Referral": "Severe NPDR, clinically significant macular edema",
+        "Routine Referral": "Moderate NPDR with poor risk factor control"
+    },
+    "Monitoring Parameters": {
+        "Metabolic": "HbA1c every 3-6 months, target <7%",
+        "Ocular": "Visual acuity, retinal imaging, OCT when indicated",
+        "Systemic": "Blood pressure, lipid profile, renal function"
+    }
+}
+
+GUIDELINE_INTENTS = {"Screening Frequency": "screening", "Monitoring Parameters": "screening"}
+
+TOKEN_PATTERN = re.compile(r"\w\w+")
+STOP_WORDS = frozenset("""
+    a about after all also am an and any are as at be been before being but by can could did do does doing
+    for from had has have having how i if in into is it its me more most my no not of on or other our should
+    so some such than that the their them then there these they this those through to too very was we were
+    what when where which while who why will with would you your
+    diabetic retinopathy dr
+""".split())
+# Stripped in this order, keeping at least `MIN_STEM_LENGTH` characters, so "treatments" and "treated" meet
+STEM_SUFFIXES = ("ments", "ment", "ions", "ion", "ing", "ed", "s")
+MIN_STEM_LENGTH = 4
+
+
+def stem(word):
+    for suffix in STEM_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH and not word.endswith("ss"):
+            return word[:-len(suffix)]
+    return word
+
+
+def analyze(text):
+    """Stemmed lowercase unigrams and bigrams without stop words, used for documents and queries alike
+
+    Every passage is about diabetic retinopathy, so those words are
+    treated as stop words rather than letting them match everything.
+    """
+    words = [stem(word) for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def knowledge_documents(responses=None):
+    """Every passage the index answers from, as `{"title", "text", "intent"}` dicts
+
+    `responses` is an optional mapping of intent to canned chatbot
+    replies; all but the greeting and default replies are indexed too.
+    """
+    documents = []
+    for stage_num, stage_info in DR_STAGES.items():
+        documents.append({
+            "title": f"Stage {stage_num}: {stage_info['name']}",
+            "text": f"{stage_info['description']}. Risk level: {stage_info['risk']}. "
+                    f"Follow-up: {stage_info['follow_up']}.",
+            "intent": "stages"
+        })
+    for stage, symptoms in SYMPTOMS_BY_STAGE.items():
+        documents.append({"title": f"{stage} symptoms", "text": f"{', '.join(symptoms)}.", "intent": "symptoms"})
+    for severity, treatments in TREATMENT_OPTIONS.items():
+        documents.append({"title": f"Treatment options for {severity} DR", "text": f"{', '.join(treatments)}.",
+                          "intent": "treatment"})
+    for method, description in PREVENTION_METHODS.items():
+        documents.append({"title": f"Prevention: {method.split(' ', 1)[1]}", "text": f"{description}.",
+                          "intent": "prevention"})
+    for category, items in CLINICAL_GUIDELINES.items():
+        for item, description in items.items():
+            documents.append({"title": f"{category}: {item}", "text": f"{description}.",
+                              "intent": GUIDELINE_INTENTS.get(category)})
+    for intent, replies in (responses or {}).items():
+        if intent not in ("greeting", "default"):
+            documents.extend({"title": "", "text": reply, "intent": intent} for reply in replies)
+    return documents
+
+
+class KnowledgeIndex:
+    """TF-IDF retrieval over `knowledge_documents`, stored as term postings
+
+    Postings are a CSR matrix with one row per term: `indptr` delimits
+    each term's run of document ids and weights (L2-normalized TF-IDF, so
+    summing query weight times document weight gives cosine similarity).
+    A query only touches the postings of its own terms.
+    """
+
+    def __init__(self, documents, vocabulary, idf, indptr, doc_ids, weights, fingerprint):
+        self.documents = documents
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.fingerprint = fingerprint
+        # Built up front rather than on first use, so concurrent searches never write to the index
+        intents = {document.get("intent") for document in documents} - {None}
+        self._intent_masks = {intent: np.array([document.get("intent") == intent for document in documents])
+                              for intent in intents}
+
+    @classmethod
+    def build(cls, documents):
+        """Fit the TF-IDF weights with scikit-learn and transpose them into term postings"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(analyzer=analyze, sublinear_tf=True, norm="l2")
+        matrix = vectorizer.fit_transform(_passage(document) for document in documents)
+        postings = matrix.T.tocsr()
+        postings.sort_indices()
+
+        return cls(documents, {term: int(column) for term, column in vectorizer.vocabulary_.items()},
+                   vectorizer.idf_, postings.indptr.astype(np.int64), postings.indices.astype(np.int32),
+                   postings.data.astype(np.float32), documents_fingerprint(documents))
+
+    def save(self, path=DEFAULT_INDEX_DIR):
+        """Save under `path` in this index's fingerprint directory and prune the oldest other ones
+
+        Indexes over different documents live side by side, so processes
+        serving different responses never overwrite each other's files.
+        """
+        directory = _index_dir(path, self.fingerprint)
+        os.makedirs(directory, exist_ok=True)
+        for name in ("idf", "indptr", "doc_ids", "weights"):
+            _replace_file(directory, f"{name}.npy", lambda handle, name=name: np.save(handle, getattr(self, name)))
+
+        # The sidecar is written last, so a half-written index never matches a fingerprint
+        _replace_file(directory, "index.json", lambda handle: handle.write(json.dumps({
+            "fingerprint": self.fingerprint, "documents": self.documents, "vocabulary": self.vocabulary
+        }).encode("utf-8")))
+        _prune_indexes(path, keep=directory)
+
+    @classmethod
+    def load(cls, fingerprint, path=DEFAULT_INDEX_DIR):
+        """Open the index saved under `path` for `fingerprint` with its arrays memory-mapped, or return `None`
+
+        An unreadable, incomplete or inconsistent index, such as one left
+        by an older format or by two processes saving at once, also
+        returns `None`, so `open` rebuilds it.
+        """
+        directory = _index_dir(path, fingerprint)
+        try:
+            with open(os.path.join(directory, "index.json"), encoding="utf-8") as handle:
+                meta = json.load(handle)
+            arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                      for name in ("idf", "indptr", "doc_ids", "weights")}
+            index = cls(meta["documents"], meta["vocabulary"], fingerprint=meta["fingerprint"], **arrays)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+        terms = len(index.vocabulary)
+        if index.fingerprint != fingerprint or len(index.idf) != terms or len(index.indptr) != terms + 1 or \
+                not len(index.doc_ids) == len(index.weights) == index.indptr[-1]:
+            return None
+        return index
+
+    @classmethod
+    def open(cls, documents, path=DEFAULT_INDEX_DIR):
+        """Load the saved index for `documents`, building and saving it if it is missing or stale"""
+        fingerprint = documents_fingerprint(documents)
+        index = cls.load(fingerprint, path)
+        if index is None:
+            index = cls.build(documents)
+            try:
+                index.save(path)
+            except OSError:
+                # A read-only deployment still answers from the in-memory index
+                pass
+        return index
+
+    def search(self, query, limit=3, intent=None, intent_boost=INTENT_BOOST):
+        """The `limit` best `(score, document)` pairs for `query`, best first
+
+        Passages tagged with `intent`, if given, score `intent_boost` higher
+        as long as they share at least one term with the query.
+        """
+        counts = Counter(term for term in analyze(query) if term in self.vocabulary)
+        if not counts:
+            return []
+
+        terms = np.array([self.vocabulary[term] for term in counts])
+        query_weights = np.array([1 + math.log(count) for count in counts.values()]) * self.idf[terms]
+        query_weights /= np.linalg.norm(query_weights)
+
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term, query_weight in zip(terms, query_weights):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            scores[self.doc_ids[start:end]] += query_weight * self.weights[start:end]
+
+        if intent in self._intent_masks:
+            scores[(scores > 0) & self._intent_masks[intent]] += intent_boost
+
+        best = np.argsort(-scores, kind="stable")[:limit]
+        return [(float(scores[doc]), self.documents[doc]) for doc in best if scores[doc] > 0]
+
+    def answer(self, query, intent=None, min_score=MIN_ANSWER_SCORE):
+        """The best passage for `query` formatted as a reply, or `None` if nothing scores `min_score`"""
+        results = self.search(query, limit=1, intent=intent)
+        if not results or results[0][0] < min_score:
+            return None
+        return _passage(results[0][1], markdown=True)
+
+
+def documents_fingerprint(documents):
+    payload = json.dumps([INDEX_FORMAT, documents], sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _index_dir(path, fingerprint):
+    return os.path.join(path, fingerprint[:FINGERPRINT_DIR_LENGTH])
+
+
+def _prune_indexes(path, keep):
+    """Remove all but the `KEEP_INDEXES` most recently saved fingerprint directories under `path`
+
+    `keep` is never removed. Files of the old layout, saved directly in
+    `path`, go too. A process still serving a pruned index keeps its
+    memory maps; it only rebuilds on its next start.
+    """
+    for name in INDEX_FILES:
+        try:
+            os.remove(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+    saved = []
+    for entry in os.scandir(path):
+        if entry.is_dir() and re.fullmatch(f"[0-9a-f]{{{FINGERPRINT_DIR_LENGTH}}}", entry.name) \
+                and entry.path != keep:
+            try:
+                saved.append((os.stat(os.path.join(entry.path, "index.json")).st_mtime, entry.path))
+            except FileNotFoundError:
+                # Still being written by another process, or left half-written
+                saved.append((entry.stat().st_mtime, entry.path))
+    for _, directory in sorted(saved, reverse=True)[KEEP_INDEXES - 1:]:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _replace_file(directory, name, write):
+    """Write `directory/name` through a uniquely named temporary file, so concurrent savers never share one"""
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            write(handle)
+        os.replace(tmp_path, os.path.join(directory, name))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _passage(document, markdown=False):
+    if not document["title"]:
+        return document["text"]
+    title = f"**{document['title']}:**" if markdown else f"{document['title']}:"
+    return f"{title} {document['text']}"
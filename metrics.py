@@ -0,0 +1,146 @@
+"""Lightweight latency instrumentation shared by the app and the analysis engine
+
+Each series keeps its most recent samples in a fixed-size ring buffer, so
+percentiles describe current behaviour rather than the whole process
+lifetime, and memory stays constant under load. Series are exported in the
+Prometheus text format as summaries, with `quantile` labels plus lifetime
+`_sum` and `_count`, so a node exporter textfile collector or any scraper
+reading the file can pick them up.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+DEFAULT_METRICS_FILE = os.environ.get("DR_METRICS_FILE", os.path.join("data", "metrics.prom"))
+# Samples kept per series for the rolling percentiles
+DEFAULT_WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+# The Prometheus file is rewritten at most this often, in seconds
+WRITE_INTERVAL = 5.0
+
+ANALYSIS_SECONDS = "dr_analysis_seconds"
+ANALYSIS_STAGE_SECONDS = "dr_analysis_stage_seconds"
+SECTION_RENDER_SECONDS = "dr_section_render_seconds"
+
+HELP = {
+    ANALYSIS_SECONDS: "Wall time of one fundus image analysis, from quality assessment to scoring",
+    ANALYSIS_STAGE_SECONDS: "Wall time of each analysis pipeline stage",
+    SECTION_RENDER_SECONDS: "Wall time of one app section render, including its brief wait for the next "
+                            "update of a running analysis",
+}
+
+
+class RollingHistogram:
+    """The last `window` observations of one series, plus lifetime count and sum"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self._samples = np.zeros(window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self._samples[self.count % len(self._samples)] = value
+        self.count += 1
+        self.sum += value
+
+    def samples(self):
+        return self._samples[:min(self.count, len(self._samples))]
+
+    def quantiles(self, quantiles=QUANTILES):
+        samples = self.samples()
+        if not len(samples):
+            return {quantile: float("nan") for quantile in quantiles}
+        return dict(zip(quantiles, np.quantile(samples, quantiles).tolist()))
+
+
+class MetricsRegistry:
+    """Thread-safe collection of rolling histograms keyed by metric name and labels"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = RollingHistogram(self.window)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the block and record it, also when it exits with an exception such as a Streamlit rerun"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """One row per series: name, labels, count, mean and the rolling quantiles"""
+        with self._lock:
+            return [{"name": name, "labels": dict(labels), "count": histogram.count,
+                     "mean": histogram.sum / histogram.count,
+                     **{f"p{round(quantile * 100)}": value for quantile, value in histogram.quantiles().items()}}
+                    for (name, labels), histogram in sorted(self._series.items())]
+
+    def summary(self, name, **labels):
+        """The snapshot row of one series, or `None` if nothing was observed"""
+        for row in self.snapshot():
+            if row["name"] == name and row["labels"] == labels:
+                return row
+        return None
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            series = sorted(self._series.items())
+            names = []
+            for (name, labels), histogram in series:
+                if name not in names:
+                    names.append(name)
+                    if name in HELP:
+                        lines.append(f"# HELP {name} {HELP[name]}")
+                    lines.append(f"# TYPE {name} summary")
+                for quantile, value in histogram.quantiles().items():
+                    lines.append(f"{name}{_labels(labels + (('quantile', str(quantile)),))} {value!r}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum!r}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=DEFAULT_METRICS_FILE):
+        """Atomically replace `path` with the current metrics, so a scraper never reads a partial file"""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+        self._last_write = time.monotonic()
+
+    def maybe_write_prometheus(self, path=DEFAULT_METRICS_FILE, interval=WRITE_INTERVAL):
+        """Write the Prometheus file if `interval` seconds have passed since the last write"""
+        if time.monotonic() - self._last_write < interval:
+            return False
+        try:
+            self.write_prometheus(path)
+        except OSError:
+            # Metrics export must never break a page render
+            return False
+        return True
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,233 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.patient_store import SCAN_CHUNK_ROWS
+
+RANGE_COLUMNS = ['age', 'hba1c']
+BITMAP_COLUMNS = ['dr_stage', 'gender', 'diabetes_type']
+
+# A range matching more than this fraction of the cohort is cheaper to
+# evaluate as a vectorized comparison than by gathering candidate rows
+SPARSE_DRIVER_FRACTION = 1 / 16
+
+# Above this fraction of the cohort, row ids are ordered by marking a dense
+# mask instead of sorting them
+DENSE_RESULT_FRACTION = 1 / 64
+
+
+class PatientFilterIndex:
+    """Range and bitmap indexes over the Patient Management filter columns
+
+    `age` and `hba1c` are kept as argsort permutations with their sorted
+    values, so a range predicate is two binary searches and a slice.
+    `dr_stage`, `gender` and `diabetes_type` are kept as one packed bitmap
+    per distinct value. A selective query drives from the narrowest range
+    and checks the other predicates on the candidate ids only; a wide one
+    falls back to vectorized comparisons ANDed with the bitmaps. Either
+    way it returns row positions into the indexed columns. `version` is
+    the store version the columns were read at.
+    """
+
+    def __init__(self, columns, version=0):
+        self.version = version
+        self.size = len(next(iter(columns.values())))
+        self.rowids = np.asarray(columns['rowid']) if 'rowid' in columns else np.arange(self.size)
+
+        self._values = {}
+        self._ranges = {}
+        for column in RANGE_COLUMNS:
+            values = np.asarray(columns[column])
+            order = np.argsort(values, kind='stable')
+            self._values[column] = values
+            self._ranges[column] = (order, values[order])
+
+        self._bitmaps = {}
+        for column in BITMAP_COLUMNS:
+            codes, distinct = pd.factorize(columns[column])
+            self._bitmaps[column] = {
+                value.item() if hasattr(value, 'item') else value: np.packbits(codes == code)
+                for code, value in enumerate(distinct)
+            }
+
+    @classmethod
+    def from_store(cls, store, chunk_rows=SCAN_CHUNK_ROWS):
+        """Build the index with one chunked scan of `store`
+
+        Only one chunk of SQLite rows is held as Python objects at a time;
+        each chunk is reduced to NumPy arrays, with the bitmap columns
+        coded to small integers. The finished index costs about 56 bytes
+        per patient: the rowid, and per range column its values, their
+        argsort order and the sorted values, at 8 bytes each, plus one bit
+        per patient per distinct bitmap value. The store's lock is only
+        held per chunk, so other sessions are not stalled by the scan.
+        """
+        version = store.version
+        parts = {column: [] for column in ['rowid'] + RANGE_COLUMNS + BITMAP_COLUMNS}
+        categories = {column: {} for column in BITMAP_COLUMNS}
+
+        for chunk in store.column_chunks(list(parts), chunk_rows):
+            for column in ['rowid'] + RANGE_COLUMNS:
+                parts[column].append(chunk[column])
+            for column, codes in categories.items():
+                chunk_codes, distinct = pd.factorize(chunk[column])
+                mapping = np.array([codes.setdefault(value.item() if hasattr(value, 'item') else value, len(codes))
+                                    for value in distinct], dtype=np.int32)
+                parts[column].append(mapping[chunk_codes])
+
+        columns = {column: np.concatenate(chunks) if chunks else np.array([], dtype=np.int64)
+                   for column, chunks in parts.items()}
+        for column, codes in categories.items():
+            columns[column] = pd.Categorical.from_codes(columns[column], list(codes))
+        return cls(columns, version)
+
+    def refreshed(self, store):
+        """This index brought up to `store`'s version
+
+        Returns `self` if nothing changed. Otherwise only the rows written
+        since are read, by rowid, and applied with `updated`; a full
+        rescan happens only when the store no longer knows which rows
+        changed, e.g. after a bulk load.
+        """
+        version, rowids = store.changes_since(self.version)
+        if version == self.version:
+            return self
+        if rowids is None:
+            return self.from_store(store)
+        return self.updated(store.fetch_rowids(rowids, columns=['rowid'] + RANGE_COLUMNS + BITMAP_COLUMNS),
+                            version)
+
+    def updated(self, rows, version):
+        """A new index with `rows`, a frame of changed or added patients with their rowids, applied
+
+        Costs one re-sort of the in-memory columns and no store reads;
+        this index is left untouched, so sessions holding it keep
+        filtering safely.
+        """
+        rowids = rows['rowid'].to_numpy()
+        positions = np.searchsorted(self.rowids, rowids)
+        existing = positions < self.size
+        existing[existing] = self.rowids[positions[existing]] == rowids[existing]
+
+        columns = {'rowid': self.rowids, **self._values}
+        columns.update({column: self._codes(column) for column in BITMAP_COLUMNS})
+        categories = {column: list(self._bitmaps[column]) for column in BITMAP_COLUMNS}
+
+        added = ~existing
+        columns = {column: np.concatenate([values, np.zeros(added.sum(), dtype=values.dtype)])
+                   for column, values in columns.items()}
+        targets = positions.copy()
+        targets[added] = self.size + np.arange(added.sum())
+        columns['rowid'][targets] = rowids
+        for column in RANGE_COLUMNS:
+            columns[column][targets] = rows[column].to_numpy()
+        for column, values in categories.items():
+            codes = {value: code for code, value in enumerate(values)}
+            for value in rows[column].tolist():
+                if value not in codes:
+                    codes[value] = len(values)
+                    values.append(value)
+            columns[column][targets] = [codes[value] for value in rows[column].tolist()]
+
+        if np.any(np.diff(columns['rowid']) < 0):
+            order = np.argsort(columns['rowid'], kind='stable')
+            columns = {column: values[order] for column, values in columns.items()}
+        for column, values in categories.items():
+            columns[column] = pd.Categorical.from_codes(columns[column], values)
+        return type(self)(columns, version)
+
+    def _codes(self, column):
+        """Codes of a bitmap column into the order of `self._bitmaps[column]`, unpacked from the bitmaps"""
+        codes = np.zeros(self.size, dtype=np.int32)
+        for code, bits in enumerate(self._bitmaps[column].values()):
+            codes[np.unpackbits(bits, count=self.size).view(bool)] = code
+        return codes
+
+    def values(self, column):
+        """Distinct values of a bitmap-indexed column"""
+        return sorted(self._bitmaps[column])
+
+    def range_ids(self, column, low, high):
+        """Row positions with `low <= column <= high`, in value order"""
+        order, sorted_values = self._ranges[column]
+        start = np.searchsorted(sorted_values, low, side='left')
+        stop = np.searchsorted(sorted_values, high, side='right')
+        return order[start:stop]
+
+    def bitmap(self, column, values):
+        """Packed bitmap of rows whose `column` is any of `values`"""
+        bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for value in values:
+            if value in self._bitmaps[column]:
+                bits |= self._bitmaps[column][value]
+        return bits
+
+    def filter(self, age_range=None, hba1c_range=None, **categories):
+        """Return the row positions matching every given predicate, in row order
+
+        Range arguments are inclusive `(low, high)` tuples; keyword
+        arguments name a bitmap column and the values to keep. `None`
+        leaves a predicate out.
+        """
+        bits = None
+        for column, values in categories.items():
+            if values is None:
+                continue
+            column_bits = self.bitmap(column, values)
+            bits = column_bits if bits is None else bits & column_bits
+
+        ranges = [(column, bounds) for column, bounds in (('age', age_range), ('hba1c', hba1c_range))
+                  if bounds is not None]
+        if not ranges:
+            if bits is None:
+                return np.arange(self.size)
+            return np.flatnonzero(np.unpackbits(bits, count=self.size))
+
+        candidates = [self.range_ids(column, *bounds) for column, bounds in ranges]
+        driver = min(range(len(ranges)), key=lambda i: len(candidates[i]))
+        ids = candidates[driver]
+
+        if len(ids) > self.size * SPARSE_DRIVER_FRACTION:
+            hits = np.ones(self.size, dtype=bool) if bits is None else \
+                np.unpackbits(bits, count=self.size).view(bool)
+            for column, (low, high) in ranges:
+                values = self._values[column]
+                hits &= (values >= low) & (values <= high)
+            return np.flatnonzero(hits)
+
+        for i, (column, (low, high)) in enumerate(ranges):
+            if i != driver:
+                values = self._values[column][ids]
+                ids = ids[(values >= low) & (values <= high)]
+
+        if bits is not None:
+            ids = ids[(bits[ids >> 3] >> (7 - (ids & 7)).astype(np.uint8)) & 1 == 1]
+
+        if len(ids) > self.size * DENSE_RESULT_FRACTION:
+            hits = np.zeros(self.size, dtype=bool)
+            hits[ids] = True
+            return np.flatnonzero(hits)
+        return np.sort(ids)
+
+
+class SharedPatientFilterIndex:
+    """The filter index of one store, shared by every session and kept current on read
+
+    Writes are applied to the previous index by `PatientFilterIndex.refreshed`
+    rather than rebuilding it from a full scan, so an edit costs the next
+    reader an in-memory re-sort instead of a table scan.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._index = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        with self._lock:
+            if self._index is None:
+                self._index = PatientFilterIndex.from_store(self.store)
+            else:
+                self._index = self._index.refreshed(self.store)
+            return self._index
@@ -0,0 +1,326 @@
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import date
+
+import numpy as np
+
+from utils.aggregates import RISK_FACTOR_COLUMNS, CohortAggregates, CovarianceAccumulator
+
+DEFAULT_DB_PATH = os.environ.get("DR_PATIENT_DB", os.path.join("data", "patients.db"))
+DEFAULT_COHORT_SIZE = int(os.environ.get("DR_COHORT_SIZE", "200"))
+
+PATIENT_COLUMNS = [
+    'patient_id', 'name', 'age', 'gender', 'diabetes_type', 'diabetes_duration', 'hba1c',
+    'bp_systolic', 'bp_diastolic', 'dr_stage', 'last_screening', 'next_appointment', 'risk_score'
+]
+SELECTABLE_COLUMNS = frozenset(PATIENT_COLUMNS + ['rowid'])
+DATE_COLUMNS = ['last_screening', 'next_appointment']
+INDEXED_COLUMNS = ['dr_stage', 'age', 'hba1c', 'next_appointment', 'last_screening']
+SCAN_CHUNK_ROWS = 50_000
+# Writes remembered by rowid, so indexes built from the store can catch up without a rescan
+CHANGE_LOG_SIZE = 4096
+# What the Dashboard's upcoming appointments table shows
+UPCOMING_COLUMNS = ['next_appointment', 'patient_id', 'name', 'dr_stage', 'risk_score']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    name TEXT,
+    age INTEGER,
+    gender TEXT,
+    diabetes_type TEXT,
+    diabetes_duration INTEGER,
+    hba1c REAL,
+    bp_systolic INTEGER,
+    bp_diastolic INTEGER,
+    dr_stage INTEGER,
+    last_screening TEXT,
+    next_appointment TEXT,
+    risk_score REAL
+);
+CREATE TABLE IF NOT EXISTS cohort_aggregates (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    state TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class PatientStore:
+    """SQLite-backed patient store shared by every section of the app
+
+    The connection is opened once per process and guarded by a lock, so it
+    can be handed out through `st.cache_resource` to all sessions. Every
+    view reads through indexed queries instead of regenerating a cohort.
+    Quick Stats aggregates and the risk-factor covariance are persisted
+    next to the rows and updated in the same transaction as every write,
+    which re-reads them under SQLite's write lock first, so processes
+    sharing the database file never overwrite each other's updates. The
+    version counter lives in the same row, and reads reload both when
+    `PRAGMA data_version` shows another connection has committed.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # `(version, rowid)` of this process's recent writes; a rowid of `None` marks a bulk load
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                columns = [row[1] for row in self._conn.execute("PRAGMA table_info(cohort_aggregates)")]
+                if "version" not in columns:
+                    self._conn.execute("ALTER TABLE cohort_aggregates ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+                for column in INDEXED_COLUMNS:
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_patients_{column} ON patients ({column})")
+                self.aggregates = self._load_aggregates()
+                self._version = self._conn.execute("SELECT version FROM cohort_aggregates WHERE id = 1").fetchone()[0]
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    @property
+    def version(self):
+        """Bumped on every write from any process, so indexes built from the store can tell they are stale"""
+        with self._lock:
+            self._refresh()
+            return self._version
+
+    def ensure_cohort(self, count=DEFAULT_COHORT_SIZE, seed=0):
+        """Populate an empty store with a synthetic cohort"""
+        if self.count() == 0:
+            # Only a fresh database needs the generator and its Faker dependency
+            from utils.helpers import generate_sample_patients
+
+            self.load_patients(generate_sample_patients(count, seed=seed))
+
+    def load_patients(self, patients_df):
+        """Bulk insert new patient rows shaped like `generate_sample_patients` output"""
+        rows = patients_df[PATIENT_COLUMNS].astype({column: str for column in DATE_COLUMNS})
+        placeholders = ", ".join("?" for _ in PATIENT_COLUMNS)
+
+        with self._lock, self._conn:
+            self._begin_write()
+            self._conn.executemany(
+                f"INSERT INTO patients ({', '.join(PATIENT_COLUMNS)}) VALUES ({placeholders})",
+                rows.itertuples(index=False, name=None)
+            )
+            self.aggregates.merge(CohortAggregates.from_columns(patients_df))
+            self._save_aggregates()
+            self._changes.append((self._version, None))
+
+    def upsert_patient(self, patient):
+        """Add or change one patient, updating the aggregates in O(1)
+
+        A changed patient keeps its rowid, so indexes built from the store
+        can apply the change in place.
+        """
+        # NumPy scalars from a DataFrame row would otherwise be stored as BLOBs
+        record = {column: patient[column].item() if isinstance(patient[column], np.generic) else patient[column]
+                  for column in PATIENT_COLUMNS}
+        for column in DATE_COLUMNS:
+            record[column] = str(record[column])
+
+        with self._lock, self._conn:
+            self._begin_write()
+            previous = self._conn.execute(f"SELECT {', '.join(RISK_FACTOR_COLUMNS)} FROM patients "
+                                          f"WHERE patient_id = ?", (record['patient_id'],)).fetchone()
+            self._conn.execute(
+                f"INSERT INTO patients ({', '.join(PATIENT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in PATIENT_COLUMNS)}) "
+                f"ON CONFLICT (patient_id) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in PATIENT_COLUMNS[1:])}",
+                list(record.values())
+            )
+            rowid = self._conn.execute("SELECT rowid FROM patients WHERE patient_id = ?",
+                                       (record['patient_id'],)).fetchone()[0]
+
+            if previous is None:
+                self.aggregates.add(record)
+            else:
+                self.aggregates.replace(dict(zip(RISK_FACTOR_COLUMNS, previous)), record)
+            self._save_aggregates()
+            self._changes.append((self._version, rowid))
+
+    def changes_since(self, version):
+        """The current version and the rowids written after `version`, or `None` for them if unknown
+
+        Rowids are only known while every write since `version` is still
+        in the change log and none of them was a bulk load.
+        """
+        with self._lock:
+            self._refresh()
+            # Writes from other processes leave gaps in this process's log
+            changes = [(changed, rowid) for changed, rowid in self._changes if changed > version]
+            if len(changes) != self._version - version or any(rowid is None for _, rowid in changes):
+                return self._version, None
+            return self._version, sorted({rowid for _, rowid in changes})
+
+    def quick_stats(self):
+        """Sidebar stats read from the running aggregates, independent of cohort size"""
+        with self._lock:
+            self._refresh()
+            return self.aggregates.quick_stats()
+
+    def correlation(self, columns):
+        """Pearson correlation of risk-factor `columns` across the whole cohort, in O(k²)"""
+        with self._lock:
+            self._refresh()
+            return self.aggregates.covariance.correlation(columns)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+
+    def sample(self, count, columns=None, seed=None):
+        """Return up to `count` random patients using rowid lookups, not a table scan"""
+        with self._lock:
+            max_rowid = self._conn.execute("SELECT MAX(rowid) FROM patients").fetchone()[0] or 0
+
+        rowids = np.random.default_rng(seed).choice(max_rowid, min(count, max_rowid), replace=False) + 1
+        placeholders = ", ".join("?" for _ in rowids)
+
+        return self._read(f"SELECT {self._select(columns)} FROM patients WHERE rowid IN ({placeholders})",
+                          [int(rowid) for rowid in rowids])
+
+    def column_chunks(self, columns, chunk_rows=SCAN_CHUNK_ROWS):
+        """Yield whole columns as dicts of NumPy arrays, `chunk_rows` rows at a time, in rowid order
+
+        Each chunk is one rowid range query, and the lock is only held
+        while it runs, so other sessions' reads and writes interleave with
+        a long scan. Rows written during the scan may or may not be seen;
+        read `version` first and catch up with `changes_since`.
+        """
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(f"SELECT rowid, {self._select(columns)} FROM patients WHERE rowid > ? "
+                                          f"ORDER BY rowid LIMIT ?", (last_rowid, chunk_rows)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield {column: np.array(values) for column, values in zip(columns, list(zip(*rows))[1:])}
+
+    def value_counts(self, column):
+        """Distinct values of `column`, ascending, and the number of patients with each, counted in SQL"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {self._select([column])}, COUNT(*) FROM patients "
+                                      f"GROUP BY {column} ORDER BY {column}").fetchall()
+
+        if not rows:
+            return np.array([]), np.array([], dtype=np.int64)
+        values, counts = zip(*rows)
+        return np.array(values), np.array(counts, dtype=np.int64)
+
+    def fetch_rowids(self, rowids, columns=None):
+        """Return the patients with the given rowids, in rowid order"""
+        placeholders = ", ".join("?" for _ in rowids)
+        return self._read(f"SELECT {self._select(columns)} FROM patients "
+                          f"WHERE rowid IN ({placeholders}) ORDER BY rowid", [int(rowid) for rowid in rowids])
+
+    def get_patient(self, patient_id):
+        df = self._read("SELECT * FROM patients WHERE patient_id = ?", (patient_id,))
+        return df.iloc[0] if not df.empty else None
+
+    def upcoming_appointments(self, limit=10, columns=UPCOMING_COLUMNS):
+        """The `limit` soonest appointments from today on, read in order from the `next_appointment` index"""
+        return self._read(f"SELECT {self._select(columns)} FROM patients "
+                          f"WHERE next_appointment >= ? ORDER BY next_appointment LIMIT ?",
+                          (date.today().isoformat(), limit))
+
+    def summary(self):
+        """Cohort-wide aggregates used by the Analytics overview"""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT AVG(hba1c), SUM(dr_stage >= 2), AVG(diabetes_duration), SUM(risk_score > 70)
+                FROM patients
+            """).fetchone()
+
+        return {
+            "avg_hba1c": row[0] or 0.0,
+            "progression_cases": row[1] or 0,
+            "avg_duration": row[2] or 0.0,
+            "high_risk_patients": row[3] or 0
+        }
+
+    def _load_aggregates(self):
+        row = self._conn.execute("SELECT state FROM cohort_aggregates WHERE id = 1").fetchone()
+        if row is not None:
+            aggregates = CohortAggregates.from_json(row[0])
+            if aggregates.covariance is None:
+                # Saved before the covariance was tracked: build it with one chunked scan
+                aggregates.covariance = CovarianceAccumulator.from_chunks(self._scan_chunks(RISK_FACTOR_COLUMNS))
+                self._conn.execute("UPDATE cohort_aggregates SET state = ? WHERE id = 1", (aggregates.to_json(),))
+            return aggregates
+
+        # First open of a store written without aggregates: build them with one scan
+        count, hba1c_sum = self._conn.execute("SELECT COUNT(*), TOTAL(hba1c) FROM patients").fetchone()
+        stage_counts = CohortAggregates().stage_counts
+        for stage, stage_count in self._conn.execute("SELECT dr_stage, COUNT(*) FROM patients GROUP BY dr_stage"):
+            stage_counts[stage] = stage_count
+
+        aggregates = CohortAggregates(count, hba1c_sum, stage_counts,
+                                      CovarianceAccumulator.from_chunks(self._scan_chunks(RISK_FACTOR_COLUMNS)))
+        self._conn.execute("INSERT INTO cohort_aggregates (id, state) VALUES (1, ?)", (aggregates.to_json(),))
+        return aggregates
+
+    def _refresh(self):
+        # Callers hold the lock. data_version only moves when another connection commits
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._read_aggregates()
+
+    def _read_aggregates(self):
+        state, self._version = self._conn.execute("SELECT state, version FROM cohort_aggregates "
+                                                  "WHERE id = 1").fetchone()
+        self.aggregates = CohortAggregates.from_json(state)
+
+    def _begin_write(self):
+        # Callers hold the lock. Takes SQLite's write lock, then starts from the committed aggregates
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._read_aggregates()
+
+    def _save_aggregates(self):
+        self._conn.execute("UPDATE cohort_aggregates SET state = ?, version = version + 1 WHERE id = 1",
+                           (self.aggregates.to_json(),))
+        self._version += 1
+
+    def _scan_chunks(self, columns, chunk_rows=SCAN_CHUNK_ROWS):
+        # Callers hold the lock
+        cursor = self._conn.execute(f"SELECT {self._select(columns)} FROM patients ORDER BY rowid")
+        while rows := cursor.fetchmany(chunk_rows):
+            yield {column: np.array(values) for column, values in zip(columns, zip(*rows))}
+
+    @staticmethod
+    def _select(columns):
+        """The SELECT list for `columns` (every patient column by default)
+
+        Column names cannot be bound as SQL parameters, so they are
+        checked against the schema before being formatted into a query.
+        """
+        if not columns:
+            return ", ".join(PATIENT_COLUMNS)
+        unknown = [column for column in columns if column not in SELECTABLE_COLUMNS]
+        if unknown:
+            raise ValueError(f"unknown patient columns: {', '.join(map(str, unknown))}")
+        return ", ".join(columns)
+
+    def _read(self, sql, params=()):
+        # The sidebar only needs aggregates, so pandas loads with the first page that reads rows
+        import pandas as pd
+
+        with self._lock:
+            df = pd.read_sql_query(sql, self._conn, params=params)
+
+        for column in DATE_COLUMNS:
+            if column in df:
+                df[column] = pd.to_datetime(df[column]).dt.date
+
+        return df
@@ -0,0 +1,175 @@
+"""Opt-in sampling profiler for app reruns, exported as flame graphs
+
+While a rerun is profiled, a background thread samples the script
+thread's Python stack every `DEFAULT_INTERVAL` seconds with
+`sys._current_frames()`. Stacks are trimmed to start at the app's own
+entry frame, so time is attributed to `main`, the sidebar stats and
+each section function rather than to Streamlit's runtime. Each rerun is
+written twice under `DEFAULT_PROFILE_DIR`: as collapsed stacks
+(`.folded`, for flamegraph.pl, inferno or speedscope) and as a
+speedscope JSON profile. Sampling never instruments the profiled code,
+so overhead stays flat however many calls a rerun makes.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+DEFAULT_PROFILE_DIR = os.environ.get("DR_PROFILE_DIR", os.path.join("data", "profiles"))
+# Seconds between stack samples
+DEFAULT_INTERVAL = float(os.environ.get("DR_PROFILE_INTERVAL", "0.005"))
+# Oldest profiles are deleted once the directory holds more reruns than this
+MAX_PROFILES = 200
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+def profiling_enabled():
+    """Whether the `DR_PROFILE` environment variable asks for every rerun to be profiled"""
+    return os.environ.get("DR_PROFILE", "").lower() in ("1", "true", "yes", "on")
+
+
+class RerunProfiler:
+    """Samples one thread's stack for the duration of a `with` block
+
+    `root_file` is the script whose outermost frame becomes the root of
+    every stack; frames above it are dropped. `label` names the output
+    files and may be set inside the block, once the section is known.
+    """
+
+    def __init__(self, label="rerun", root_file=None, interval=DEFAULT_INTERVAL, output_dir=DEFAULT_PROFILE_DIR):
+        self.label = label
+        self.root_file = os.path.abspath(root_file) if root_file else None
+        self.interval = interval
+        self.output_dir = output_dir
+        self.stacks = {}
+        self.paths = []
+        self._samples = []
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started = 0.0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name="rerun-profiler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        # Runs on Streamlit's rerun and stop exceptions too, so those reruns still get a profile
+        self._stop.set()
+        self._sampler.join()
+        self.elapsed = time.perf_counter() - self._started
+        try:
+            self.write()
+        except OSError:
+            # Profiling must never break a page render
+            pass
+        return False
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def _sample(self, weight):
+        frame = sys._current_frames().get(self._thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+
+        if self.root_file is not None:
+            for depth, (_, filename, _) in enumerate(stack):
+                if os.path.abspath(filename) == self.root_file:
+                    stack = stack[depth:]
+                    break
+            else:
+                # The script is not running yet, or already unwound
+                return
+
+        stack = tuple(stack)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self._samples.append((stack, weight))
+
+    def collapsed(self):
+        """Collapsed stacks, one `root;caller;callee count` line per distinct stack"""
+        lines = [";".join(_frame_name(frame) for frame in stack) + f" {count}"
+                 for stack, count in sorted(self.stacks.items())]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def speedscope(self):
+        """The samples as a speedscope sampled profile, weighted by the real time between samples"""
+        indexes = {}
+        frames = []
+        samples = []
+        for stack, _ in self._samples:
+            sample = []
+            for frame in stack:
+                if frame not in indexes:
+                    indexes[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                sample.append(indexes[frame])
+            samples.append(sample)
+        weights = [weight for _, weight in self._samples]
+
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": self.label,
+            "exporter": "diabetic-retinopathy profiling",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.label,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+
+    def write(self):
+        """Write the `.folded` and `.speedscope.json` files for this rerun and return their paths"""
+        if not self._samples:
+            return []
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime()) + f"-{int(time.time() * 1000) % 1000:03d}"
+        slug = re.sub(r"[^a-z0-9]+", "-", self.label.lower()).strip("-") or "rerun"
+        base = os.path.join(self.output_dir, f"{stamp}-{threading.get_ident()}-{slug}")
+
+        with open(f"{base}.folded", "w", encoding="utf-8") as handle:
+            handle.write(self.collapsed())
+        with open(f"{base}.speedscope.json", "w", encoding="utf-8") as handle:
+            json.dump(self.speedscope(), handle)
+        self.paths = [f"{base}.folded", f"{base}.speedscope.json"]
+
+        prune_profiles(self.output_dir)
+        return self.paths
+
+
+def prune_profiles(output_dir=DEFAULT_PROFILE_DIR, keep=MAX_PROFILES):
+    """Delete all but the newest `keep` reruns' files from `output_dir`"""
+    folded = sorted(name for name in os.listdir(output_dir) if name.endswith(".folded"))
+    for name in folded[:-keep]:
+        base = name[:-len(".folded")]
+        for path in (f"{base}.folded", f"{base}.speedscope.json"):
+            try:
+                os.remove(os.path.join(output_dir, path))
+            except OSError:
+                pass
+
+
+def _frame_name(frame):
+    name, filename, line = frame
+    # Semicolons separate frames in the collapsed format
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ",")
@@ -0,0 +1,208 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from utils.analysis_result import AnalysisResult
+from utils.dr_engine import ANALYSIS_VERSION
+from utils.image_io import ANALYSIS_MAX_SIDE
+
+DEFAULT_CACHE_DIR = os.environ.get("DR_ANALYSIS_CACHE_DIR", os.path.join("data", "analysis_cache"))
+DEFAULT_MEMORY_ENTRIES = int(os.environ.get("DR_ANALYSIS_CACHE_ENTRIES", "256"))
+DEFAULT_DISK_BYTES = int(os.environ.get("DR_ANALYSIS_CACHE_BYTES", str(512 * 1024 * 1024)))
+# Entries are `AnalysisResult.to_bytes` payloads; files written by older versions as pickles are removed
+ENTRY_SUFFIX = ".dra"
+LEGACY_SUFFIX = ".pkl"
+
+
+def analysis_key(image_bytes, version=ANALYSIS_VERSION, max_side=ANALYSIS_MAX_SIDE):
+    """Content address of an analysis: the image bytes, the pipeline version and the decode resolution"""
+    digest = hashlib.sha256(f"{version}:{max_side}:".encode())
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """Two-tier cache of analysis results keyed by `analysis_key`
+
+    A bounded in-memory LRU serves repeat requests within the process; an
+    on-disk tier survives restarts and is shared by every process pointed
+    at the same directory. The disk tier evicts least recently used files
+    once it grows past `max_disk_bytes`. Entries are stored in the
+    `AnalysisResult` binary format rather than pickled, so a file placed
+    in the directory can at worst be a corrupt entry, never code.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MEMORY_ENTRIES,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Held by the one thread scanning the directory for eviction, never together with `_lock`
+        self._evict_lock = threading.Lock()
+        for path in self._disk_files(LEGACY_SUFFIX):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._disk_bytes = sum(_file_size(path) for path in self._disk_files())
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cache_file:
+                result = AnalysisResult.from_bytes(cache_file.read())
+            os.utime(path)
+        except OSError:
+            return None
+        except (ValueError, IndexError, struct.error):
+            # A corrupt entry, or one written by an incompatible version, counts as a miss and is dropped
+            self._discard(path)
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._remember(key, result)
+
+        payload = result.to_bytes()
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write then rename so concurrent readers never see a partial file
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(handle, "wb") as cache_file:
+                cache_file.write(payload)
+            replaced = _file_size(path)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            self._disk_bytes += len(payload) - replaced
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached result for `key`, computing and storing it on a miss"""
+        result = self.get(key)
+        if result is not None:
+            return result
+
+        start = time.perf_counter()
+        result = compute()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+        self.put(key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "avg_miss_latency_s": self.miss_seconds / self.misses if self.misses else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes
+            }
+
+    def _remember(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _discard(self, path):
+        size = _file_size(path)
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}{ENTRY_SUFFIX}")
+
+    def _disk_files(self, suffix=ENTRY_SUFFIX):
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if filename.endswith(suffix):
+                    yield os.path.join(root, filename)
+
+    def _evict_disk(self):
+        """Delete least recently used files until the disk tier is back under 90% of its budget
+
+        The directory is scanned without holding `_lock`, so lookups and
+        puts carry on meanwhile; only one thread evicts at a time. The
+        byte count is reset from the scan, which also picks up files
+        written or removed by other processes.
+        """
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            for path in self._disk_files():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            disk_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if disk_bytes <= self.max_disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                disk_bytes -= size
+
+            with self._lock:
+                self._disk_bytes = disk_bytes
+        finally:
+            self._evict_lock.release()
+
+
+def _file_size(path):
+    """Size of `path` in bytes, or 0 if it does not exist"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from utils.analysis_result import LOCATION_DTYPE, TIMING_STAGES, AnalysisResult
+
+
+@pytest.fixture
+def analysis_result():
+    """A result with lesions of several types, risk flags and macular involvement"""
+    locations = np.array([(120, 340, 0), (512, 480, 0), (700, 90, 1), (256, 256, 2), (1023, 4, 3)],
+                         dtype=LOCATION_DTYPE)
+    return AnalysisResult(
+        severity_score=3, confidence=0.87, processing_time=1.25, progression_risk=0.42, risk_flags=0b101,
+        quality_score=0.91, quality_factors=(0.9, 0.8, 0.75, 0.05), quality_grade="Good", locations=locations,
+        microaneurysm_density=0.013, hemorrhage_size_variance=4.5, exudate_intensity=0.62,
+        macular_involvement=True, cotton_wool_distribution="clustered",
+        stage_timings=tuple(0.01 * (i + 1) for i in range(len(TIMING_STAGES)))
+    )
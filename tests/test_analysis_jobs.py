@@ -0,0 +1,58 @@
+import threading
+import time
+
+from utils.analysis_jobs import AnalysisJobManager
+
+
+# Anything but bytes or a path is taken as an already decoded image
+IMAGE = ("decoded", "image")
+
+
+def gated_analysis(gate):
+    def analyze(image, progress):
+        progress("quality")
+        gate.wait(5)
+        progress("detection")
+        progress("scoring")
+        return {"image": image}
+
+    return analyze
+
+
+def test_wait_returns_on_each_change_and_at_completion():
+    gate = threading.Event()
+    jobs = AnalysisJobManager(gated_analysis(gate), workers=1)
+    job = jobs.get(jobs.submit(IMAGE))
+
+    versions = [job["version"]]
+    while job["status"] not in ("done", "failed"):
+        if job["stage"] == "quality":
+            gate.set()
+        job = jobs.wait(job["id"], since=job["version"], timeout=5)
+        versions.append(job["version"])
+
+    assert versions == sorted(set(versions))
+    assert job["result"] == {"image": IMAGE}
+    jobs.shutdown()
+
+
+def test_wait_times_out_without_a_change():
+    gate = threading.Event()
+    jobs = AnalysisJobManager(gated_analysis(gate), workers=1)
+    job_id = jobs.submit(IMAGE)
+    while jobs.get(job_id)["stage"] != "quality":
+        time.sleep(0.01)
+    job = jobs.get(job_id)
+
+    start = time.perf_counter()
+    assert jobs.wait(job_id, since=job["version"], timeout=0.1)["version"] == job["version"]
+    assert 0.1 <= time.perf_counter() - start < 1
+
+    gate.set()
+    jobs.shutdown()
+
+
+def test_wait_on_unknown_job_returns_none():
+    jobs = AnalysisJobManager(lambda image, progress: image, workers=1)
+    assert jobs.wait("missing", since=0, timeout=0.1) is None
+    jobs.shutdown()
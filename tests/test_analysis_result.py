@@ -0,0 +1,35 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from utils.analysis_result import AnalysisResult
+from utils.dr_engine import DRAnalysisEngine
+
+
+def assert_same_result(actual, expected):
+    for field in AnalysisResult.__slots__:
+        if field == "locations":
+            assert actual.locations.dtype == expected.locations.dtype
+            np.testing.assert_array_equal(actual.locations, expected.locations)
+        else:
+            assert getattr(actual, field) == pytest.approx(getattr(expected, field)), field
+    assert actual.to_dict() == expected.to_dict()
+
+
+@pytest.mark.parametrize("round_trip", [
+    lambda result: AnalysisResult.from_bytes(result.to_bytes()),
+    lambda result: pickle.loads(pickle.dumps(result)),
+], ids=["bytes", "pickle"])
+def test_round_trip_keeps_every_field(analysis_result, round_trip):
+    restored = round_trip(analysis_result)
+
+    assert_same_result(restored, analysis_result)
+    assert restored.risk_flags == 0b101 and restored.macular_involvement is True
+    assert restored.lesion_counts == {"microaneurysms": 2, "hemorrhages": 1, "exudates": 1, "cotton_wool_spots": 1}
+    assert "Macular edema assessment required" in restored.recommendations
+
+
+def test_recommendations_match_the_engine(analysis_result):
+    assert analysis_result.recommendations == DRAnalysisEngine().generate_comprehensive_recommendations(
+        analysis_result.severity_score, analysis_result.features)
@@ -0,0 +1,32 @@
+from datetime import date
+
+import numpy as np
+
+from components.charts import CORRELATION_COLUMNS, SCATTER_COLUMNS, create_demographics_summary_charts, \
+    create_patient_demographics_chart
+from utils.helpers import generate_sample_patients
+from utils.patient_store import PatientStore
+
+
+def test_store_summary_charts_match_in_memory_aggregation():
+    patients_df = generate_sample_patients(5_000, seed=4, reference_date=date(2026, 1, 1))
+    store = PatientStore(":memory:")
+    store.load_patients(patients_df)
+    quick_stats = store.quick_stats()
+
+    from_store = create_demographics_summary_charts(store.value_counts('age'), quick_stats['stage_counts'],
+                                                    store.sample(500, columns=SCATTER_COLUMNS, seed=0),
+                                                    quick_stats['total_patients'],
+                                                    store.correlation(CORRELATION_COLUMNS))
+    in_memory = create_patient_demographics_chart(patients_df, aggregate=True, max_points=500)
+
+    expected_counts, expected_edges = np.histogram(patients_df['age'], bins=15)
+    for age, stages in ((from_store[0], from_store[1]), (in_memory[0], in_memory[1])):
+        np.testing.assert_array_equal(age.data[0].y, expected_counts)
+        np.testing.assert_allclose(age.data[0].x, (expected_edges[:-1] + expected_edges[1:]) / 2)
+        assert list(stages.data[0].values) == patients_df['dr_stage'].value_counts().sort_index().tolist()
+
+    assert len(from_store[2].data[0].x) == 500
+    assert "500 of 5,000 patients sampled" in from_store[2].layout.title.text
+    np.testing.assert_allclose(from_store[3].data[0].z, patients_df[CORRELATION_COLUMNS].corr().to_numpy(),
+                               atol=1e-9)
@@ -0,0 +1,36 @@
+from utils.chat_history import SPILL_PAGE_SIZE, ChatHistory
+
+
+def fill(history, count):
+    for number in range(count):
+        history.append("user", f"message {number}")
+    return history
+
+
+def messages(history):
+    return [chat["message"] for chat in history.window(0, len(history))]
+
+
+def test_unbounded_archive_keeps_every_message():
+    history = fill(ChatHistory(capacity=10, max_pages=None), 1_000)
+    assert messages(history) == [f"message {number}" for number in range(1_000)]
+    assert history.discarded == 0
+
+
+def test_archive_drops_the_oldest_pages_beyond_its_cap():
+    history = fill(ChatHistory(capacity=10, max_pages=3), 1_000)
+
+    # 990 messages spilled: 19 full pages, of which the newest 3 are kept, plus 40 in the open page
+    assert history.discarded == 16 * SPILL_PAGE_SIZE
+    assert len(history) == 1_000 - history.discarded
+    assert messages(history) == [f"message {number}" for number in range(history.discarded, 1_000)]
+    assert history.archived_bytes < 3 * 1024
+
+
+def test_pages_count_back_from_the_newest_message_after_a_drop():
+    history = fill(ChatHistory(capacity=10, max_pages=2), 500)
+    newest = [chat["message"] for chat in history.page(0, 20)]
+    oldest = [chat["message"] for chat in history.page(history.page_count(20) - 1, 20)]
+
+    assert newest == [f"message {number}" for number in range(480, 500)]
+    assert oldest[0] == f"message {history.discarded}"
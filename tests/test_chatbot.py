@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.chatbot import CONTEXT_KEYWORDS, DRChatbot, IntentMatcher, keyword_inflections
+
+# Inputs the old substring scan got wrong, or that must keep their intent, and the intent each should match
+INTENT_CASES = {
+    "What are the early symptoms of diabetic retinopathy?": "symptoms",
+    "How often should I get screened for DR?": "screening",
+    "What are the different stages of diabetic retinopathy?": "stages",
+    "How can I prevent diabetic retinopathy?": "prevention",
+    "What treatments are available for severe DR?": "treatment",
+    "What are the main risk factors for developing DR?": "risk_factors",
+    "Hi, what are the symptoms?": "symptoms",
+    "hello": "greeting",
+    "Is this serious?": None,
+    "My stopwatch broke": None,
+    "Is it curable?": "treatment",
+    "My eyes are blurry": "symptoms",
+    "What causes it?": "risk_factors",
+    "What therapies exist?": "treatment",
+}
+
+
+@pytest.mark.parametrize("text, expected", INTENT_CASES.items())
+def test_intent_regression_cases(text, expected):
+    assert IntentMatcher(CONTEXT_KEYWORDS).match(text) == expected
+
+
+def test_consonant_y_keywords_inflect_through_i():
+    forms = keyword_inflections("therapy")
+    assert {"therapy", "therapies", "therapied"} <= forms
+    assert not {"therapys", "therapyies", "therapyy", "therapyes"} & forms
+
+
+@pytest.mark.parametrize("keyword, form", [
+    ("treat", "treatments"), ("screen", "screening"), ("cure", "curing"), ("stage", "staging"),
+    ("blur", "blurred"), ("blur", "blurry"), ("stop", "stopping"), ("delay", "delays"),
+])
+def test_keyword_inflections(keyword, form):
+    assert form in keyword_inflections(keyword)
+
+
+def test_short_keywords_match_whole_words_only():
+    assert keyword_inflections("hi") == {"hi"}
+
+
+def test_shared_chatbot_answers_concurrently(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chatbot = DRChatbot()
+    questions = list(INTENT_CASES) * 20
+    expected = [chatbot.intent_matcher.match(question) for question in questions]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        matched = list(pool.map(chatbot.intent_matcher.match, questions))
+        answers = list(pool.map(chatbot.get_response, questions))
+
+    assert matched == expected
+    assert all(answers)
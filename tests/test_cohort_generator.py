@@ -0,0 +1,64 @@
+import json
+import os
+from datetime import date
+
+import pandas as pd
+
+from utils.cohort_generator import MANIFEST_FILE, generate_cohort, read_manifest
+
+REFERENCE_DATE = date(2026, 1, 1)
+
+
+def part_files(directory):
+    return [open(os.path.join(directory, name), "rb").read()
+            for name in sorted(os.listdir(directory)) if name.endswith(".parquet")]
+
+
+def test_cohort_is_identical_for_any_worker_count(tmp_path):
+    for workers in (1, 2):
+        written = list(generate_cohort(str(tmp_path / f"workers_{workers}"), 2_500, seed=7, chunk_rows=1_000,
+                                       workers=workers, reference_date=REFERENCE_DATE))
+        assert sorted(rows for _, rows in written) == [500, 1_000, 1_000]
+
+    assert part_files(tmp_path / "workers_1") == part_files(tmp_path / "workers_2")
+    cohort = pd.read_parquet(tmp_path / "workers_1")
+    assert len(cohort) == 2_500 and cohort["patient_id"].is_unique
+
+
+def test_unchanged_manifest_reuses_the_files(tmp_path):
+    output_dir = str(tmp_path)
+    list(generate_cohort(output_dir, 1_500, seed=7, chunk_rows=1_000, workers=1, reference_date=REFERENCE_DATE))
+    modified = {name: os.stat(os.path.join(output_dir, name)).st_mtime_ns for name in os.listdir(output_dir)}
+
+    reused = list(generate_cohort(output_dir, 1_500, seed=7, chunk_rows=1_000, workers=1,
+                                  reference_date=REFERENCE_DATE))
+    assert [rows for _, rows in reused] == [1_000, 500]
+    assert {name: os.stat(os.path.join(output_dir, name)).st_mtime_ns for name in os.listdir(output_dir)} == modified
+    assert MANIFEST_FILE in modified
+
+
+def test_regeneration_removes_only_the_recorded_parts(tmp_path):
+    output_dir = str(tmp_path)
+    list(generate_cohort(output_dir, 2_500, seed=7, chunk_rows=1_000, workers=1, reference_date=REFERENCE_DATE))
+    (tmp_path / "part-notes.txt").write_text("kept")
+    (tmp_path / "README").write_text("kept")
+
+    list(generate_cohort(output_dir, 1_500, seed=8, chunk_rows=1_000, workers=1, reference_date=REFERENCE_DATE))
+
+    assert sorted(os.listdir(output_dir)) == sorted([MANIFEST_FILE, "README", "part-00000.parquet",
+                                                     "part-00001.parquet", "part-notes.txt"])
+    assert (tmp_path / "part-notes.txt").read_text() == "kept"
+
+
+def test_interrupted_run_is_not_reused(tmp_path):
+    output_dir = str(tmp_path)
+    list(generate_cohort(output_dir, 1_500, seed=7, chunk_rows=1_000, workers=1, reference_date=REFERENCE_DATE))
+    manifest = read_manifest(output_dir)
+    del manifest["complete"]
+    (tmp_path / MANIFEST_FILE).write_text(json.dumps(manifest))
+    os.utime(tmp_path / "part-00000.parquet", ns=(0, 0))
+
+    list(generate_cohort(output_dir, 1_500, seed=7, chunk_rows=1_000, workers=1, reference_date=REFERENCE_DATE))
+
+    assert os.stat(tmp_path / "part-00000.parquet").st_mtime_ns > 0
+    assert read_manifest(output_dir)["complete"]
@@ -0,0 +1,26 @@
+import numpy as np
+
+from utils.dr_engine import DRAnalysisEngine, LESION_TYPES, risk_assessment_from_flags, score_batch
+
+
+def test_score_batch_matches_scoring_one_record_at_a_time():
+    rng = np.random.default_rng(0)
+    count = 5_000
+    table = {lesion: rng.poisson(rng.uniform(0, high, count)) for lesion, high in
+             zip(LESION_TYPES, (40, 30, 20, 12))}
+    table["macular_involvement"] = rng.random(count) < 0.2
+
+    engine = DRAnalysisEngine()
+    severity, progression, risks = [], [], []
+    for i in range(count):
+        features = {lesion: {"count": int(table[lesion][i])} for lesion in LESION_TYPES}
+        features["exudates"]["macular_involvement"] = bool(table["macular_involvement"][i])
+        score = engine.calculate_enhanced_severity(features)
+        severity.append(score)
+        progression.append(engine.calculate_progression_risk(score, features))
+        risks.append(engine.assess_comprehensive_risk(features, score))
+
+    scores = score_batch(table)
+    assert scores["severity"].tolist() == severity
+    assert scores["progression_risk"].tolist() == progression
+    assert [risk_assessment_from_flags(flags) for flags in scores["risk_flags"]] == risks
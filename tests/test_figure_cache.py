@@ -0,0 +1,32 @@
+import json
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from utils.figure_cache import FigureCache
+
+
+def build_figure():
+    return go.Figure(go.Bar(x=["a", "b"], y=[1, 2], name="bars"), layout={"title": {"text": "Counts"}})
+
+
+def test_each_caller_gets_its_own_figure():
+    cache = FigureCache()
+    figure = cache.get("bars", build_figure)
+    expected = build_figure().to_dict()
+
+    figure.update_layout(height=100)
+    figure.add_trace(go.Scatter(x=[1], y=[1]))
+    figure.data[0].name = "changed"
+
+    assert figure.layout.height == 100
+    assert len(figure.to_dict()["data"]) == 2
+    again = cache.get("bars", build_figure)
+    assert again is not figure
+    assert again.to_dict() == expected
+    assert cache.stats()["hits"] == 1
+
+
+def test_cached_figure_serializes_like_the_original():
+    figure = FigureCache().get("bars", build_figure)
+    assert json.loads(pio.to_json(figure, validate=False)) == json.loads(pio.to_json(build_figure(), validate=False))
@@ -0,0 +1,22 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils import helpers
+from utils.helpers import generate_sample_patients
+
+REFERENCE_DATE = date(2026, 1, 1)
+
+
+def test_seeded_patients_leave_the_shared_faker_unseeded():
+    shared = helpers._get_faker()
+    state = shared.random.getstate()
+
+    first = generate_sample_patients(20, seed=7, reference_date=REFERENCE_DATE)
+    second = generate_sample_patients(20, seed=np.random.SeedSequence(7), reference_date=REFERENCE_DATE)
+
+    assert shared.random.getstate() == state
+    pd.testing.assert_frame_equal(first, generate_sample_patients(20, seed=7, reference_date=REFERENCE_DATE))
+    pd.testing.assert_frame_equal(second, generate_sample_patients(20, seed=np.random.SeedSequence(7),
+                                                                   reference_date=REFERENCE_DATE))
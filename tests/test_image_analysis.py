@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+import pytest
+
+from utils.image_analysis import assess_quality, detect_lesions, extract_features
+
+SIDE = 1024
+CENTER = (SIDE // 2, SIDE // 2)
+DISC_RADIUS = 480
+DISC_LEVEL = 140
+# Away from the centre and the rim, so they are neither macular nor edge artifacts
+MICROANEURYSMS = [(300, 300), (700, 300), (300, 700), (700, 700), (512, 250)]
+HEMORRHAGES = [(250, 512), (780, 512)]
+EXUDATES = [(512, 780), (420, 800)]
+LESION_KEYS = ("microaneurysms", "hemorrhages", "exudates", "cotton_wool_spots")
+
+
+def fundus(dots=True):
+    """A bright disc on black, optionally with dark dots, dark blobs and bright spots inside it"""
+    image = np.zeros((SIDE, SIDE), np.uint8)
+    cv2.circle(image, CENTER, DISC_RADIUS, DISC_LEVEL, -1)
+    if dots:
+        for center in MICROANEURYSMS:
+            cv2.circle(image, center, 2, 60, -1)
+        for center in HEMORRHAGES:
+            cv2.circle(image, center, 7, 60, -1)
+        for center in EXUDATES:
+            cv2.circle(image, center, 4, 230, -1)
+    return np.dstack([image // 2, image, image // 3])
+
+
+def found(lesions):
+    return {key: len(lesions[key]["areas"]) for key in LESION_KEYS}
+
+
+def test_dots_on_a_disc_are_found_where_they_are():
+    lesions, _ = detect_lesions(fundus())
+
+    assert found(lesions) == {"microaneurysms": len(MICROANEURYSMS), "hemorrhages": len(HEMORRHAGES),
+                              "exudates": len(EXUDATES), "cotton_wool_spots": 0}
+    for key, centers in (("microaneurysms", MICROANEURYSMS), ("hemorrhages", HEMORRHAGES),
+                         ("exudates", EXUDATES)):
+        assert sorted(map(tuple, np.round(lesions[key]["centroids"]).astype(int).tolist())) == sorted(centers)
+    np.testing.assert_allclose(lesions["fov_center"], CENTER, atol=2)
+    assert lesions["fov_radius"] == pytest.approx(DISC_RADIUS, rel=0.02)
+
+
+def test_tiling_finds_the_same_candidates():
+    whole, _ = detect_lesions(fundus())
+    tiled, _ = detect_lesions(fundus(), tile_size=300)
+
+    for key in LESION_KEYS:
+        np.testing.assert_allclose(np.sort(tiled[key]["centroids"], axis=0),
+                                   np.sort(whole[key]["centroids"], axis=0))
+
+
+@pytest.mark.parametrize("image", [np.zeros((SIDE, SIDE, 3), np.uint8), fundus(dots=False)],
+                         ids=["black frame", "featureless disc"])
+def test_blank_field_has_no_candidates(image):
+    lesions, _ = detect_lesions(image)
+    assert found(lesions) == dict.fromkeys(LESION_KEYS, 0)
+
+    features, _ = extract_features(image)
+    assert features["microaneurysms"]["count"] == features["exudates"]["count"] == 0
+    assert not features["exudates"]["macular_involvement"]
+
+
+def test_macular_involvement_follows_exudates_at_the_field_centre():
+    assert not extract_features(fundus())[0]["exudates"]["macular_involvement"]
+
+    image = fundus()
+    cv2.circle(image, CENTER, 4, (115, 230, 76), -1)
+    assert extract_features(image)[0]["exudates"]["macular_involvement"]
+
+
+def test_quality_of_a_blank_field_is_zero():
+    quality = assess_quality(np.zeros((SIDE, SIDE, 3), np.uint8))
+    assert quality["factors"] == {"focus": 0.0, "illumination": 0.0, "contrast": 0.0, "artifact_level": 1.0}
+    assert quality["score"] == 0.0
+
+
+def test_quality_drops_when_the_image_is_blurred():
+    sharp = assess_quality(fundus())
+    blurred = assess_quality(cv2.GaussianBlur(fundus(), (0, 0), 4))
+
+    assert 0 < blurred["factors"]["focus"] < sharp["factors"]["focus"]
+    assert sharp["factors"]["artifact_level"] == 0.0
+    assert sharp["factors"]["illumination"] == pytest.approx(1 - abs(DISC_LEVEL - 110) / 110, abs=0.02)
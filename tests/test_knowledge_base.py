@@ -0,0 +1,100 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from utils.chatbot import RESPONSES, DRChatbot, get_knowledge_index
+from utils.knowledge_base import KEEP_INDEXES, KnowledgeIndex, knowledge_documents
+
+QUESTION = "What treatments are available for severe DR?"
+# Per-query answer budget on the chat path
+ANSWER_BUDGET_SECONDS = 0.005
+
+
+@pytest.fixture
+def documents():
+    return knowledge_documents(RESPONSES)
+
+
+def test_knowledge_index_follows_the_responses(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    custom = {"treatment": ("Zebrafish photocoagulation is the custom reply.",)}
+
+    default_index = get_knowledge_index(RESPONSES)
+    custom_index = get_knowledge_index(custom)
+
+    assert custom_index is not default_index
+    assert get_knowledge_index(dict(custom)) is custom_index
+    assert "Zebrafish" in DRChatbot(responses=custom).get_response("Tell me about zebrafish photocoagulation")
+
+
+def test_saved_index_loads_and_leaves_no_temporary_files(tmp_path, documents):
+    built = KnowledgeIndex.build(documents)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda _: built.save(str(tmp_path)), range(8)))
+
+    assert os.listdir(tmp_path) == [built.fingerprint[:16]]
+    assert sorted(os.listdir(tmp_path / built.fingerprint[:16])) == [
+        "doc_ids.npy", "idf.npy", "index.json", "indptr.npy", "weights.npy"]
+    loaded = KnowledgeIndex.load(built.fingerprint, str(tmp_path))
+    assert loaded.fingerprint == built.fingerprint
+    assert loaded.answer(QUESTION) == built.answer(QUESTION) is not None
+
+
+@pytest.mark.parametrize("meta", [
+    {"documents": [], "vocabulary": {}},
+    {"fingerprint": "x", "documents": "not a list", "vocabulary": {}},
+    {"fingerprint": "x", "documents": [], "vocabulary": []},
+    [],
+])
+def test_stale_sidecar_is_rebuilt(tmp_path, documents, meta):
+    built = KnowledgeIndex.build(documents)
+    built.save(str(tmp_path))
+    fingerprint = built.fingerprint
+    (tmp_path / fingerprint[:16] / "index.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    assert KnowledgeIndex.load(fingerprint, str(tmp_path)) is None
+    assert KnowledgeIndex.open(documents, str(tmp_path)).answer(QUESTION) is not None
+    assert KnowledgeIndex.load(fingerprint, str(tmp_path)) is not None
+
+
+def test_arrays_from_another_index_are_rejected(tmp_path, documents):
+    built = KnowledgeIndex.build(documents)
+    built.save(str(tmp_path))
+    np.save(tmp_path / built.fingerprint[:16] / "indptr.npy", np.zeros(3, dtype=np.int64))
+
+    assert KnowledgeIndex.load(built.fingerprint, str(tmp_path)) is None
+
+
+def test_indexes_over_different_documents_coexist_and_old_ones_are_pruned(tmp_path, documents):
+    # The old flat layout is removed on the first save
+    (tmp_path / "index.json").write_text("{}", encoding="utf-8")
+    indexes = [KnowledgeIndex.build(documents[:len(documents) - skip]) for skip in range(KEEP_INDEXES + 1)]
+    for age, index in enumerate(reversed(indexes)):
+        index.save(str(tmp_path))
+        os.utime(tmp_path / index.fingerprint[:16] / "index.json", (age, age))
+
+    KnowledgeIndex.open(documents, str(tmp_path))
+
+    kept = indexes[:KEEP_INDEXES]
+    assert sorted(os.listdir(tmp_path)) == sorted(index.fingerprint[:16] for index in kept)
+    for index in kept:
+        assert KnowledgeIndex.load(index.fingerprint, str(tmp_path)).fingerprint == index.fingerprint
+
+
+def test_every_query_is_answered_within_budget(documents):
+    index = KnowledgeIndex.build(documents)
+    queries = [document["text"] for document in documents] + [
+        "What is the HbA1c target?", "When is urgent referral needed?", "Is vitrectomy used for PDR?"]
+
+    for query in queries:
+        # Best of a few runs, so a scheduler hiccup on a busy machine is not counted
+        seconds = []
+        for _ in range(5):
+            start = time.perf_counter()
+            index.answer(query)
+            seconds.append(time.perf_counter() - start)
+        assert min(seconds) < ANSWER_BUDGET_SECONDS, query
@@ -0,0 +1,102 @@
+import threading
+from datetime import date
+
+import numpy as np
+import pytest
+
+from utils.helpers import generate_sample_patients
+from utils.patient_filters import PatientFilterIndex
+from utils.patient_store import PatientStore
+
+
+@pytest.fixture(scope="module")
+def store():
+    store = PatientStore(":memory:")
+    store.load_patients(generate_sample_patients(2_000, seed=3, reference_date=date(2026, 1, 1)))
+    return store
+
+
+@pytest.fixture(scope="module")
+def patients_df(store):
+    df = store.fetch_rowids(range(1, store.count() + 1))
+    df.insert(0, "rowid", np.arange(1, len(df) + 1))
+    return df
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"age_range": (30, 70), "hba1c_range": (6.0, 9.0)},
+    {"age_range": (44, 45), "dr_stage": [3, 4]},
+    {"hba1c_range": (11.5, 12.0), "gender": ["Female"], "diabetes_type": ["Type 1"]},
+    {"dr_stage": [], "gender": ["Male"]},
+])
+@pytest.mark.parametrize("chunk_rows", [128, 50_000])
+def test_from_store_matches_boolean_masks(store, patients_df, filters, chunk_rows):
+    index = PatientFilterIndex.from_store(store, chunk_rows)
+
+    mask = np.ones(len(patients_df), dtype=bool)
+    for column, bounds in (("age", filters.get("age_range")), ("hba1c", filters.get("hba1c_range"))):
+        if bounds is not None:
+            mask &= patients_df[column].between(*bounds).to_numpy()
+    for column in ("dr_stage", "gender", "diabetes_type"):
+        if column in filters:
+            mask &= patients_df[column].isin(filters[column]).to_numpy()
+
+    np.testing.assert_array_equal(index.rowids[index.filter(**filters)], patients_df["rowid"][mask])
+
+
+
+FILTER_CASES = [
+    {"age_range": (30, 70), "hba1c_range": (6.0, 9.0)},
+    {"dr_stage": [3, 4], "gender": ["Other"]},
+    {"hba1c_range": (13.0, 14.0), "diabetes_type": ["Type 1"]},
+]
+
+
+def test_refreshed_applies_upserts_without_a_rescan(monkeypatch):
+    patients = generate_sample_patients(1_200, seed=5, reference_date=date(2026, 1, 1))
+    store = PatientStore(":memory:")
+    store.load_patients(patients.iloc[:1_000])
+    index = PatientFilterIndex.from_store(store, chunk_rows=256)
+
+    changed = patients.iloc[10].copy()
+    changed["age"], changed["hba1c"], changed["dr_stage"], changed["gender"] = 88, 13.5, 4, "Other"
+    store.upsert_patient(changed)
+    for _, patient in patients.iloc[1_000:1_010].iterrows():
+        store.upsert_patient(patient)
+
+    def rescan(*args, **kwargs):
+        raise AssertionError("refreshed rescanned the store")
+
+    monkeypatch.setattr(store, "column_chunks", rescan)
+    refreshed = index.refreshed(store)
+    monkeypatch.undo()
+
+    assert refreshed.version == store.version and index.version != store.version
+    rebuilt = PatientFilterIndex.from_store(store)
+    np.testing.assert_array_equal(refreshed.rowids, rebuilt.rowids)
+    for filters in FILTER_CASES:
+        np.testing.assert_array_equal(refreshed.rowids[refreshed.filter(**filters)],
+                                      rebuilt.rowids[rebuilt.filter(**filters)])
+    assert "Other" in refreshed.values("gender")
+    assert refreshed.refreshed(store) is refreshed
+
+
+def test_refreshed_rescans_after_a_bulk_load():
+    store = PatientStore(":memory:")
+    store.load_patients(generate_sample_patients(500, seed=6, reference_date=date(2026, 1, 1)))
+    index = PatientFilterIndex.from_store(store)
+    store.load_patients(generate_sample_patients(300, seed=7, reference_date=date(2026, 1, 1), start_index=500))
+
+    assert index.refreshed(store).size == 800
+
+
+def test_column_scan_releases_the_lock_between_chunks(store):
+    chunks = store.column_chunks(["age"], chunk_rows=100)
+    next(chunks)
+
+    reader = threading.Thread(target=store.count)
+    reader.start()
+    reader.join(timeout=5)
+    assert not reader.is_alive()
+    assert sum(len(chunk["age"]) for chunk in chunks) == store.count() - 100
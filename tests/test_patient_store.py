@@ -0,0 +1,130 @@
+import sqlite3
+from datetime import date
+
+import numpy as np
+import pytest
+
+from utils.aggregates import RISK_FACTOR_COLUMNS, CohortAggregates
+from utils.helpers import generate_sample_patients
+from utils.patient_store import PatientStore
+
+
+@pytest.fixture
+def store():
+    store = PatientStore(":memory:")
+    store.load_patients(generate_sample_patients(300, seed=0, reference_date=date(2026, 1, 1)))
+    return store
+
+
+def rebuilt_aggregates(store):
+    """Aggregates computed from scratch over every row in the store"""
+    chunks = list(store.column_chunks(RISK_FACTOR_COLUMNS))
+    return CohortAggregates.from_columns({column: np.concatenate([chunk[column] for chunk in chunks])
+                                          for column in RISK_FACTOR_COLUMNS})
+
+
+def assert_aggregates_match(store):
+    expected = rebuilt_aggregates(store)
+    stats = store.quick_stats()
+    assert stats["total_patients"] == expected.count
+    assert stats["high_risk"] == expected.high_risk
+    assert stats["stage_counts"] == expected.stage_counts
+    assert stats["avg_hba1c"] == pytest.approx(expected.avg_hba1c)
+    np.testing.assert_allclose(store.correlation(RISK_FACTOR_COLUMNS),
+                               expected.covariance.correlation(RISK_FACTOR_COLUMNS), atol=1e-9)
+
+
+def test_upsert_new_patient_updates_aggregates(store):
+    patient = store.get_patient("P10000").copy()
+    patient.update({"patient_id": "P99999", "age": 61, "hba1c": 11.2, "dr_stage": 4, "risk_score": 88.0})
+
+    store.upsert_patient(patient)
+
+    assert store.quick_stats()["total_patients"] == 301
+    assert_aggregates_match(store)
+
+
+def test_upsert_changed_patient_updates_aggregates(store):
+    patient = store.get_patient("P10042").copy()
+    patient.update({"hba1c": 12.0, "bp_systolic": 178, "dr_stage": 4, "risk_score": 91.5})
+
+    store.upsert_patient(patient)
+
+    assert store.quick_stats()["total_patients"] == 300
+    assert store.get_patient("P10042")["dr_stage"] == 4
+    assert_aggregates_match(store)
+
+
+def test_aggregates_survive_reopen(tmp_path):
+    path = str(tmp_path / "patients.db")
+    store = PatientStore(path)
+    store.ensure_cohort(100, seed=1)
+    patient = store.get_patient("P10007").copy()
+    patient["hba1c"] = 9.9
+    store.upsert_patient(patient)
+
+    reopened = PatientStore(path)
+    assert reopened.quick_stats() == store.quick_stats()
+    assert_aggregates_match(reopened)
+
+
+def test_stores_sharing_a_file_keep_each_others_writes(tmp_path):
+    path = str(tmp_path / "patients.db")
+    first = PatientStore(path)
+    first.ensure_cohort(100, seed=1)
+    second = PatientStore(path)
+    index_version = second.version
+
+    changed = first.get_patient("P10003").copy()
+    changed.update({"hba1c": 13.1, "dr_stage": 4})
+    first.upsert_patient(changed)
+    added = second.get_patient("P10004").copy()
+    added.update({"patient_id": "P99999", "dr_stage": 3})
+    second.upsert_patient(added)
+
+    assert first.version == second.version == index_version + 2
+    assert first.quick_stats() == second.quick_stats()
+    assert first.quick_stats()["total_patients"] == 101
+    assert_aggregates_match(first)
+    assert_aggregates_match(PatientStore(path))
+    # The second store never saw which row the first one changed, so an index must rescan
+    assert second.changes_since(index_version) == (index_version + 2, None)
+    assert first.changes_since(index_version + 1) == (index_version + 2, None)
+    assert second.changes_since(index_version + 1)[1] is not None
+
+
+def test_version_column_is_added_to_older_files(tmp_path):
+    path = str(tmp_path / "patients.db")
+    PatientStore(path).ensure_cohort(50, seed=2)
+    with sqlite3.connect(path) as conn:
+        conn.execute("ALTER TABLE cohort_aggregates DROP COLUMN version")
+
+    store = PatientStore(path)
+    version = store.version
+    store.upsert_patient(store.get_patient("P10001"))
+    assert store.version == version + 1
+
+
+def test_upcoming_appointments_are_the_soonest_from_today():
+    patients_df = generate_sample_patients(500, seed=2)
+    store = PatientStore(":memory:")
+    store.load_patients(patients_df)
+
+    upcoming = store.upcoming_appointments(10)
+
+    expected = sorted(day for day in patients_df['next_appointment'] if day >= date.today())[:10]
+    assert upcoming['next_appointment'].tolist() == expected
+
+
+def test_value_counts_matches_pandas(store):
+    values, counts = store.value_counts('age')
+    expected = store.fetch_rowids(range(1, 301))['age'].value_counts().sort_index()
+    assert values.tolist() == expected.index.tolist()
+    assert counts.tolist() == expected.tolist()
+
+
+def test_unknown_columns_are_rejected(store):
+    with pytest.raises(ValueError, match="unknown patient columns"):
+        store.value_counts("age); DROP TABLE patients; --")
+    with pytest.raises(ValueError, match="unknown patient columns"):
+        store.sample(5, columns=["name", "password"])
@@ -0,0 +1,113 @@
+import os
+import pickle
+
+import pytest
+
+from utils.result_cache import AnalysisCache, analysis_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnalysisCache(str(tmp_path), max_entries=4, max_disk_bytes=1024 * 1024)
+
+
+def write_entry(cache, key, payload):
+    path = cache._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as cache_file:
+        cache_file.write(payload)
+    return path
+
+
+def test_disk_hit_decodes_the_stored_result(cache, tmp_path, analysis_result):
+    key = analysis_key(b"image")
+    cache.put(key, analysis_result)
+
+    reopened = AnalysisCache(str(tmp_path))
+    result = reopened.get(key)
+    assert result.to_bytes() == analysis_result.to_bytes()
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_repeated_puts_of_one_key_are_counted_once(cache, analysis_result):
+    key = analysis_key(b"image")
+    for _ in range(3):
+        cache.put(key, analysis_result)
+
+    assert cache.stats()["disk_bytes"] == os.path.getsize(cache._path(key))
+
+
+@pytest.mark.parametrize("payload", [b"garbage" * 20, b"DRA1", b""])
+def test_corrupt_entries_are_misses_and_removed(cache, tmp_path, analysis_result, payload):
+    key = analysis_key(payload + b"image")
+    path = write_entry(cache, key, payload)
+
+    reopened = AnalysisCache(str(tmp_path))
+    assert reopened.get(key) is None
+    assert not os.path.exists(path)
+    assert reopened.stats()["disk_bytes"] == 0
+
+    assert reopened.get_or_compute(key, lambda: analysis_result) is analysis_result
+    assert reopened.stats()["misses"] == 1
+
+
+def test_truncated_entry_is_a_miss(cache, analysis_result):
+    key = analysis_key(b"truncated")
+    cache.put(key, analysis_result)
+    path = cache._path(key)
+    with open(path, "r+b") as cache_file:
+        cache_file.truncate(os.path.getsize(path) - 1)
+    cache._memory.clear()
+
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
+
+
+class Exploit:
+    def __reduce__(self):
+        return os.system, ("touch pwned",)
+
+
+def test_pickles_in_the_cache_directory_are_never_loaded(tmp_path, monkeypatch, analysis_result):
+    monkeypatch.chdir(tmp_path)
+    key = analysis_key(b"image")
+    legacy_path = os.path.join(str(tmp_path), key[:2], f"{key}.pkl")
+    os.makedirs(os.path.dirname(legacy_path))
+    with open(legacy_path, "wb") as cache_file:
+        pickle.dump(Exploit(), cache_file)
+
+    cache = AnalysisCache(str(tmp_path))
+    write_entry(cache, key, pickle.dumps(Exploit()))
+
+    assert cache.get(key) is None
+    assert not os.path.exists("pwned")
+    assert not os.path.exists(legacy_path)
+
+
+def test_key_depends_on_the_decode_resolution():
+    assert analysis_key(b"image", max_side=1024) != analysis_key(b"image", max_side=2048)
+
+
+def test_failed_write_leaves_no_temporary_file(cache, analysis_result, monkeypatch):
+    key = analysis_key(b"image")
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        cache.put(key, analysis_result)
+    monkeypatch.undo()
+
+    assert os.listdir(os.path.dirname(cache._path(key))) == []
+
+
+def test_eviction_keeps_the_disk_tier_under_budget(tmp_path, analysis_result):
+    entry_bytes = len(analysis_result.to_bytes())
+    cache = AnalysisCache(str(tmp_path), max_disk_bytes=entry_bytes * 10)
+    for number in range(25):
+        cache.put(analysis_key(str(number).encode()), analysis_result)
+
+    on_disk = sum(os.path.getsize(path) for path in cache._disk_files())
+    assert on_disk <= entry_bytes * 10
+    assert cache.stats()["disk_bytes"] == on_disk